@@ -33,7 +33,8 @@ setup(name="whatmaps",
       data_files=data_files,
       packages=['whatmaps'],
       entry_points={
-          'console_scripts': ['whatmaps = whatmaps.command:run'],
+          'console_scripts': ['whatmaps = whatmaps.command:run',
+                              'whatmapsd = whatmaps.daemon:run'],
       },
       )
 
@@ -0,0 +1,86 @@
+# vim: set fileencoding=utf-8 :
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Micro benchmark of the maps parser on a synthetic 50k line maps file
+
+Run with: python3 -m tests.bench_maps
+"""
+
+import os
+import timeit
+
+from whatmaps.process import Process
+
+from . import context
+
+LINES = 50000
+RUNS = 10
+
+
+def text_read_maps(path):
+    """The line based text parser used up to whatmaps 0.0.14"""
+    mapped = []
+    with open(path) as f:
+        for line in f:
+            try:
+                so = line.split()[5].strip()
+                mapped.append(so)
+            except IndexError:
+                pass
+    return mapped
+
+
+def write_maps(path, lines):
+    with open(path, 'w') as f:
+        for i in range(lines):
+            addr = '%012x-%012x' % (i * 4096, (i + 1) * 4096)
+            if i % 3 == 0:
+                f.write('%s rw-p 00000000 00:00 0 \n' % addr)
+            elif i % 3 == 1:
+                f.write('%s r-xp 00000000 fe:02 %d                    '
+                        '/usr/lib/x86_64-linux-gnu/libfoo%d.so.1\n' % (addr, i, i % 500))
+            elif i % 100 == 2:
+                f.write('%s rw-p 00000000 00:00 0                          [heap]\n' % addr)
+            else:
+                f.write('%s r--p 00001000 fe:02 %d                    '
+                        '/usr/lib/jvm/lib/modules\n' % (addr, i))
+
+
+def main():
+    tmpdir = context.new_tmpdir(__name__)
+    pid = 1
+    os.mkdir(tmpdir.join(str(pid)))
+    maps = tmpdir.join(str(pid), 'maps')
+    write_maps(maps, LINES)
+
+    def full():
+        Process(pid, procfs=str(tmpdir)).mapped_objects()
+
+    early = set([b'/usr/lib/x86_64-linux-gnu/libfoo1.so.1'])
+
+    def first_match():
+        Process(pid, procfs=str(tmpdir)).find_mapped(early)
+
+    results = [('text parser (old _read_maps)', lambda: text_read_maps(maps)),
+               ('byte parser, full read', full),
+               ('byte parser, early exit', first_match)]
+    for name, func in results:
+        t = min(timeit.repeat(func, number=1, repeat=RUNS))
+        print("%-30s %8.2f ms" % (name, t * 1000))
+    context.teardown()
+
+
+if __name__ == '__main__':
+    main()
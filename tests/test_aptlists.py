@@ -0,0 +1,92 @@
+# vim: set fileencoding=utf-8 :
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Test L{whatmaps.aptlists}"""
+
+import gzip
+import os
+import unittest
+
+from whatmaps.aptlists import AptLists, OriginIndex, version_origins
+
+from . import context
+
+LISTS = {
+    'deb.debian.org_debian_dists_bookworm_InRelease':
+    '-----BEGIN PGP SIGNED MESSAGE-----\nHash: SHA512\n\n'
+    'Origin: Debian\nLabel: Debian\nSuite: stable\nCodename: bookworm\n'
+    'SHA256:\n 0123 100 main/binary-amd64/Packages\n',
+    'deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages':
+    'Package: libfoo1\nVersion: 1.0-1\nArchitecture: amd64\n\n'
+    'Package: bar\nSource: foo\nVersion: 2.0\n\n',
+    'security.debian.org_debian-security_dists_bookworm-security_Release':
+    'Origin: Debian\nSuite: stable-security\nSHA256:\n',
+    'security.debian.org_debian-security_dists_bookworm-security_updates_main_binary-amd64_Packages.gz':
+    'Package: libfoo1\nVersion: 1.0-1+deb12u1\n\nPackage: bar\nVersion: 2.0\n',
+    'norelease_dists_sid_main_binary-amd64_Packages': 'Package: baz\nVersion: 1\n',
+}
+
+
+class TestAptLists(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+        self.lists_dir = self.tmpdir.join('lists')
+        os.mkdir(self.lists_dir)
+        for name, content in LISTS.items():
+            path = os.path.join(self.lists_dir, name)
+            with (gzip.open if name.endswith('.gz') else open)(path, 'wt') as f:
+                f.write(content)
+        self.security = os.path.join(self.lists_dir, 'security.debian.org_debian-security_dists_'
+                                     'bookworm-security_updates_main_binary-amd64_Packages.gz')
+
+    def test_lists(self):
+        lists = AptLists(self.lists_dir)
+        self.assertEqual(len(lists.packages_files()), 3)
+        self.assertEqual(lists.origin(self.security), ('Debian', 'stable-security'))
+        self.assertEqual(list(lists.versions(self.security)),
+                         [('libfoo1', '1.0-1+deb12u1'), ('bar', '2.0')])
+
+    def _check_origins(self, origins):
+        self.assertEqual(origins('libfoo1', '1.0-1+deb12u1'),
+                         set([('Debian', 'stable-security')]))
+        self.assertEqual(origins('bar', '2.0'),
+                         set([('Debian', 'stable-security'), ('Debian', 'stable')]))
+        self.assertEqual(origins('libfoo1', '0.9'), set())
+        self.assertIsNone(origins('doesnotexist', '1.0'))
+        # Lists without Release file have no known origin
+        self.assertIsNone(origins('baz', '1'))
+
+    def test_index(self):
+        self._check_origins(version_origins(['libfoo1', 'bar'], self.lists_dir, str(self.tmpdir)))
+        index = OriginIndex.open(AptLists(self.lists_dir), str(self.tmpdir))
+        self.assertEqual(index.sync(), 0)
+
+    def test_invalidation(self):
+        index = OriginIndex.open(AptLists(self.lists_dir), str(self.tmpdir))
+        self.assertEqual(index.sync(), 2)
+        with gzip.open(self.security, 'wt') as f:
+            f.write('Package: libfoo1\nVersion: 1.0-1+deb12u2\n')
+        os.utime(self.security, ns=(0, 0))
+        self.assertEqual(index.sync(), 1)
+        self.assertEqual(index.origins('libfoo1', '1.0-1+deb12u2'),
+                         set([('Debian', 'stable-security')]))
+        self.assertEqual(index.origins('libfoo1', '1.0-1+deb12u1'), set())
+
+    def test_no_index(self):
+        """Without a usable cache directory the lists are read directly"""
+        self._check_origins(version_origins(['libfoo1', 'bar', 'baz'], self.lists_dir,
+                                            '/proc/doesnotexist'))
+
+    def tearDown(self):
+        context.teardown()
@@ -0,0 +1,350 @@
+# vim: set fileencoding=utf-8 :
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Test L{whatmaps.command}"""
+
+import fcntl
+import io
+import os
+import subprocess
+import sys
+import unittest
+from unittest.mock import Mock, patch
+
+from whatmaps.command import (check_containers, check_deleted, check_maps,
+                              check_maps_mapped_first, check_maps_unit_first,
+                              filter_started_after, find_pkgs, get_all_pids,
+                              group_by_mnt_ns, split_containers, verify_restarts,
+                              main, wait_deferred, watch)
+from whatmaps.debiandistro import DebianDistro
+from whatmaps.mapsindex import MapsIndex
+from whatmaps.pkg import Pkg, PkgError
+
+from . import context
+
+
+class TestCommand(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+        self.procfs = str(self.tmpdir)
+        for pid in range(1, 20):
+            self._add_proc(pid, '/usr/bin/prog%d' % (pid % 3),
+                           ['/lib/libc.so.6', '/lib/lib%d.so.1' % pid])
+        os.makedirs(os.path.join(self.procfs, 'self', 'ns'))
+        os.symlink('mnt:[4026531841]', os.path.join(self.procfs, 'self', 'ns', 'mnt'))
+
+    def _add_proc(self, pid, exe, mapped, mnt_ns='mnt:[4026531841]'):
+        piddir = os.path.join(self.procfs, str(pid))
+        os.mkdir(piddir)
+        os.mkdir(os.path.join(piddir, 'ns'))
+        os.symlink(mnt_ns, os.path.join(piddir, 'ns', 'mnt'))
+        os.symlink(exe, os.path.join(piddir, 'exe'))
+        with open(os.path.join(piddir, 'cmdline'), 'w') as f:
+            f.write(exe)
+        with open(os.path.join(piddir, 'maps'), 'w') as f:
+            for path in mapped:
+                f.write('7f32b4521000-7f32b4623000 r--p 00020000 fe:02 1704011 %s\n' % path)
+
+    def test_get_all_pids(self):
+        procs = get_all_pids(procfs=self.procfs)
+        self.assertEqual([p.pid for p in procs], list(range(1, 20)))
+
+    def test_get_all_pids_jobs(self):
+        """Check that a parallel scan gives the same result"""
+        serial = get_all_pids(procfs=self.procfs)
+        parallel = get_all_pids(jobs=4, procfs=self.procfs)
+        self.assertEqual([p.pid for p in parallel], [p.pid for p in serial])
+        self.assertEqual([p.exe for p in parallel], [p.exe for p in serial])
+        # Maps are only read when matching
+        self.assertEqual([p for p in parallel if p.mapped is not None], [])
+        self.assertEqual(check_maps(parallel, ['/lib/lib4.so.1'], jobs=4).keys(),
+                         set(['/usr/bin/prog1']))
+
+    def test_get_all_pids_vanished(self):
+        """Check that we don't fail if a process vanishes during the scan"""
+        for name in ['exe', 'cmdline', 'maps']:
+            os.unlink(os.path.join(self.procfs, '7', name))
+        procs = get_all_pids(jobs=2, procfs=self.procfs)
+        self.assertEqual(len(procs), 19)
+        self.assertIsNone(procs[6].exe)
+        self.assertEqual(procs[6].mapped_objects(), set())
+
+    def test_get_all_pids_kernel_thread(self):
+        """Check that kernel threads are skipped"""
+        with open(os.path.join(self.procfs, '2', 'stat'), 'w') as f:
+            f.write('2 (kthreadd) S 0 0 0 0 -1 2129984 0 0 0 0 0 0 0 0 20 0 1 0 9 0 0\n')
+        procs = get_all_pids(procfs=self.procfs)
+        self.assertNotIn(2, [p.pid for p in procs])
+        self.assertEqual(len(procs), 18)
+
+    def test_check_deleted(self):
+        with open(os.path.join(self.procfs, '5', 'maps'), 'a') as f:
+            f.write('7f32b4521000-7f32b4623000 r--p 00020000 fe:02 1 /lib/libz.so.1 (deleted)\n')
+        # Kernel pseudo files
+        with open(os.path.join(self.procfs, '6', 'maps'), 'a') as f:
+            f.write('7f32b4521000-7f32b4623000 rw-s 00000000 00:13 2 /[aio] (deleted)\n')
+            f.write('7f32b4521000-7f32b4623000 rw-s 00000000 00:0f 3 /anon_hugepage (deleted)\n')
+        os.unlink(os.path.join(self.procfs, '8', 'exe'))
+        os.symlink('/usr/bin/prog2 (deleted)', os.path.join(self.procfs, '8', 'exe'))
+        with patch('whatmaps.mapsindex.FileIdCache.file_id', return_value=(0xfe, 2, 1704011)):
+            result = check_deleted(get_all_pids(procfs=self.procfs), self.procfs)
+        self.assertEqual(sorted(result.keys()), ['/usr/bin/prog2'])
+        self.assertEqual([p.pid for p in result['/usr/bin/prog2']], [5, 8])
+
+    def test_check_deleted_containers(self):
+        """Mappings of container processes are looked up below their root"""
+        root = self.tmpdir.join('container')
+        os.makedirs(os.path.join(root, 'lib'))
+        so = os.path.join(root, 'lib', 'libz.so.1')
+        with open(so, 'w') as f:
+            f.write('')
+        inode = os.stat(so).st_ino
+        for pid, mnt_ns in [(20, 'mnt:[1]'), (21, 'mnt:[4026531841]')]:
+            self._add_proc(pid, '/usr/sbin/zprog%d' % pid, [], mnt_ns)
+            os.symlink(root, os.path.join(self.procfs, str(pid), 'root'))
+            with open(os.path.join(self.procfs, str(pid), 'maps'), 'w') as f:
+                f.write('7f32b4521000-7f32b4623000 r--p 00020000 fe:02 %d /lib/libz.so.1\n' % inode)
+        procs = [p for p in get_all_pids(procfs=self.procfs) if p.pid >= 20]
+        result = check_deleted(procs, self.procfs)
+        # Only the host process' /lib/libz.so.1 doesn't exist
+        self.assertEqual(list(result.keys()), ['/usr/sbin/zprog21'])
+
+    def test_filter_started_after(self):
+        so = self.tmpdir.join('libfoo.so.1')
+        with open(so, 'w') as f:
+            f.write('')
+        os.utime(so, (1000, 1000))
+        changed = os.stat(so).st_ctime
+
+        class Proc(object):
+            def __init__(self, start_time):
+                self.start_time = start_time
+
+        procs = [Proc(None), Proc(900), Proc(changed + 100)]
+        self.assertEqual(filter_started_after(procs, [so]), procs[:2])
+        self.assertEqual(filter_started_after(procs, ['/does/not/exist']), procs)
+
+    def test_check_containers(self):
+        self._add_proc(20, '/usr/sbin/cprog', ['/lib/libz.so.1'], 'mnt:[1]')
+        self._add_proc(21, '/usr/sbin/cprog', ['/lib/libz.so.1'], 'mnt:[1]')
+        self._add_proc(22, '/usr/sbin/other', ['/lib/libz.so.1'], 'mnt:[2]')
+        namespaces = group_by_mnt_ns(get_all_pids(procfs=self.procfs))
+        self.assertEqual(sorted(namespaces.keys()),
+                         ['mnt:[1]', 'mnt:[2]', 'mnt:[4026531841]'])
+        self.assertEqual(len(namespaces['mnt:[4026531841]']), 19)
+        namespaces.pop('mnt:[4026531841]')
+
+        class Pkg(object):
+            def __init__(self, name, root):
+                self.name = name
+                self.root = root
+
+            @property
+            def shared_objects(self):
+                if self.root.endswith('/22/root'):
+                    raise PkgError("Not installed")
+                return ['/lib/libz.so.1']
+
+        with patch('whatmaps.distro.Distro.detect_root') as mock:
+            mock.return_value.pkg = Pkg
+            result = check_containers(namespaces, ['zlib1g'])
+        self.assertEqual(list(result.keys()), ['mnt:[1]'])
+        self.assertEqual([p.pid for p in result['mnt:[1]']['/usr/sbin/cprog']],
+                         [20, 21])
+
+    def test_split_containers(self):
+        """Services with a mount namespace of their own on our root stay on the host"""
+        host_root = self.tmpdir.join('hostroot')
+        container_root = self.tmpdir.join('containerroot')
+        os.mkdir(host_root)
+        os.mkdir(container_root)
+        os.symlink(host_root, os.path.join(self.procfs, 'self', 'root'))
+        for pid in range(1, 20):
+            os.symlink(host_root, os.path.join(self.procfs, str(pid), 'root'))
+        self._add_proc(20, '/usr/sbin/cprog', ['/lib/libz.so.1'], 'mnt:[1]')
+        os.symlink(container_root, os.path.join(self.procfs, '20', 'root'))
+        # e.g. PrivateTmp=true
+        self._add_proc(21, '/usr/sbin/apache2', ['/lib/libz.so.1'], 'mnt:[2]')
+        os.symlink(host_root, os.path.join(self.procfs, '21', 'root'))
+        namespaces = group_by_mnt_ns(get_all_pids(procfs=self.procfs))
+        host, containers = split_containers(namespaces, 'mnt:[4026531841]', self.procfs)
+        self.assertEqual([p.pid for p in host], list(range(1, 20)) + [21])
+        self.assertEqual(list(containers.keys()), ['mnt:[1]'])
+
+    def test_check_maps_mapped_first(self):
+        """Check that only mapped objects are looked up"""
+        class Distro(object):
+            looked_up = []
+
+            @classmethod
+            def pkgs_by_files(klass, paths):
+                klass.looked_up += paths
+                return {path: Pkg(path[5:9]) if path in ['/lib/lib4.so.1', '/lib/lib7.so.1']
+                        else None for path in paths}
+
+        procs = get_all_pids(procfs=self.procfs)
+        restart_procs, shared_objects = check_maps_mapped_first(procs, [Pkg('lib7:amd64')],
+                                                                Distro)
+        self.assertEqual(len(Distro.looked_up), 20)
+        self.assertIn('/lib/libc.so.6', Distro.looked_up)
+        self.assertEqual(shared_objects, ['/lib/lib7.so.1'])
+        self.assertEqual(list(restart_procs.keys()), ['/usr/bin/prog1'])
+        self.assertEqual([proc.pid for proc in restart_procs['/usr/bin/prog1']], [7])
+
+    def test_check_maps_unit_first(self):
+        """Check that a unit's processes are only scanned until the first match"""
+        unit_pids = ({'a.service': [1, 2, 3], 'b.service': [4, 5], 'c.service': [8]},
+                     [6, 7])
+        restart_procs = check_maps_unit_first(unit_pids, ['/lib/libc.so.6', '/lib/lib5.so.1'],
+                                              procfs=self.procfs)
+        pids = sorted(proc.pid for procs in restart_procs.values() for proc in procs)
+        self.assertEqual(pids, [1, 4, 6, 7, 8])
+
+    def test_verify_restarts(self):
+        """Check that only the units' processes are checked for outdated objects"""
+        so = self.tmpdir.join('libnew.so.1')
+        with open(so, 'w'):
+            pass
+        inode = os.stat(so).st_ino
+        self._add_proc(100, '/usr/sbin/fresh', [so])
+        with open(os.path.join(self.procfs, '100', 'maps'), 'w') as f:
+            f.write('7f32b4521000-7f32b4623000 r--p 00020000 fe:02 %d %s\n' % (inode, so))
+        self._add_proc(101, '/usr/sbin/stale', [so])
+        self._add_proc(102, '/usr/sbin/deleted', ['%s (deleted)' % so,
+                                                  '/usr/lib/libgone.so.1 (deleted)'])
+
+        class Systemd(object):
+            @staticmethod
+            def units_pids(units):
+                return {unit: pids for unit, pids in {'fresh.service': [100],
+                                                      'stale.service': [100, 101],
+                                                      'deleted.service': [102]}.items()
+                        if unit in units}
+
+        stale = verify_restarts(['fresh.service', 'stale.service', 'deleted.service'],
+                                [so], Systemd, self.procfs)
+        self.assertEqual(stale, {'stale.service': set([so]), 'deleted.service': set([so])})
+        # Without shared objects only deleted mappings are found
+        stale = verify_restarts(['fresh.service', 'deleted.service'], [], Systemd, self.procfs)
+        self.assertEqual(stale, {'deleted.service': set(['/usr/lib/libgone.so.1'])})
+
+    def test_defer(self):
+        """Check that the caller returns at once and the result can be waited for"""
+        lock_path = self.tmpdir.join('restart.sh.lock')
+        log_path = self.tmpdir.join('restart.sh.log')
+        script = ("import sys, time\n"
+                  "from whatmaps.command import defer\n"
+                  "lock = defer(%r, %r)\n"
+                  "if lock is None:\n"
+                  "    sys.exit(0)\n"
+                  "time.sleep(0.5)\n"
+                  "sys.stderr.write('analysis done\\n')\n" % (lock_path, log_path))
+        subprocess.run([sys.executable, '-c', script], check=True, timeout=2,
+                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        with patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            self.assertTrue(wait_deferred(lock_path, log_path, 10))
+        self.assertEqual(stderr.getvalue(), 'analysis done\n')
+        self.assertFalse(os.path.exists(log_path))
+        self.assertFalse(os.path.exists(lock_path))
+        # Nothing deferred
+        self.assertTrue(wait_deferred(self.tmpdir.join('doesnotexist'), log_path, 1))
+
+    def test_wait_deferred_timeout(self):
+        """Check that a deferred run is terminated at the deadline"""
+        lock_path = self.tmpdir.join('restart.sh.lock')
+        background = subprocess.Popen(['sleep', '10'])
+        with open(lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            lock.write('%d\n' % background.pid)
+            lock.flush()
+            self.assertFalse(wait_deferred(lock_path, self.tmpdir.join('log'), 0.2))
+        self.assertEqual(background.wait(timeout=2), -15)
+
+    def test_verify_no_hierarchy(self):
+        """Check that --verify copes with a missing cgroup hierarchy"""
+        procs = get_all_pids(procfs=self.procfs)
+        distro = Mock()
+        distro.return_value.pkg.return_value.shared_objects = ['/lib/lib4.so.1']
+        with patch('whatmaps.command.Distro.detect', return_value=distro), \
+                patch('whatmaps.command.get_all_pids', return_value=procs), \
+                patch('whatmaps.command.find_restart_services',
+                      return_value=set(['foo.service'])), \
+                patch('whatmaps.command.handle_services', return_value=set()), \
+                patch('whatmaps.systemd.Systemd._hierarchy', return_value=None):
+            self.assertEqual(main(['whatmaps', '--restart', '--verify', 'p']), 0)
+        self.assertEqual(main(['whatmaps', '--restart', '--verify', '--record',
+                               self.tmpdir.join('snapshot'), 'p']), 1)
+
+    def test_find_pkgs(self):
+        """Check that each executable is looked up once in a single query"""
+        procs = get_all_pids(procfs=self.procfs)
+        restart_procs = check_maps(procs, ['/lib/libc.so.6'])
+        owners = {'/usr/bin/prog0': None,
+                  '/usr/bin/prog1': 'apkg',
+                  '/usr/bin/prog2': 'apkg'}
+        with patch.object(DebianDistro, '_owners', return_value=owners) as mock:
+            pkgs = find_pkgs(restart_procs, DebianDistro)
+        mock.assert_called_once_with(set(restart_procs))
+        self.assertEqual(list(pkgs.keys()), ['apkg'])
+        self.assertEqual(sorted(pkgs['apkg'].procs), ['/usr/bin/prog1', '/usr/bin/prog2'])
+
+    def test_watch(self):
+        """Check that only processes mapping replaced objects are handled"""
+        add_proc = self._add_proc
+
+        class Watcher(object):
+            def __init__(self, paths):
+                self.paths = paths
+
+            def watch(self, callback):
+                # Started after the watch began
+                add_proc(30, '/usr/bin/prog30', ['/lib/lib7.so.1'])
+                callback(set(['/lib/lib4.so.1', '/lib/lib7.so.1']))
+
+        class Systemd(object):
+            @staticmethod
+            def is_running():
+                return True
+
+            @staticmethod
+            def process_to_unit(proc):
+                return 'unit%d.service' % proc.pid
+
+        indexed = []
+        add_all = MapsIndex.add_all
+
+        def record_add_all(index, procs, jobs=1):
+            procs = list(procs)
+            # The index of all mapped objects, not the check of the candidates
+            if procs and index._targets is None:
+                indexed.append([proc.pid for proc in procs])
+            return add_all(index, procs, jobs)
+
+        options = Mock(jobs=1, restart=False)
+        distro = Mock(service_blacklist=set())
+        distro.filter_services = lambda services: set(services)
+        with patch('whatmaps.command.Watcher', side_effect=Watcher) as mock, \
+                patch.object(MapsIndex, 'add_all', record_add_all):
+            with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+                watch([], options, distro, Systemd, self.procfs)
+        # Only the new process got indexed for the batch
+        self.assertEqual(indexed, [list(range(1, 20)), [30]])
+        watched = mock.call_args[0][0]
+        self.assertEqual(len(watched), 20)
+        self.assertIn('/lib/libc.so.6', watched)
+        self.assertEqual(sorted(stdout.getvalue().split('\n')[1:-1]),
+                         ['unit30.service', 'unit4.service', 'unit7.service'])
+
+    def tearDown(self):
+        context.teardown()
@@ -0,0 +1,153 @@
+# vim: set fileencoding=utf-8 :
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Test L{whatmaps.daemon}"""
+
+import errno
+import os
+import shutil
+import socket
+import struct
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from whatmaps.daemon import DaemonError, MapsDaemon, ProcConnector, query
+
+from . import context
+
+
+class TestMapsDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+        self.procfs = self.tmpdir.join('proc')
+        os.mkdir(self.procfs)
+        self._add_proc(1, '/usr/sbin/a', ['/lib/libc.so.6'])
+        self._add_proc(2, '/usr/sbin/b', ['/lib/libc.so.6', '/lib/libz.so.1'])
+        self._add_proc(3, '/usr/sbin/b', ['/lib/libz.so.1'])
+        self.daemon = MapsDaemon(self.tmpdir.join('sock'), procfs=self.procfs)
+
+    def _add_proc(self, pid, exe, mapped, start_time=100):
+        piddir = os.path.join(self.procfs, str(pid))
+        os.mkdir(piddir)
+        os.symlink(exe, os.path.join(piddir, 'exe'))
+        with open(os.path.join(piddir, 'stat'), 'w') as f:
+            f.write('%d (a) S 1 0 0 0 -1 4194560 0 0 0 0 0 0 0 0 20 0 1 0 %d 0 0\n'
+                    % (pid, start_time))
+        with open(os.path.join(piddir, 'maps'), 'w') as f:
+            for path in mapped:
+                f.write('7f32b4521000-7f32b4623000 r--p 00020000 fe:02 1704011 %s\n' % path)
+
+    def test_query(self):
+        self.daemon.rescan()
+        self.assertEqual(self.daemon.query(['/lib/libz.so.1']),
+                         {'/usr/sbin/b': [2, 3]})
+        self.assertEqual(self.daemon.query(['/lib/libc.so.6', '/does/not/exist']),
+                         {'/usr/sbin/a': [1], '/usr/sbin/b': [2]})
+
+    def test_rescan(self):
+        """Check that exited processes and reused pids are handled"""
+        self.daemon.rescan()
+        shutil.rmtree(os.path.join(self.procfs, '2'))
+        shutil.rmtree(os.path.join(self.procfs, '3'))
+        self._add_proc(3, '/usr/sbin/c', ['/lib/libc.so.6'], start_time=200)
+        self._add_proc(4, '/usr/sbin/d', ['/lib/libz.so.1'])
+        self.daemon.rescan()
+        self.assertEqual(self.daemon.query(['/lib/libz.so.1']),
+                         {'/usr/sbin/d': [4]})
+        self.assertEqual(self.daemon.query(['/lib/libc.so.6']),
+                         {'/usr/sbin/a': [1], '/usr/sbin/c': [3]})
+
+    def test_events(self):
+        """Check that exec'ed processes get reindexed on the next query"""
+        self.daemon.rescan()
+        shutil.rmtree(os.path.join(self.procfs, '1'))
+        self._add_proc(1, '/usr/sbin/e', ['/lib/libz.so.1'])
+        self.daemon._connector = Mock()
+        self.daemon._connector.read_events.return_value = [
+            (ProcConnector.PROC_EVENT_EXEC, 1),
+            (ProcConnector.PROC_EVENT_EXIT, 2)]
+        self.daemon._handle_events()
+        self.assertEqual(self.daemon.query(['/lib/libz.so.1']),
+                         {'/usr/sbin/b': [3], '/usr/sbin/e': [1]})
+
+    def test_events_lost(self):
+        """Check that all processes get reindexed when events got dropped"""
+        self.daemon.rescan()
+        self.daemon._connector = Mock()
+        self.daemon._connector.read_events.side_effect = OSError(errno.ENOBUFS, "No buffer space")
+        # Exec'ed without us noticing, the start time stays the same
+        with open(os.path.join(self.procfs, '1', 'maps'), 'w') as f:
+            f.write('7f32b4521000-7f32b4623000 r--p 00020000 fe:02 1704011 /lib/libz.so.1\n')
+        self._add_proc(4, '/usr/sbin/d', ['/lib/libz.so.1'])
+        self.daemon._handle_events()
+        self.assertEqual(self.daemon.query(['/lib/libz.so.1']),
+                         {'/usr/sbin/a': [1], '/usr/sbin/b': [2, 3], '/usr/sbin/d': [4]})
+
+    def test_socket(self):
+        """Check the client server protocol"""
+        self.daemon.rescan()
+        self.daemon.listen()
+
+        def serve():
+            conn, dummy = self.daemon._server.accept()
+            self.daemon._handle_client(conn)
+
+        server = threading.Thread(target=serve)
+        server.start()
+        result = query(['/lib/libz.so.1'], self.daemon.socket_path)
+        server.join()
+        self.daemon._server.close()
+        self.assertEqual(result, {'/usr/sbin/b': [2, 3]})
+
+    def test_stalled_client(self):
+        """Check that a client not sending its request doesn't block others"""
+        server = threading.Thread(target=self.daemon.serve_forever, daemon=True)
+        server.start()
+        for dummy in range(100):
+            if os.path.exists(self.daemon.socket_path):
+                break
+            time.sleep(0.05)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stalled:
+            stalled.connect(self.daemon.socket_path)
+            result = query(['/lib/libz.so.1'], self.daemon.socket_path, timeout=2)
+        self.assertEqual(result, {'/usr/sbin/b': [2, 3]})
+
+    def test_no_daemon(self):
+        self.assertRaises(DaemonError, query, ['/lib/libz.so.1'],
+                          self.tmpdir.join('doesnotexist'))
+
+    def tearDown(self):
+        context.teardown()
+
+
+class TestProcConnector(unittest.TestCase):
+    def _msg(self, what, *pids):
+        event = struct.pack('=IIQ', what, 0, 0) + struct.pack('=%dI' % len(pids), *pids)
+        cn = struct.pack('=IIIIHH', 1, 1, 0, 0, len(event), 0) + event
+        return struct.pack('=IHHII', 16 + len(cn), 3, 0, 0, 0) + cn
+
+    def test_read_events(self):
+        connector = ProcConnector.__new__(ProcConnector)
+        connector.sock = Mock()
+        connector.sock.recv.return_value = b''.join([
+            self._msg(ProcConnector.PROC_EVENT_FORK, 1, 1, 42, 42),
+            self._msg(ProcConnector.PROC_EVENT_FORK, 1, 1, 43, 42),
+            self._msg(ProcConnector.PROC_EVENT_EXEC, 42, 42),
+            self._msg(ProcConnector.PROC_EVENT_EXIT, 42, 42, 0, 0)])
+        self.assertEqual(connector.read_events(),
+                         [(ProcConnector.PROC_EVENT_FORK, 42),
+                          (ProcConnector.PROC_EVENT_EXEC, 42),
+                          (ProcConnector.PROC_EVENT_EXIT, 42)])
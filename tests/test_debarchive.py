@@ -0,0 +1,136 @@
+# vim: set fileencoding=utf-8 :
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Test L{whatmaps.debarchive}"""
+
+import io
+import tarfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from whatmaps.debarchive import DebArchive, DebArchiveError
+from whatmaps.debianpkg import DebianPkg
+
+from . import context
+
+FILES = ['./usr/', './usr/lib/', './usr/lib/libfoo.so.1.2',
+         './usr/lib/libfoo.so.1', './etc/init.d/foo']
+
+
+def make_tar(names, compression=''):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode='w:%s' % compression) as tar:
+        for name in names:
+            info = tarfile.TarInfo(name.rstrip('/'))
+            if name.endswith('/'):
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            elif name.endswith('.so.1'):
+                info.type = tarfile.SYMTYPE
+                info.linkname = 'libfoo.so.1.2'
+                tar.addfile(info)
+            else:
+                content = b'x' * 513
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+
+def make_deb(path, data_name='data.tar.xz', data=None):
+    compression = data_name.split('.')[2] if data_name.count('.') > 1 else ''
+    if data is None:
+        data = make_tar(FILES, compression)
+    members = [('debian-binary', b'2.0\n'),
+               ('control.tar.gz', make_tar(['./control'], 'gz')),
+               (data_name, data)]
+    with open(path, 'wb') as f:
+        f.write(b'!<arch>\n')
+        for name, content in members:
+            f.write(('%-16s%-12s%-6s%-6s%-8s%-10s`\n' %
+                     (name, 0, 0, 0, 100644, len(content))).encode('ascii'))
+            f.write(content)
+            if len(content) % 2:
+                f.write(b'\n')
+
+
+class Database(object):
+    """Like sqlite only usable from the thread that created it"""
+    def __init__(self, pkgs):
+        self.pkgs = pkgs
+        self.thread = threading.get_ident()
+
+    def contents(self, name):
+        assert threading.get_ident() == self.thread
+        return self.pkgs.get(name)
+
+
+class TestDebArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+
+    def test_files(self):
+        for data_name in ['data.tar', 'data.tar.gz', 'data.tar.xz', 'data.tar.bz2']:
+            path = self.tmpdir.join('%s.deb' % data_name)
+            make_deb(path, data_name)
+            self.assertEqual(list(DebArchive(path).files()),
+                             ['/usr/lib/libfoo.so.1.2', '/usr/lib/libfoo.so.1',
+                              '/etc/init.d/foo'])
+
+    def test_dot_files(self):
+        """Check that only the leading ./ gets stripped"""
+        path = self.tmpdir.join('dot.deb')
+        make_deb(path, 'data.tar', make_tar(['./.hidden', './etc/.keep', '/abs']))
+        self.assertEqual(list(DebArchive(path).files()),
+                         ['/.hidden', '/etc/.keep', '/abs'])
+
+    def test_errors(self):
+        path = self.tmpdir.join('broken.deb')
+        with open(path, 'wb') as f:
+            f.write(b'not a deb')
+        self.assertRaises(DebArchiveError, list, DebArchive(path).files())
+        make_deb(path, data=b'truncated')
+        self.assertRaises(DebArchiveError, list, DebArchive(path).files())
+        make_deb(path, 'data.tar.lz', data=b'')
+        self.assertRaises(DebArchiveError, list, DebArchive(path).files())
+        self.assertRaises(DebArchiveError, list,
+                          DebArchive(self.tmpdir.join('doesnotexist')).files())
+
+    def test_zstd_missing(self):
+        path = self.tmpdir.join('zstd.deb')
+        make_deb(path, 'data.tar.zst', data=b'\x28\xb5\x2f\xfd')
+        with patch('whatmaps.debarchive.zstandard', None):
+            self.assertRaises(DebArchiveError, list, DebArchive(path).files())
+
+    def test_load_archive_contents(self):
+        """Archives are classified, installed files are added"""
+        installed = Database({'libfoo1': ['/usr/lib/libfoo.so.0']})
+        with patch('whatmaps.dpkgdb.DpkgDatabase.open', return_value=installed), \
+                patch('subprocess.Popen') as mock:
+            pkgs = [DebianPkg('libfoo1'), DebianPkg('broken'), DebianPkg('nodeb')]
+            pkgs[0].deb = self.tmpdir.join('libfoo1.deb')
+            make_deb(pkgs[0].deb)
+            pkgs[1].deb = self.tmpdir.join('doesnotexist.deb')
+            DebianPkg.load_archive_contents(pkgs, jobs=2)
+            self.assertEqual(pkgs[0].shared_objects,
+                             ['/usr/lib/libfoo.so.1.2', '/usr/lib/libfoo.so.1',
+                              '/usr/lib/libfoo.so.0'])
+            self.assertEqual(pkgs[0].services, ['foo'])
+            self.assertIsNone(pkgs[1]._contents)
+            self.assertIsNone(pkgs[2]._contents)
+            self.assertFalse(mock.called)
+
+    def tearDown(self):
+        context.teardown()
+
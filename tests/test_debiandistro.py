@@ -17,23 +17,17 @@
 import unittest
 from unittest.mock import patch
 
-try:
-    import apt_pkg  # noqa: F401
-    have_apt_pkg = True
-except ImportError:
-    have_apt_pkg = False
-
-try:
-    import lsb_release  # noqa: F401
-    have_lsb_release = True
-except ImportError:
-    have_lsb_release = False
-
 from whatmaps.debiandistro import DebianDistro
 from whatmaps.debianpkg import DebianPkg
 
 
 class TestDebianDistro(unittest.TestCase):
+    def setUp(self):
+        # Use dpkg-query even if the host's dpkg database is readable
+        patcher = patch('whatmaps.dpkgdb.DpkgDatabase.open', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_vars(self):
         """Check Debian distro vars"""
         self.assertEqual(DebianDistro.id, 'Debian')
@@ -48,7 +42,7 @@ class TestDebianDistro(unittest.TestCase):
         with patch('subprocess.Popen') as mock:
             PopenMock = mock.return_value
             PopenMock.returncode = 0
-            PopenMock.communicate.return_value = ['apackage']
+            PopenMock.communicate.return_value = [b'apackage: afile\n']
 
             pkg = DebianDistro.pkg_by_file('afile')
             self.assertIsInstance(pkg, DebianPkg)
@@ -62,7 +56,7 @@ class TestDebianDistro(unittest.TestCase):
         with patch('subprocess.Popen') as mock:
             PopenMock = mock.return_value
             PopenMock.returncode = 1
-            PopenMock.communicate.return_value = ['apackage']
+            PopenMock.communicate.return_value = [b'']
 
             pkg = DebianDistro.pkg_by_file('afile')
             self.assertIsNone(pkg)
@@ -70,6 +64,27 @@ class TestDebianDistro(unittest.TestCase):
             mock.assert_called_once_with(['dpkg-query', '-S', 'afile'],
                                          stderr=-1, stdout=-1)
 
+    def test_pkgs_by_files(self):
+        """Check that all paths are looked up at once"""
+        with patch('subprocess.Popen') as mock:
+            PopenMock = mock.return_value
+            PopenMock.returncode = 1
+            PopenMock.communicate.return_value = [b'\n'.join([
+                b'apackage: /usr/sbin/a',
+                b'apackage: /usr/sbin/b',
+                b'diversion by other from: /usr/sbin/c',
+                b'libc-bin, libc6:amd64: /usr/sbin/c',
+                b'',
+            ])]
+            paths = ['/usr/sbin/a', '/usr/sbin/b', '/usr/sbin/c', '/usr/sbin/d']
+            pkgs = DebianDistro.pkgs_by_files(paths)
+            self.assertEqual(mock.call_count, 1)
+            self.assertEqual(sorted(mock.call_args[0][0][2:]), paths)
+            self.assertEqual(pkgs['/usr/sbin/a'].name, 'apackage')
+            self.assertIs(pkgs['/usr/sbin/a'], pkgs['/usr/sbin/b'])
+            self.assertEqual(pkgs['/usr/sbin/c'].name, 'libc-bin')
+            self.assertIsNone(pkgs['/usr/sbin/d'])
+
     def test_read_apt_pipeline(self):
         """Test our interaction with the apt pipeline"""
         class AptPipelineMock(object):
@@ -81,7 +96,9 @@ class TestDebianDistro(unittest.TestCase):
                     yield line
 
             def readlines(self):
-                return ['pkg1 0.0 c 1.0 **CONFIGURE**',
+                return ['pkg1 0.0 < 1.0 /var/cache/apt/archives/pkg1_1.0_all.deb',
+                        'pkg2 - < 1.0 /var/cache/apt/archives/pkg2_1.0_all.deb',
+                        'pkg1 0.0 c 1.0 **CONFIGURE**',
                         'pkg2 - c 1.0 **CONFIGURE**',
                         '']
 
@@ -93,16 +110,27 @@ class TestDebianDistro(unittest.TestCase):
             self.assertEqual(len(pkgs), 1)
             self.assertIn('pkg1', pkgs)
             self.assertTrue(pkgs['pkg1'].name, 'pkg1')
+            self.assertEqual(pkgs['pkg1'].deb, '/var/cache/apt/archives/pkg1_1.0_all.deb')
 
-    @patch('apt_pkg.init')
-    @patch('apt_pkg.Acquire')
-    @unittest.skipUnless(have_apt_pkg, "apt_pkg not installed")
-    @unittest.skipUnless(have_lsb_release, "lsb_release not installed")
-    def test_filter_security_updates(self, apt_pkg_acquire, apt_pkg_init):
+    def test_filter_security_updates(self):
         pkgs = {'pkg1': DebianPkg('pkg1'),
                 'pkg2': DebianPkg('pkg2'),
+                'pkg3': DebianPkg('pkg3'),
                 }
-        with patch('apt_pkg.Cache'):
-            DebianDistro.filter_security_updates(pkgs)
-        apt_pkg_init.assert_called_once_with()
-        apt_pkg_acquire.assert_called_once_with()
+        for pkg in pkgs.values():
+            pkg.version = '1.0'
+        available = {('pkg1', '1.0'): set([('Debian', 'stable-security')]),
+                     ('pkg2', '1.0'): set([('Debian', 'stable')])}
+
+        def origins(name, version):
+            return available.get((name, version))
+
+        with patch('whatmaps.debiandistro.apt_pkg') as apt_pkg, \
+                patch('whatmaps.debiandistro.version_origins', return_value=origins), \
+                patch.object(DebianDistro, '_security_update_origins',
+                             return_value=[('Debian', 'stable-security')]):
+            security_updates, notfound = DebianDistro.filter_security_updates(pkgs)
+            apt_pkg.init_config.assert_called_once_with()
+            self.assertFalse(apt_pkg.Cache.called)
+        self.assertEqual(list(security_updates), [pkgs['pkg1']])
+        self.assertEqual(notfound, [pkgs['pkg3']])
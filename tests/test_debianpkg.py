@@ -14,16 +14,85 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Test L{whatmaps.process} config"""
 
+import io
+import subprocess
 import unittest
 
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 from whatmaps.debianpkg import DebianPkg
+from whatmaps.pkg import PkgError
 
 
 class TestDebianPkg(unittest.TestCase):
+    def setUp(self):
+        # Use dpkg-query even if the host's dpkg database is readable
+        patcher = patch('whatmaps.dpkgdb.DpkgDatabase.open', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_services(self):
-        with patch('whatmaps.pkg.Pkg._get_contents') as mock:
-            mock.return_value = ['/etc/init.d/aservice', '/usr/bin/afile']
+        with patch('subprocess.Popen') as mock:
+            mock.return_value.stdout = io.BytesIO(b'/etc/init.d/aservice\n/usr/bin/afile\n')
+            mock.return_value.wait.return_value = 0
             p = DebianPkg('doesnotmatter')
             self.assertEqual(p.services, ['aservice'])
+
+    def test_root(self):
+        """Check that the package database below root is used"""
+        with patch('subprocess.Popen') as mock:
+            PopenMock = mock.return_value
+            PopenMock.stdout = io.BytesIO(b'/lib/foo.so.1\n')
+            PopenMock.wait.return_value = 0
+            p = DebianPkg('apackage', root='/proc/1/root')
+            self.assertEqual(p.shared_objects, ['/lib/foo.so.1'])
+            mock.assert_called_once_with(['dpkg-query',
+                                          '--admindir=/proc/1/root/var/lib/dpkg',
+                                          '-L', 'apackage'],
+                                         stderr=subprocess.DEVNULL, stdout=-1)
+
+    def test_load_contents(self):
+        """Check that contents of several packages are listed at once"""
+        with patch('subprocess.Popen') as mock:
+            PopenMock = mock.return_value
+            PopenMock.stdout = io.BytesIO(b'\n'.join([
+                b'apackage',
+                b' /lib/foo.so.1',
+                b' /etc/init.d/aservice',
+                b'libc6:amd64',
+                b' /lib/x86_64-linux-gnu/libc.so.6',
+                b'libc6:i386',
+                b' /lib/i386-linux-gnu/libc.so.6',
+                b'',
+            ]))
+            PopenMock.wait.return_value = 1
+            pkgs = [DebianPkg(name) for name in ['apackage', 'libc6', 'notinstalled']]
+            DebianPkg.load_contents(pkgs)
+            mock.assert_called_once_with(['dpkg-query',
+                                          '--showformat=${binary:Package}\n${db-fsys:Files}',
+                                          '--show', 'apackage', 'libc6', 'notinstalled'],
+                                         stderr=subprocess.DEVNULL, stdout=-1)
+
+            self.assertEqual(pkgs[0].shared_objects, ['/lib/foo.so.1'])
+            self.assertEqual(pkgs[0].services, ['aservice'])
+            self.assertEqual(pkgs[1].shared_objects,
+                             ['/lib/x86_64-linux-gnu/libc.so.6',
+                              '/lib/i386-linux-gnu/libc.so.6'])
+            self.assertEqual(mock.call_count, 1)
+            # Failures are still reported per package
+            PopenMock.stdout = io.BytesIO(b'')
+            self.assertRaises(PkgError, getattr, pkgs[2], 'shared_objects')
+            self.assertEqual(mock.call_count, 2)
+
+    def test_load_contents_chunked(self):
+        """Check that long package lists are split and roots are honored"""
+        with patch('subprocess.Popen') as mock, \
+                patch.object(DebianPkg, 'batch_size', 2):
+            mock.side_effect = lambda *args, **kwargs: Mock(stdout=io.BytesIO(b''))
+            pkgs = [DebianPkg('p%d' % i, root='/proc/1/root') for i in range(3)]
+            DebianPkg.load_contents(pkgs)
+            self.assertEqual(mock.call_count, 2)
+            self.assertEqual(mock.call_args[0][0],
+                             ['dpkg-query', '--admindir=/proc/1/root/var/lib/dpkg',
+                              '--showformat=${binary:Package}\n${db-fsys:Files}',
+                              '--show', 'p2'])
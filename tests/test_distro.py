@@ -14,6 +14,7 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Test L{whatmaps.process} config"""
 
+import os
 import unittest
 
 from unittest.mock import patch
@@ -23,7 +24,11 @@ try:
     have_lsb_release = True
 except ImportError:
     have_lsb_release = False
-from whatmaps.distro import Distro, detect
+from whatmaps.distro import Distro, detect, detect_root
+from whatmaps.debiandistro import DebianDistro
+from whatmaps.redhatdistro import FedoraDistro
+
+from . import context
 
 
 class Pkg(object):
@@ -55,6 +60,17 @@ class TestDistro(unittest.TestCase):
                 d = detect()
                 self.assertEqual(d.id, 'Debian')
 
+    def test_detect_root(self):
+        "Detect distro below a root directory"
+        tmpdir = context.new_tmpdir(__name__)
+        self.assertIsNone(detect_root(str(tmpdir)))
+        os.makedirs(tmpdir.join('var', 'lib', 'rpm'))
+        self.assertEqual(detect_root(str(tmpdir)), FedoraDistro)
+        os.makedirs(tmpdir.join('var', 'lib', 'dpkg'))
+        open(tmpdir.join('var', 'lib', 'dpkg', 'status'), 'w').close()
+        self.assertEqual(detect_root(str(tmpdir)), DebianDistro)
+        context.teardown()
+
     def test_filter_services_empty(self):
         d = Distro()
         self.assertEqual(set(['foo', 'bar']),
@@ -71,3 +87,12 @@ class TestDistro(unittest.TestCase):
         d.service_blacklist_re = ['^f..', '^b..']
         self.assertEqual(set(),
                          d.filter_services(['foo', 'bar']))
+
+    def test_load_contents(self):
+        "Contents are loaded per package type"
+        with patch('whatmaps.debianpkg.DebianPkg.load_contents') as deb, \
+                patch('whatmaps.rpmpkg.RpmPkg.load_contents') as rpm:
+            pkgs = [DebianDistro.pkg('a'), FedoraDistro.pkg('b'), DebianDistro.pkg('c')]
+            Distro.load_contents(pkgs)
+            deb.assert_called_once_with([pkgs[0], pkgs[2]])
+            rpm.assert_called_once_with([pkgs[1]])
@@ -0,0 +1,154 @@
+# vim: set fileencoding=utf-8 :
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Test L{whatmaps.dpkgdb} against a fixture database"""
+
+import os
+import unittest
+from unittest.mock import patch
+
+from whatmaps.debiandistro import DebianDistro
+from whatmaps.debianpkg import DebianPkg
+from whatmaps.dpkgdb import DpkgDatabase
+from whatmaps.pkg import PkgError
+from whatmaps.pkgindex import PkgIndex
+
+from . import context
+
+STATUS = """Package: libfoo1
+Status: install ok installed
+Multi-Arch: same
+Architecture: amd64
+
+Package: libfoo1
+Status: install ok installed
+Multi-Arch: same
+Architecture: i386
+
+Package: apackage
+Status: install ok installed
+Architecture: amd64
+
+Package: purged
+Status: purge ok not-installed
+Architecture: amd64
+
+Package: diverter
+Status: install ok installed
+Architecture: all
+"""
+
+LISTS = {
+    'libfoo1:amd64': ['/.', '/usr/lib/x86_64-linux-gnu/libfoo.so.1'],
+    'libfoo1:i386': ['/.', '/usr/lib/i386-linux-gnu/libfoo.so.1'],
+    'apackage': ['/.', '/usr/sbin/adaemon', '/etc/init.d/adaemon'],
+    'purged': ['/usr/bin/gone'],
+    'diverter': ['/.', '/usr/sbin/adaemon'],
+}
+
+DIVERSIONS = """/usr/sbin/adaemon
+/usr/sbin/adaemon.distrib
+diverter
+"""
+
+
+class TestDpkgDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+        self.root = str(self.tmpdir)
+        admindir = self.tmpdir.join('var', 'lib', 'dpkg')
+        os.makedirs(os.path.join(admindir, 'info'))
+        with open(os.path.join(admindir, 'status'), 'w') as f:
+            f.write(STATUS)
+        with open(os.path.join(admindir, 'diversions'), 'w') as f:
+            f.write(DIVERSIONS)
+        for name, files in LISTS.items():
+            with open(os.path.join(admindir, 'info', '%s.list' % name), 'w') as f:
+                f.write('\n'.join(files) + '\n')
+        self.db = DpkgDatabase(self.root)
+
+    def test_open(self):
+        self.assertIsInstance(DpkgDatabase.open(self.root), DpkgDatabase)
+        self.assertIsNone(DpkgDatabase.open(self.tmpdir.join('doesnotexist')))
+
+    def test_status(self):
+        self.assertEqual(self.db.status, {'libfoo1': ['amd64', 'i386'],
+                                          'apackage': ['amd64'],
+                                          'diverter': ['all']})
+
+    def test_stamps(self):
+        stamps = self.db.stamps()
+        self.assertEqual(sorted(stamps.keys()), ['apackage', 'diverter', 'libfoo1'])
+        self.assertRegex(stamps['libfoo1'], r'^\d+ libfoo1:amd64@\d+ libfoo1:i386@\d+$')
+        stamp = self.db.stamp()
+        os.utime(self.tmpdir.join('var', 'lib', 'dpkg', 'diversions'), ns=(0, 0))
+        self.assertNotEqual(self.db.stamp(), stamp)
+        self.assertEqual(self.db.stamps()['apackage'].split()[0], '0')
+
+    def test_contents_multiarch(self):
+        self.assertEqual(list(self.db.contents('libfoo1')),
+                         ['/usr/lib/x86_64-linux-gnu/libfoo.so.1',
+                          '/usr/lib/i386-linux-gnu/libfoo.so.1'])
+        self.assertEqual(list(self.db.contents('libfoo1:i386')),
+                         ['/usr/lib/i386-linux-gnu/libfoo.so.1'])
+        self.assertIsNone(self.db.contents('libfoo1:arm64'))
+
+    def test_contents_diversions(self):
+        """Diverted files are reported at their new location"""
+        self.assertEqual(list(self.db.contents('apackage')),
+                         ['/usr/sbin/adaemon.distrib', '/etc/init.d/adaemon'])
+        self.assertEqual(list(self.db.contents('diverter')), ['/usr/sbin/adaemon'])
+
+    def test_contents_not_installed(self):
+        self.assertIsNone(self.db.contents('purged'))
+        self.assertIsNone(self.db.contents('doesnotexist'))
+
+    def test_owner(self):
+        self.assertEqual(self.db.owner('/usr/lib/i386-linux-gnu/libfoo.so.1'), 'libfoo1')
+        self.assertEqual(self.db.owner('/usr/sbin/adaemon'), 'diverter')
+        self.assertEqual(self.db.owner('/usr/sbin/adaemon.distrib'), 'apackage')
+        self.assertIsNone(self.db.owner('/usr/bin/gone'))
+
+    def test_index(self):
+        """The persistent index gives the same answers as the database"""
+        index = PkgIndex.open(self.db, self.tmpdir.join('cache'))
+        self.assertEqual(index.sync(), 3)
+        self.assertEqual(sorted(index.contents('apackage')),
+                         sorted(self.db.contents('apackage')))
+        self.assertEqual(index.owner('/usr/sbin/adaemon'), 'diverter')
+        self.assertEqual(index.owner('/usr/sbin/adaemon.distrib'), 'apackage')
+        self.assertEqual(list(index.contents('libfoo1:i386')),
+                         ['/usr/lib/i386-linux-gnu/libfoo.so.1'])
+
+    def test_pkg(self):
+        """Packages use the database without invoking dpkg-query"""
+        with patch('subprocess.Popen') as mock:
+            pkg = DebianPkg('apackage', root=self.root)
+            DebianPkg.load_contents([pkg])
+            self.assertEqual(pkg.services, ['adaemon'])
+            self.assertRaises(PkgError, getattr,
+                              DebianPkg('purged', root=self.root), 'shared_objects')
+            self.assertFalse(mock.called)
+
+    def test_pkg_by_file(self):
+        with patch('subprocess.Popen') as mock, \
+                patch.dict(DpkgDatabase._databases, {None: self.db}):
+            pkg = DebianDistro.pkg_by_file('/usr/lib/x86_64-linux-gnu/libfoo.so.1')
+            self.assertEqual(pkg.name, 'libfoo1')
+            self.assertIsNone(DebianDistro.pkg_by_file('/doesnotexist'))
+            self.assertFalse(mock.called)
+
+    def tearDown(self):
+        DpkgDatabase._databases.pop(self.root, None)
+        context.teardown()
@@ -0,0 +1,146 @@
+# vim: set fileencoding=utf-8 :
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Test L{whatmaps.mapsindex}"""
+
+import os
+import unittest
+
+from whatmaps.mapsindex import FileIdCache, MapsIndex
+from whatmaps.process import Process as RealProcess
+
+from . import context
+
+
+class Process(object):
+    def __init__(self, pid, exe, mapped):
+        self.pid = pid
+        self.exe = exe
+        self.mapped = set(mapped)
+        self.nr_maps = len(mapped)
+
+    def mapped_objects(self):
+        return self.mapped
+
+    def find_mapped(self, targets):
+        for path in sorted(self.mapped):
+            if path.encode() in targets:
+                return path
+
+
+class TestMapsIndex(unittest.TestCase):
+    def setUp(self):
+        self.procs = [Process(1, '/usr/sbin/a', ['/lib/libc.so.6', '/lib/libz.so.1']),
+                      Process(2, '/usr/sbin/b', ['/lib/libc.so.6']),
+                      Process(3, '/usr/sbin/a', ['/lib/libz.so.1', '/lib/libssl.so.3']),
+                      Process(4, '/usr/sbin/c', ['/lib/libfoo.so.1'])]
+
+    def test_match(self):
+        """Check that processes are grouped by exe in scan order"""
+        index = MapsIndex(self.procs)
+        result = index.match(['/lib/libssl.so.3', '/lib/libz.so.1'])
+        self.assertEqual(list(result.keys()), ['/usr/sbin/a'])
+        self.assertEqual(result['/usr/sbin/a'], [self.procs[0], self.procs[2]])
+
+    def test_no_match(self):
+        index = MapsIndex(self.procs)
+        self.assertEqual(index.match(['/lib/libbar.so.1']), {})
+        self.assertEqual(index.match([]), {})
+
+    def test_procs_mapping(self):
+        index = MapsIndex(self.procs)
+        self.assertEqual(index.procs_mapping('/lib/libc.so.6'),
+                         [self.procs[0], self.procs[1]])
+        self.assertEqual(index.procs_mapping('/does/not/exist'), [])
+
+    def test_comparisons_saved(self):
+        index = MapsIndex(self.procs)
+        self.assertEqual(index.nr_maps, 6)
+        index.match(['/lib/libc.so.6', '/lib/libbar.so.1'])
+        # procs 1 and 2 match on the first object, 3 and 4 check both
+        self.assertEqual(index.comparisons_saved, (2 + 1 + 2 * 2 + 1 * 2) - 2)
+
+    def test_targets(self):
+        """Check that only targets get indexed"""
+        targets = ['/lib/libssl.so.3', '/lib/libc.so.6']
+        index = MapsIndex(self.procs, targets)
+        result = index.match(targets)
+        self.assertEqual(sorted(result.keys()), ['/usr/sbin/a', '/usr/sbin/b'])
+        self.assertEqual(result['/usr/sbin/a'], [self.procs[0], self.procs[2]])
+        self.assertEqual(index.procs_mapping('/lib/libz.so.1'), [])
+
+    def test_jobs(self):
+        """Check that reading the maps in parallel gives the same index"""
+        targets = ['/lib/libssl.so.3', '/lib/libc.so.6']
+        serial = MapsIndex(self.procs, targets)
+        parallel = MapsIndex(self.procs, targets, jobs=3)
+        self.assertEqual(parallel.match(targets), serial.match(targets))
+        self.assertEqual(parallel.nr_maps, serial.nr_maps)
+
+
+class TestMapsIndexInodes(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+        self.procfs = self.tmpdir.join('proc')
+        # Emulate merged /usr
+        os.makedirs(self.tmpdir.join('usr', 'lib'))
+        os.symlink('usr/lib', self.tmpdir.join('lib'))
+        self.so = self.tmpdir.join('usr', 'lib', 'libfoo.so.1')
+        with open(self.so, 'w') as f:
+            f.write('')
+        st = os.stat(self.so)
+        self.dev = '%02x:%02x %d' % (os.major(st.st_dev), os.minor(st.st_dev), st.st_ino)
+
+    def _add_proc(self, pid, path, dev=None):
+        os.makedirs(os.path.join(self.procfs, str(pid)))
+        os.symlink('/usr/bin/a', os.path.join(self.procfs, str(pid), 'exe'))
+        with open(os.path.join(self.procfs, str(pid), 'maps'), 'w') as f:
+            f.write('7f32b4521000-7f32b4623000 r--p 00020000 %s %s\n' % (dev or self.dev, path))
+        return RealProcess(pid, self.procfs)
+
+    def test_alias(self):
+        """Check that objects mapped via a different path match"""
+        procs = [self._add_proc(1, self.tmpdir.join('lib', 'libfoo.so.1')),
+                 self._add_proc(2, '/somewhere/else', '00:00 1')]
+        targets = [self.so]
+        self.assertEqual(MapsIndex(procs, targets).match(targets), {})
+        result = MapsIndex(procs, targets, inodes=True).match(targets)
+        self.assertEqual(result, {'/usr/bin/a': [procs[0]]})
+
+    def test_other_device(self):
+        """Check that a device differing from st_dev as on btrfs matches"""
+        ino = os.stat(self.so).st_ino
+        procs = [self._add_proc(1, self.tmpdir.join('lib', 'libfoo.so.1'), '00:2a %d' % ino),
+                 self._add_proc(2, '/somewhere/else', '00:2a %d' % ino)]
+        targets = [self.so]
+        result = MapsIndex(procs, targets, inodes=True).match(targets)
+        self.assertEqual(result, {'/usr/bin/a': [procs[0]]})
+
+    def test_deleted(self):
+        """Check that replaced objects match via their canonical path"""
+        procs = [self._add_proc(1, '%s (deleted)' % self.tmpdir.join('lib', 'libfoo.so.1'),
+                                '00:00 1')]
+        targets = [self.so]
+        result = MapsIndex(procs, targets, inodes=True).match(targets)
+        self.assertEqual(result, {'/usr/bin/a': [procs[0]]})
+
+    def test_cache(self):
+        cache = FileIdCache()
+        self.assertIsNone(cache.file_id('/does/not/exist'))
+        self.assertEqual(cache.file_id(self.so)[2], os.stat(self.so).st_ino)
+        self.assertEqual(cache.realpath(self.tmpdir.join('lib', 'libfoo.so.1')),
+                         os.path.realpath(self.so))
+
+    def tearDown(self):
+        context.teardown()
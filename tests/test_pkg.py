@@ -14,10 +14,12 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Test L{whatmaps.process} config"""
 
+import io
+import re
 import unittest
 from unittest.mock import patch
 
-from whatmaps.pkg import Pkg, PkgError
+from whatmaps.pkg import Pkg, PkgContents, PkgError
 
 from . import context
 
@@ -40,22 +42,19 @@ class TestPkg(unittest.TestCase):
             p = Pkg('doesnotmatter')
             p._list_contents = '/does/not/matter'
             PopenMock = mock.return_value
-            PopenMock.communicate.return_value = [
-                b'/package/content',
-                b'/more/package/content',
-            ]
-            PopenMock.returncode = 0
+            PopenMock.stdout = io.BytesIO(b'/package/content.so\n/package/content\n')
+            PopenMock.wait.return_value = 0
             result = p._get_contents()
-            self.assertIn('/package/content', result)
-            self.assertNotIn('/more/package/content', result)
+            self.assertIsInstance(result, PkgContents)
+            self.assertEqual(list(result), ['/package/content.so'])
 
             # We want to check that we don't invoke Popen on
             # a second call so let it fail
-            PopenMock.returncode = 1
+            PopenMock.wait.return_value = 1
 
             result = p._get_contents()
-            self.assertIn('/package/content', result)
-            self.assertNotIn('/more/package/content', result)
+            self.assertEqual(list(result), ['/package/content.so'])
+            self.assertEqual(mock.call_count, 1)
 
     def test_shared_objects(self):
         """Test that we properly match shared objects"""
@@ -63,25 +62,24 @@ class TestPkg(unittest.TestCase):
             p = Pkg('doesnotmatter')
             p._list_contents = '/does/not/matter'
             PopenMock = mock.return_value
-            PopenMock.communicate.return_value = [b'\n'.join([
+            PopenMock.stdout = io.BytesIO(b'\n'.join([
                 b'/lib/foo.so.1',
                 b'/lib/bar.so',
                 b'/not/a/shared/object',
                 b'/not/a/shared/object.soeither',
-            ])]
-            PopenMock.returncode = 0
+            ]))
+            PopenMock.wait.return_value = 0
             result = p.shared_objects
             self.assertIn('/lib/foo.so.1', result)
             self.assertIn('/lib/bar.so', result)
-            self.assertNotIn('/not/a/shred/object', result)
-            self.assertNotIn('/not/a/shred/object.soeither', result)
+            self.assertNotIn('/not/a/shared/object', result)
+            self.assertNotIn('/not/a/shared/object.soeither', result)
 
             # We want to check that we don't invoke Popen on
             # a second call so let it fail.
-            PopenMock.returncode = 1
-            result = p._get_contents()
-            self.assertIn('/lib/foo.so.1', result)
-            self.assertNotIn('/not/a/shred/object', result)
+            PopenMock.wait.return_value = 1
+            result = p.shared_objects
+            self.assertEqual(result, ['/lib/foo.so.1', '/lib/bar.so'])
 
     def test_shared_object_error(self):
         """Test that we raise PkgError"""
@@ -89,8 +87,8 @@ class TestPkg(unittest.TestCase):
             p = Pkg('doesnotmatter')
             p._list_contents = '/does/not/matter'
             PopenMock = mock.return_value
-            PopenMock.communicate.return_value = ['']
-            PopenMock.returncode = 1
+            PopenMock.stdout = io.BytesIO(b'')
+            PopenMock.wait.return_value = 1
             try:
                 p.shared_objects
                 self.fail("PkgError exception not raised")
@@ -99,5 +97,20 @@ class TestPkg(unittest.TestCase):
             except Exception as e:
                 self.fail("Raised '%s is not PkgError" % e)
 
+    def test_classify(self):
+        """Only shared objects and service files are kept"""
+        class InitPkg(Pkg):
+            _init_script_re = re.compile(r'/etc/init.d/[\w\-\.]')
+
+        contents = InitPkg._classify(['/lib/libfoo.so.1\n',
+                                      '/etc/init.d/foo\n',
+                                      '/lib/systemd/system/foo.service\n',
+                                      '/usr/lib/systemd/system/bar.service',
+                                      '/usr/share/doc/foo/README\n'])
+        self.assertEqual(contents.shared_objects, ['/lib/libfoo.so.1'])
+        self.assertEqual(contents.init_scripts, ['/etc/init.d/foo'])
+        self.assertEqual(contents.units, ['/lib/systemd/system/foo.service',
+                                          '/usr/lib/systemd/system/bar.service'])
+
     def tearDown(self):
         context.teardown()
@@ -0,0 +1,99 @@
+# vim: set fileencoding=utf-8 :
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Test L{whatmaps.pkgindex}"""
+
+import unittest
+
+from whatmaps.pkgindex import PkgIndex
+
+from . import context
+
+
+class Source(object):
+    def __init__(self):
+        self.pkgs = {
+            'libfoo1': ('1', ['/lib/libfoo.so.1', '/usr/share/doc/libfoo1']),
+            'apackage': ('1', ['/usr/sbin/adaemon', '/etc/init.d/adaemon']),
+        }
+        self.read = []
+
+    def stamp(self):
+        return ' '.join('%s=%s' % (name, pkg[0]) for name, pkg in sorted(self.pkgs.items()))
+
+    def stamps(self):
+        return {name: pkg[0] for name, pkg in self.pkgs.items()}
+
+    def contents(self, name):
+        self.read.append(name)
+        return self.pkgs[name][1] if name in self.pkgs else None
+
+
+class TestPkgIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+        self.source = Source()
+        self.index = PkgIndex.open(self.source, str(self.tmpdir))
+
+    def test_lookup(self):
+        self.assertEqual(list(self.index.contents('libfoo1')),
+                         ['/lib/libfoo.so.1', '/usr/share/doc/libfoo1'])
+        self.assertEqual(self.index.owner('/usr/sbin/adaemon'), 'apackage')
+        self.assertIsNone(self.index.owner('/usr/sbin/unknown'))
+        self.assertIsNone(self.index.contents('doesnotexist'))
+        self.assertEqual(sorted(self.source.read), ['apackage', 'libfoo1'])
+
+    def test_contents_streamed(self):
+        """Files are read while iterating, errors surface as OSError"""
+        contents = self.index.contents('libfoo1')
+        self.assertEqual(next(contents), '/lib/libfoo.so.1')
+        self.index.close()
+        self.assertRaises(OSError, list, contents)
+
+    def test_persistent(self):
+        """A second index on the same file doesn't read the source again"""
+        self.assertEqual(self.index.sync(), 2)
+        self.source.read = []
+        index = PkgIndex.open(self.source, str(self.tmpdir))
+        self.assertEqual(index.sync(), 0)
+        self.assertEqual(index.owner('/lib/libfoo.so.1'), 'libfoo1')
+        self.assertEqual(self.source.read, [])
+
+    def test_invalidation(self):
+        """Only changed packages are reindexed"""
+        self.index.sync()
+        self.source.read = []
+        self.source.pkgs['libfoo1'] = ('2', ['/lib/libfoo.so.2'])
+        del self.source.pkgs['apackage']
+        self.assertEqual(self.index.sync(), 1)
+        self.assertEqual(self.source.read, ['libfoo1'])
+        self.assertEqual(self.index.owner('/lib/libfoo.so.2'), 'libfoo1')
+        self.assertIsNone(self.index.owner('/lib/libfoo.so.1'))
+        self.assertIsNone(self.index.contents('apackage'))
+
+    def test_schema_version(self):
+        """The index is rebuilt on schema changes"""
+        self.index.sync()
+        PkgIndex.version += 1
+        try:
+            index = PkgIndex.open(self.source, str(self.tmpdir))
+            self.assertEqual(index.sync(), 2)
+        finally:
+            PkgIndex.version -= 1
+
+    def test_unusable(self):
+        self.assertIsNone(PkgIndex.open(self.source, '/proc/doesnotexist'))
+
+    def tearDown(self):
+        context.teardown()
@@ -17,7 +17,10 @@
 import os
 import unittest
 import random
+from unittest.mock import patch
 
+import whatmaps.process
+from whatmaps.mapsindex import FileIdCache
 from whatmaps.process import Process
 
 from . import context
@@ -58,6 +61,12 @@ class TestWhatmapsProcess(unittest.TestCase):
         f.write(text)
         f.close()
 
+    def _write_stat(self, comm, flags):
+        f = open(os.path.join(self.piddir, 'stat'), 'w')
+        f.write('%d (%s) S 2 0 0 0 -1 %d 0 0 0 0 0 0 0 0 20 0 1 0 123 0 0\n'
+                % (self.pid, comm, flags))
+        f.close()
+
     def _write_maps(self, data):
         f = open(self.maps, 'w')
         f.write('\n'.join([' '.join(r) for r in data]))
@@ -97,6 +106,85 @@ class TestWhatmapsProcess(unittest.TestCase):
         self.assertFalse(p.maps('/does/not/exist'))
         self.assertTrue(p.maps('/lib/x86_64-linux-gnu/libselinux.so.1'))
 
+    def test_maps_deleted(self):
+        """Check that replaced objects still match"""
+        self._write_maps([['7f32b4521000-7f32b4623000', 'r--p', '00020000',
+                           'fe:02', '1704011', '/lib/libz.so.1 (deleted)'],
+                          ['7ffd1c9d7000-7ffd1c9f8000', 'rw-p', '00000000',
+                           '00:00', '0', '[stack]']])
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertEqual(p.mapped_objects(), set(['/lib/libz.so.1']))
+        self.assertEqual(p.nr_maps, 2)
+
+    def test_maps_chunked(self):
+        """Check that lines crossing buffer boundaries are handled"""
+        paths = ['/usr/lib/x86_64-linux-gnu/lib%d.so.%d' % (i, i) for i in range(200)]
+        self._write_maps([['7f32b4521000-7f32b4623000', 'r--p', '00020000',
+                           'fe:02', '1704011', path] for path in paths] +
+                         [['7f32b4521000-7f32b4623000', 'r--p', '00000000',
+                           '00:00', '0']])
+        with patch('whatmaps.process.MAPS_BUFSIZE', 16):
+            whatmaps.process._maps_buffer.buf = None
+            p = Process(self.pid, procfs=self.procfs)
+            self.assertEqual(p.mapped_objects(), set(paths))
+            self.assertEqual(p.nr_maps, 201)
+        whatmaps.process._maps_buffer.buf = None
+
+    def test_find_mapped(self):
+        """Check that we stop reading at the first match"""
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertIsNone(p.find_mapped(set([b'/does/not/exist'])))
+        self.assertEqual(p.nr_maps, 2)
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertEqual(p.find_mapped(set([b'/lib/x86_64-linux-gnu/libselinux.so.1'])),
+                         '/lib/x86_64-linux-gnu/libselinux.so.1')
+        self.assertEqual(p.nr_maps, 1)
+        self.assertIsNone(p.mapped)
+
+    def test_find_mapped_id(self):
+        """Check matching by device and inode"""
+        ids = {1704011: ((0xfe, 2), 'libselinux')}
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertEqual(p.find_mapped_id(ids, lambda path: None), 'libselinux')
+        self.assertIsNone(p.find_mapped_id({1: ((0xfe, 2), 'other')}, lambda path: None))
+
+    def test_find_mapped_id_other_device(self):
+        """Mappings with another device than st_dev are resolved by path"""
+        ids = {1704011: ((0, 42), 'libselinux')}
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertIsNone(p.find_mapped_id(ids, lambda path: None))
+        resolve = {'/lib/x86_64-linux-gnu/libselinux.so.1': 'libselinux'}.get
+        self.assertEqual(p.find_mapped_id(ids, resolve), 'libselinux')
+
+    def test_find_mapped_id_deleted(self):
+        """Deleted mappings are resolved by path"""
+        self._write_maps([['7f32b4521000-7f32b4623000', 'r--p', '00020000',
+                           'fe:02', '1704011', '/lib/libz.so.1 (deleted)']])
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertIsNone(p.find_mapped_id({1704011: ((0xfe, 2), 'libz')}, lambda path: None))
+        self.assertEqual(p.find_mapped_id({}, {'/lib/libz.so.1': 'libz'}.get), 'libz')
+
+    def test_find_deleted_mapping(self):
+        """Check detection of deleted and replaced files"""
+        so = '/usr/lib/libfoo.so.1'
+        line = ['7f32b4521000-7f32b4623000', 'r--p', '00020000', 'fe:02']
+        cache = FileIdCache()
+        cache._ids[so] = (0xfe, 2, 1704011)
+
+        self._write_maps([line + ['1704011', so],
+                          line + ['1', '/memfd:foo (deleted)'],
+                          line + ['2', '/dev/shm/bar (deleted)']])
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertIsNone(p.find_deleted_mapping(cache))
+
+        self._write_maps([line + ['1', '/lib/libz.so.1 (deleted)']])
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertEqual(p.find_deleted_mapping(cache), '/lib/libz.so.1')
+
+        self._write_maps([line + ['1', so]])
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertEqual(p.find_deleted_mapping(cache), so)
+
     def test_no_maps(self):
         """Check if we don't fail if the process went away"""
         os.unlink(self.maps)
@@ -112,6 +200,60 @@ class TestWhatmapsProcess(unittest.TestCase):
         self.assertFalse(p.maps('/does/not/exist'))
         self.assertFalse(p.maps('/lib/x86_64-linux-gnu/libselinux.so.1'))
 
+    def test_lazy(self):
+        """Check that exe and cmdline are only read once and on demand"""
+        with patch('os.readlink', wraps=os.readlink) as mock:
+            p = Process(self.pid, procfs=self.procfs)
+            self.assertEqual(mock.call_count, 0)
+            p.exe
+            p.deleted
+            p.cmdline
+            self.assertEqual(mock.call_count, 1)
+
+    def test_slots(self):
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertRaises(AttributeError, setattr, p, 'doesnotexist', 1)
+
+    def test_kernel_thread(self):
+        self._write_stat('kworker/0:1 (x)', Process.PF_KTHREAD | 0x40)
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertTrue(p.is_kernel_thread)
+
+    def test_start_time(self):
+        with open(os.path.join(self.procfs, 'stat'), 'w') as f:
+            f.write('cpu  1 2 3 4\nbtime 1000\nprocesses 5\n')
+        whatmaps.process._boot_times.pop(self.procfs, None)
+        self._write_stat('acommand', 0)
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertEqual(p.start_time, 1000 + 123 / os.sysconf('SC_CLK_TCK'))
+
+    def test_no_kernel_thread(self):
+        self._write_stat('acommand', 0x400100)
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertFalse(p.is_kernel_thread)
+        os.unlink(os.path.join(self.piddir, 'stat'))
+        p = Process(self.pid, procfs=self.procfs)
+        self.assertFalse(p.is_kernel_thread)
+
+    def test_cgroup(self):
+        path = os.path.join(self.piddir, 'cgroup')
+        with open(path, 'w') as f:
+            f.write('0::/system.slice/cron.service\n')
+        self.assertEqual(Process(self.pid, procfs=self.procfs).cgroup,
+                         '/system.slice/cron.service')
+        # Hybrid setups
+        with open(path, 'w') as f:
+            f.write('4:memory:/elsewhere\n'
+                    '1:name=systemd:/system.slice/ssh.service\n'
+                    '0::/\n')
+        self.assertEqual(Process(self.pid, procfs=self.procfs).cgroup,
+                         '/system.slice/ssh.service')
+        with open(path, 'w') as f:
+            f.write('4:memory:/elsewhere\n')
+        self.assertIsNone(Process(self.pid, procfs=self.procfs).cgroup)
+        os.unlink(path)
+        self.assertIsNone(Process(self.pid, procfs=self.procfs).cgroup)
+
     @unittest.skipIf(os.getuid() == 0, "Skip if root")
     def test_broken_unreadable_map(self):
         """Raise error if map file is unreadable"""
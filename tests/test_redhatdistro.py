@@ -22,6 +22,12 @@ from whatmaps.rpmpkg import RpmPkg
 
 
 class TestRedHatDistro(unittest.TestCase):
+    def setUp(self):
+        # Use rpm even if there's a readable rpm database
+        patcher = patch('whatmaps.rpmdb.RpmDatabase.open', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_vars(self):
         """Check RedHat distro vars"""
         self.assertEqual(RedHatDistro.id, None)
@@ -36,13 +42,14 @@ class TestRedHatDistro(unittest.TestCase):
         with patch('subprocess.Popen') as mock:
             PopenMock = mock.return_value
             PopenMock.returncode = 0
-            PopenMock.communicate.return_value = ['apackage']
+            PopenMock.communicate.return_value = [b'/usr/bin/other\tapackage\nafile\tapackage\n']
 
             pkg = RedHatDistro.pkg_by_file('afile')
             self.assertIsInstance(pkg, RpmPkg)
             self.assertEqual(pkg.name, 'apackage')
             PopenMock.communicate.assert_called_once_with()
-            mock.assert_called_once_with(['rpm', '-qf', 'afile'],
+            mock.assert_called_once_with(['rpm', '-qf', '--queryformat',
+                                          '[%{FILENAMES}\t%{=NAME}\n]', 'afile'],
                                          stderr=-1, stdout=-1)
 
     def test_pkg_by_file_failure(self):
@@ -50,10 +57,29 @@ class TestRedHatDistro(unittest.TestCase):
         with patch('subprocess.Popen') as mock:
             PopenMock = mock.return_value
             PopenMock.returncode = 1
-            PopenMock.communicate.return_value = ['apackage']
+            PopenMock.communicate.return_value = [b'file afile is not owned by any package\n']
 
             pkg = RedHatDistro.pkg_by_file('afile')
             self.assertIsNone(pkg)
             PopenMock.communicate.assert_called_once_with()
-            mock.assert_called_once_with(['rpm', '-qf', 'afile'],
+            mock.assert_called_once_with(['rpm', '-qf', '--queryformat',
+                                          '[%{FILENAMES}\t%{=NAME}\n]', 'afile'],
                                          stderr=-1, stdout=-1)
+
+    def test_pkgs_by_files(self):
+        """Check that all paths are looked up at once"""
+        with patch('subprocess.Popen') as mock:
+            PopenMock = mock.return_value
+            PopenMock.returncode = 1
+            PopenMock.communicate.return_value = [b'\n'.join([
+                b'/usr/sbin/a\tapackage',
+                b'/usr/sbin/b\tapackage',
+                b'/usr/share/doc/apackage\tapackage',
+                b'file /usr/sbin/c is not owned by any package',
+                b'',
+            ])]
+            pkgs = RedHatDistro.pkgs_by_files(['/usr/sbin/a', '/usr/sbin/b', '/usr/sbin/c'])
+            self.assertEqual(mock.call_count, 1)
+            self.assertEqual(pkgs['/usr/sbin/a'].name, 'apackage')
+            self.assertIs(pkgs['/usr/sbin/a'], pkgs['/usr/sbin/b'])
+            self.assertIsNone(pkgs['/usr/sbin/c'])
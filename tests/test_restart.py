@@ -0,0 +1,88 @@
+# vim: set fileencoding=utf-8 :
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Test L{whatmaps.restart}"""
+
+import subprocess
+import unittest
+from unittest.mock import patch
+
+from whatmaps.restart import Restarter
+
+from . import context
+
+
+class Distro(object):
+    @classmethod
+    def restart_service_cmd(klass, service):
+        return ['service', service, 'restart']
+
+
+class Systemd(object):
+    @staticmethod
+    def is_running():
+        return True
+
+
+class TestRestarter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+
+    def test_restart_jobs(self):
+        services = ['b.service', 'a.service', 'sysv']
+        jobs = Restarter(Distro).restart_jobs(services)
+        self.assertEqual([job.cmd for job in jobs],
+                         [['service', 'a.service', 'restart'],
+                          ['service', 'b.service', 'restart'],
+                          ['service', 'sysv', 'restart']])
+        jobs = Restarter(Distro, batch=True, systemd=Systemd).restart_jobs(services)
+        self.assertEqual([job.cmd for job in jobs],
+                         [['systemctl', 'try-restart', 'a.service', 'b.service'],
+                          ['service', 'sysv', 'restart']])
+        self.assertEqual(jobs[0].services, ['a.service', 'b.service'])
+
+    def test_restart(self):
+        def call(cmd, timeout=None):
+            self.assertEqual(timeout, 10)
+            if cmd[1] == 'hangs':
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            return 1 if cmd[1] == 'fails' else 0
+
+        with patch('subprocess.call', side_effect=call) as mock:
+            failed = Restarter(Distro, jobs=4, timeout=10).restart(['fails', 'hangs', 'works'])
+            self.assertEqual(mock.call_count, 3)
+        self.assertEqual(sorted(job.services[0] for job in failed), ['fails', 'hangs'])
+        self.assertTrue([job for job in failed if job.services == ['hangs']][0].timed_out)
+        for job in failed:
+            self.assertIsNotNone(job.duration)
+
+    def test_write_script(self):
+        path = self.tmpdir.join('restart.sh')
+        Restarter(Distro).write_script(['b', 'a'], path)
+        with open(path) as f:
+            self.assertEqual(f.read(), '#! /bin/sh\n'
+                             'service a restart\n'
+                             'service b restart\n')
+
+        Restarter(Distro, jobs=2, timeout=30).write_script(['a', 'b', 'c'], path)
+        with open(path) as f:
+            self.assertEqual(f.read(), '#! /bin/sh\n'
+                             'timeout 30 service a restart &\n'
+                             'timeout 30 service b restart &\n'
+                             'wait\n'
+                             'timeout 30 service c restart &\n'
+                             'wait\n')
+
+    def tearDown(self):
+        context.teardown()
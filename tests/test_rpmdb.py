@@ -0,0 +1,126 @@
+# vim: set fileencoding=utf-8 :
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Test L{whatmaps.rpmdb} against a fixture database"""
+
+import os
+import sqlite3
+import struct
+import unittest
+from unittest.mock import patch
+
+from whatmaps.pkg import PkgError
+from whatmaps.redhatdistro import RedHatDistro
+from whatmaps.rpmdb import RpmDatabase, RpmHeader
+from whatmaps.rpmpkg import RpmPkg
+
+from . import context
+
+PKGS = {
+    'libfoo': ['/usr/lib64/libfoo.so.1', '/usr/share/doc/libfoo/README'],
+    'adaemon': ['/usr/sbin/adaemon', '/etc/rc.d/init.d/adaemon', '/usr/lib64/libfoo.so.1.bak'],
+}
+
+
+def make_header(name, files):
+    """Build an rpm header blob like rpm stores it in the Packages table"""
+    dirnames = sorted(set(os.path.dirname(path) + '/' for path in files))
+    entries = [
+        (RpmHeader.tags['name'], RpmHeader.STRING, [name]),
+        (RpmHeader.tags['dirindexes'], RpmHeader.INT32,
+         [dirnames.index(os.path.dirname(path) + '/') for path in files]),
+        (RpmHeader.tags['basenames'], RpmHeader.STRING_ARRAY,
+         [os.path.basename(path) for path in files]),
+        (RpmHeader.tags['dirnames'], RpmHeader.STRING_ARRAY, dirnames),
+    ]
+    index = b''
+    data = b''
+    for tag, type, values in entries:
+        if type == RpmHeader.INT32:
+            data += b'\0' * (-len(data) % 4)
+            value = struct.pack('>%dI' % len(values), *values)
+        else:
+            value = b''.join(v.encode() + b'\0' for v in values)
+        index += struct.pack('>iIiI', tag, type, len(data), len(values))
+        data += value
+    return struct.pack('>II', len(entries), len(data)) + index + data
+
+
+class TestRpmDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+        self.root = str(self.tmpdir)
+        os.makedirs(self.tmpdir.join('var', 'lib', 'rpm'))
+        conn = sqlite3.connect(self.tmpdir.join('var', 'lib', 'rpm', 'rpmdb.sqlite'))
+        conn.execute('CREATE TABLE Packages (hnum INTEGER PRIMARY KEY, blob BLOB NOT NULL)')
+        for table in ['Name', 'Basenames']:
+            conn.execute('CREATE TABLE %s (key TEXT NOT NULL, hnum INTEGER NOT NULL, '
+                         'idx INTEGER NOT NULL)' % table)
+        for hnum, (name, files) in enumerate(sorted(PKGS.items()), 1):
+            conn.execute('INSERT INTO Packages VALUES (?, ?)', (hnum, make_header(name, files)))
+            conn.execute('INSERT INTO Name VALUES (?, ?, 0)', (name, hnum))
+            for idx, path in enumerate(files):
+                conn.execute('INSERT INTO Basenames VALUES (?, ?, ?)',
+                             (os.path.basename(path), hnum, idx))
+        conn.commit()
+        conn.close()
+        self.db = RpmDatabase.open(self.root)
+
+    def test_open(self):
+        self.assertIsInstance(self.db, RpmDatabase)
+        self.assertIsNone(RpmDatabase.open(self.tmpdir.join('doesnotexist')))
+
+    def test_close_all(self):
+        """Closed databases get reopened on demand"""
+        RpmDatabase.close_all()
+        self.assertRaises(OSError, self.db.contents, 'adaemon')
+        db = RpmDatabase.open(self.root)
+        self.assertIsNot(db, self.db)
+        self.assertEqual(db.contents('adaemon'), PKGS['adaemon'])
+
+    def test_header(self):
+        header = RpmHeader(make_header('libfoo', PKGS['libfoo']))
+        self.assertEqual(header.name, 'libfoo')
+        self.assertEqual(header.files, PKGS['libfoo'])
+
+    def test_contents(self):
+        self.assertEqual(self.db.contents('adaemon'), PKGS['adaemon'])
+        self.assertIsNone(self.db.contents('doesnotexist'))
+
+    def test_owner(self):
+        self.assertEqual(self.db.owner('/usr/lib64/libfoo.so.1'), 'libfoo')
+        self.assertEqual(self.db.owner('/usr/sbin/adaemon'), 'adaemon')
+        self.assertIsNone(self.db.owner('/usr/bin/adaemon'))
+        self.assertIsNone(self.db.owner('/usr/sbin/unknown'))
+
+    def test_no_rpm(self):
+        """Packages and file lookups don't invoke rpm"""
+        with patch('subprocess.Popen') as mock, \
+                patch.dict(RpmDatabase._databases, {None: self.db}):
+            pkg = RpmPkg('adaemon', root=self.root)
+            RpmPkg.load_contents([pkg])
+            self.assertEqual(pkg.services, ['adaemon'])
+            self.assertRaises(PkgError, getattr,
+                              RpmPkg('doesnotexist', root=self.root), 'shared_objects')
+            pkgs = RedHatDistro.pkgs_by_files(['/usr/lib64/libfoo.so.1',
+                                               '/usr/share/doc/libfoo/README',
+                                               '/usr/sbin/unknown'])
+            self.assertIs(pkgs['/usr/lib64/libfoo.so.1'], pkgs['/usr/share/doc/libfoo/README'])
+            self.assertEqual(pkgs['/usr/lib64/libfoo.so.1'].name, 'libfoo')
+            self.assertIsNone(pkgs['/usr/sbin/unknown'])
+            self.assertFalse(mock.called)
+
+    def tearDown(self):
+        RpmDatabase._databases.pop(self.root, None)
+        context.teardown()
@@ -14,16 +14,60 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Test L{whatmaps.process} config"""
 
+import io
+import subprocess
 import unittest
 
 from unittest.mock import patch
 
+from whatmaps.pkg import PkgError
 from whatmaps.rpmpkg import RpmPkg
 
 
 class TestRpmPkg(unittest.TestCase):
+    def setUp(self):
+        # Use rpm even if there's a readable rpm database
+        patcher = patch('whatmaps.rpmdb.RpmDatabase.open', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_services(self):
-        with patch('whatmaps.pkg.Pkg._get_contents') as mock:
-            mock.return_value = ['/etc/rc.d/init.d/aservice', '/usr/bin/afile']
+        with patch('subprocess.Popen') as mock:
+            mock.return_value.stdout = io.BytesIO(b'/etc/rc.d/init.d/aservice\n/usr/bin/afile\n')
+            mock.return_value.wait.return_value = 0
             p = RpmPkg('doesnotmatter')
             self.assertEqual(p.services, ['aservice'])
+
+    def test_root(self):
+        """Check that the package database below root is used"""
+        with patch('subprocess.Popen') as mock:
+            PopenMock = mock.return_value
+            PopenMock.stdout = io.BytesIO(b'/lib/foo.so.1\n')
+            PopenMock.wait.return_value = 0
+            p = RpmPkg('apackage', root='/proc/1/root')
+            self.assertEqual(p.shared_objects, ['/lib/foo.so.1'])
+            mock.assert_called_once_with(['rpm', '--root', '/proc/1/root',
+                                          '-ql', 'apackage'],
+                                         stderr=subprocess.DEVNULL, stdout=-1)
+
+    def test_load_contents(self):
+        """Check that contents of several packages are listed at once"""
+        with patch('subprocess.Popen') as mock:
+            PopenMock = mock.return_value
+            PopenMock.stdout = io.BytesIO(b'\n'.join([
+                b'apackage\t/lib/foo.so.1',
+                b'apackage\t/etc/rc.d/init.d/aservice',
+                b'package notinstalled is not installed',
+                b'',
+            ]))
+            PopenMock.wait.return_value = 1
+            pkgs = [RpmPkg('apackage'), RpmPkg('notinstalled')]
+            RpmPkg.load_contents(pkgs)
+            mock.assert_called_once_with(['rpm', '-q', '--queryformat',
+                                          '[%{=NAME}\t%{FILENAMES}\n]',
+                                          'apackage', 'notinstalled'],
+                                         stderr=subprocess.DEVNULL, stdout=-1)
+            self.assertEqual(pkgs[0].shared_objects, ['/lib/foo.so.1'])
+            self.assertEqual(pkgs[0].services, ['aservice'])
+            PopenMock.stdout = io.BytesIO(b'')
+            self.assertRaises(PkgError, getattr, pkgs[1], 'shared_objects')
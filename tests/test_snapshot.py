@@ -0,0 +1,138 @@
+# vim: set fileencoding=utf-8 :
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Test L{whatmaps.snapshot}"""
+
+import io
+import os
+import unittest
+from unittest.mock import patch
+
+from whatmaps.command import get_all_pids, main
+from whatmaps.debianpkg import DebianPkg
+from whatmaps.pkg import PkgError
+from whatmaps.snapshot import (ReplayDistro, ReplaySystemd, Snapshot,
+                               SnapshotError)
+
+from . import context
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+        self.procfs = self.tmpdir.join('proc')
+        os.mkdir(self.procfs)
+        with open(os.path.join(self.procfs, 'stat'), 'w') as f:
+            f.write('btime 1000\n')
+        self._add_proc(10, '/usr/sbin/foo', ['/lib/libfoo.so.1', '/lib/libc.so.6'])
+        self._add_proc(11, '/usr/sbin/bar', ['/lib/libc.so.6 (deleted)'])
+        self.file = self.tmpdir.join('snapshot.gz')
+
+    def _add_proc(self, pid, exe, mapped):
+        piddir = os.path.join(self.procfs, str(pid))
+        os.mkdir(piddir)
+        os.symlink(exe, os.path.join(piddir, 'exe'))
+        with open(os.path.join(piddir, 'stat'), 'w') as f:
+            f.write('%d (foo) S 1 0 0 0 -1 4194560 0 0 0 0 0 0 0 0 20 0 1 0 123 0 0\n' % pid)
+        with open(os.path.join(piddir, 'maps'), 'w') as f:
+            for path in mapped:
+                f.write('7f32b4521000-7f32b4623000 r--p 00020000 fe:02 1704011 %s\n' % path)
+                f.write('7ffd1c9d7000-7ffd1c9f8000 rw-p 00000000 00:00 0 [stack]\n')
+
+    def _record(self):
+        snapshot = Snapshot()
+        snapshot.distro = 'DebianDistro'
+        snapshot.systemd = True
+        snapshot.pkgs = ['libfoo1']
+        snapshot.add_procs(get_all_pids(procfs=self.procfs))
+        pkg = DebianPkg('libfoo1')
+        pkg._contents = ['/lib/libfoo.so.1', '/usr/share/doc/libfoo1', '']
+        snapshot.add_pkgs([pkg, DebianPkg('notlisted')])
+        snapshot.units = {10: 'foo.service', 11: {'error': 'no unit'}}
+        snapshot.save(self.file)
+        return snapshot
+
+    def test_roundtrip(self):
+        recorded = self._record()
+        self.assertEqual(len(recorded.paths), 3)
+        snapshot = Snapshot.load(self.file)
+        self.assertEqual(snapshot.btime, 1000)
+        self.assertEqual(snapshot.procs, recorded.procs)
+        self.assertEqual(list(snapshot.contents.keys()), ['libfoo1'])
+
+        replay = self.tmpdir.join('replay')
+        os.mkdir(replay)
+        snapshot.write_procfs(replay)
+        live = get_all_pids(procfs=self.procfs)
+        replayed = get_all_pids(procfs=replay)
+        self.assertEqual([(p.pid, p.exe, p.deleted, p.mapped_entries(), p.start_time) for p in replayed],
+                         [(p.pid, p.exe, p.deleted, p.mapped_entries(), p.start_time) for p in live])
+
+    def test_load_errors(self):
+        self.assertRaises(SnapshotError, Snapshot.load, '/does/not/exist')
+        self._record()
+        with patch.object(Snapshot, 'version', 2):
+            self.assertRaises(SnapshotError, Snapshot.load, self.file)
+
+    def test_replay_distro(self):
+        self._record()
+        distro = ReplayDistro(Snapshot.load(self.file))
+        self.assertEqual(distro.id, 'Debian')
+        pkg = distro.pkg('libfoo1')
+        self.assertIsInstance(pkg, DebianPkg)
+        self.assertEqual(pkg.shared_objects, ['/lib/libfoo.so.1'])
+        self.assertRaises(PkgError, getattr, distro.pkg('notlisted'), 'shared_objects')
+        self.assertIsNone(distro.pkg_by_file('/usr/sbin/foo'))
+
+    def test_replay_pkgs_by_files(self):
+        self._record()
+        snapshot = Snapshot.load(self.file)
+        snapshot.files = {'/usr/sbin/foo': 'foo', '/usr/sbin/foo2': 'foo'}
+        pkgs = ReplayDistro(snapshot).pkgs_by_files(['/usr/sbin/foo', '/usr/sbin/foo2',
+                                                      '/usr/sbin/bar'])
+        self.assertEqual(pkgs['/usr/sbin/foo'].name, 'foo')
+        self.assertIs(pkgs['/usr/sbin/foo'], pkgs['/usr/sbin/foo2'])
+        self.assertIsNone(pkgs['/usr/sbin/bar'])
+
+    def test_replay_systemd(self):
+        self._record()
+        systemd = ReplaySystemd(Snapshot.load(self.file))
+        procs = get_all_pids(procfs=self.procfs)
+        self.assertTrue(systemd.is_running())
+        self.assertEqual(systemd.process_to_unit(procs[0]), 'foo.service')
+        self.assertRaisesRegex(ValueError, 'no unit', systemd.process_to_unit, procs[1])
+
+    def test_replay_main(self):
+        """Check that a full run works from the snapshot alone"""
+        self._record()
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            with patch('subprocess.Popen', side_effect=AssertionError("Popen called")):
+                ret = main(['whatmaps', '--replay', self.file])
+        self.assertEqual(ret, 0)
+        self.assertEqual(stdout.getvalue(),
+                         'Services that possibly need to be restarted:\nfoo.service\n')
+
+    def test_replay_deleted(self):
+        """--deleted looks at the live system so it can't be replayed"""
+        self._record()
+        self.assertEqual(main(['whatmaps', '--replay', self.file, '--deleted']), 1)
+
+    def test_replay_restart(self):
+        """Services of a snapshot must not be restarted on the live system"""
+        self._record()
+        with patch('subprocess.call', side_effect=AssertionError("restarted")):
+            self.assertEqual(main(['whatmaps', '--replay', self.file, '--restart']), 1)
+
+    def tearDown(self):
+        context.teardown()
@@ -14,16 +14,20 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Test L{whatmaps.process} config"""
 
+import os
 import unittest
 
 from unittest.mock import patch
 
 from whatmaps.systemd import Systemd
 
+from . import context
+
 
 class Process(object):
-    def __init__(self, pid):
+    def __init__(self, pid, cgroup=None):
         self.pid = pid
+        self.cgroup = cgroup
 
 
 class TestSystemd(unittest.TestCase):
@@ -81,3 +85,52 @@ class TestSystemd(unittest.TestCase):
                 PopenMock.returncode = 0
                 with self.assertRaisesRegex(ValueError, "Can't parse service name from session-8762.scope - Session 8762 of user root"):
                     Systemd().process_to_unit(p)
+
+    def test_cgroup_to_unit(self):
+        self.assertEqual(Systemd.cgroup_to_unit('/system.slice/cron.service'),
+                         'cron.service')
+        self.assertEqual(Systemd.cgroup_to_unit('/system.slice/system-getty.slice/'
+                                                'getty@tty1.service'),
+                         'getty@tty1.service')
+        # Delegated subtrees belong to their unit
+        self.assertEqual(Systemd.cgroup_to_unit('/system.slice/libvirtd.service/payload'),
+                         'libvirtd.service')
+        self.assertIsNone(Systemd.cgroup_to_unit('/'))
+        with self.assertRaisesRegex(ValueError, "user session session-8762.scope"):
+            Systemd.cgroup_to_unit('/user.slice/user-0.slice/session-8762.scope')
+        with self.assertRaisesRegex(ValueError, "user manager user@1000.service"):
+            Systemd.cgroup_to_unit('/user.slice/user-1000.slice/user@1000.service/'
+                                   'app.slice/foo.service')
+        with self.assertRaisesRegex(ValueError, "init.scope"):
+            Systemd.cgroup_to_unit('/init.scope')
+
+    def test_process_to_unit_cgroup(self):
+        """The cgroup is used without invoking systemctl"""
+        with patch('subprocess.Popen') as mock:
+            self.assertEqual(Systemd.process_to_unit(Process(952, '/system.slice/cron.service')),
+                             'cron.service')
+            self.assertFalse(mock.called)
+
+    def test_unit_pids(self):
+        tmpdir = context.new_tmpdir(__name__)
+        self.addCleanup(context.teardown)
+        cgroups = {'': [1, 2],
+                   'init.scope': [3],
+                   'system.slice/cron.service': [10],
+                   'system.slice/apache2.service': [20, 21],
+                   'system.slice/apache2.service/sub': [22],
+                   'system.slice/empty.service': [],
+                   'user.slice/user-0.slice/session-1.scope': [30]}
+        hierarchy = tmpdir.join('unified')
+        for path, pids in cgroups.items():
+            os.makedirs(os.path.join(hierarchy, path), exist_ok=True)
+            with open(os.path.join(hierarchy, path, 'cgroup.procs'), 'w') as f:
+                f.write(''.join('%d\n' % pid for pid in pids))
+        units, others = Systemd.unit_pids(str(tmpdir))
+        self.assertEqual(units, {'cron.service': [10], 'apache2.service': [20, 21, 22]})
+        self.assertEqual(sorted(others), [1, 2, 3, 30])
+        self.assertIsNone(Systemd.unit_pids(tmpdir.join('doesnotexist')))
+        self.assertEqual(Systemd.units_pids(['apache2.service', 'session-1.scope',
+                                             'empty.service', 'gone.service'],
+                                            str(tmpdir)),
+                         {'apache2.service': [20, 21, 22], 'session-1.scope': [30]})
@@ -0,0 +1,58 @@
+# vim: set fileencoding=utf-8 :
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Test L{whatmaps.watch}"""
+
+import os
+import unittest
+from unittest.mock import Mock
+
+from whatmaps.watch import Watcher
+
+from . import context
+
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+        self.sos = [self.tmpdir.join('libfoo.so.1'), self.tmpdir.join('libbar.so.1')]
+        for so in self.sos:
+            self._write(so)
+
+    def _write(self, path):
+        with open(path, 'w') as f:
+            f.write('')
+
+    def _replace(self, path):
+        self._write(path + '.dpkg-new')
+        os.rename(path + '.dpkg-new', path)
+
+    def test_batch(self):
+        """Check that replacements are reported in one batch"""
+        watcher = Watcher(self.sos, delay=0.1)
+        self._write(self.tmpdir.join('unrelated'))
+        self._replace(self.sos[0])
+        self._replace(self.sos[1])
+        self.assertEqual(watcher.next_batch(), set(self.sos))
+
+    def test_overflow(self):
+        inotify = Mock()
+        inotify.fileno.return_value = os.open(os.devnull, os.O_RDONLY)
+        inotify.read_events.return_value = None
+        watcher = Watcher(self.sos, delay=0, max_delay=0, inotify=inotify)
+        self.assertEqual(watcher.next_batch(), set(self.sos))
+        os.close(inotify.fileno.return_value)
+
+    def tearDown(self):
+        context.teardown()
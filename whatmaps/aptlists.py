@@ -0,0 +1,243 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Find the origins of package versions in apt's package lists"""
+
+import bz2
+import glob
+import gzip
+import logging
+import lzma
+import os
+import sqlite3
+
+from . pkgindex import CACHE_DIR, SqliteIndex
+
+LISTS_DIR = '/var/lib/apt/lists'
+
+
+class AptLists(object):
+    """
+    The Packages files apt downloaded and the Release files describing
+    their origin
+
+    @ivar lists_dir: apt's lists directory
+    """
+    _openers = {
+        '': open,
+        '.gz': gzip.open,
+        '.xz': lzma.open,
+        '.bz2': bz2.open,
+    }
+
+    def __init__(self, lists_dir=LISTS_DIR):
+        self.lists_dir = lists_dir
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _release_file(self, path):
+        """The Release file of the repository a Packages file belongs to"""
+        name = os.path.basename(path)
+        pos = name.rfind('_', 0, name.rfind('_Packages'))
+        while pos > 0:
+            for release in ['InRelease', 'Release']:
+                release = os.path.join(self.lists_dir, name[:pos + 1] + release)
+                if os.path.exists(release):
+                    return release
+            pos = name.rfind('_', 0, pos)
+        return None
+
+    def packages_files(self):
+        """
+        The readable Packages files with a stamp that changes with them
+        and their Release file
+
+        @rtype: C{dict}
+        """
+        files = {}
+        for path in glob.glob(os.path.join(self.lists_dir, '*_Packages*')):
+            suffix = path[path.rfind('_Packages') + len('_Packages'):]
+            if suffix not in self._openers:
+                logging.debug("Can't read %s", path)
+                continue
+            release = self._release_file(path)
+            files[path] = '%s %s' % (self._mtime(path), self._mtime(release) if release else None)
+        return files
+
+    def origin(self, path):
+        """
+        The origin and suite of the repository of a Packages file
+
+        @returns: (origin, suite) or C{None} if unknown
+        @rtype: C{tuple}
+        """
+        release = self._release_file(path)
+        if release is None:
+            return None
+        fields = {}
+        try:
+            with open(release, encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    key, sep, value = line.partition(':')
+                    if key in ('Origin', 'Suite') and key not in fields:
+                        fields[key] = value.strip()
+                    elif key in ('MD5Sum', 'SHA1', 'SHA256'):
+                        # The checksums follow the interesting fields
+                        break
+        except OSError as e:
+            logging.debug("Can't read %s: %s", release, e)
+            return None
+        return fields.get('Origin', ''), fields.get('Suite', '')
+
+    def versions(self, path):
+        """
+        The package versions listed in a Packages file
+
+        @returns: (package, version) tuples
+        """
+        suffix = path[path.rfind('_Packages') + len('_Packages'):]
+        name = None
+        with self._openers[suffix](path, 'rb') as f:
+            for line in f:
+                if line.startswith(b'Package: '):
+                    name = line[9:].strip().decode('utf-8', 'replace')
+                elif line.startswith(b'Version: ') and name:
+                    yield name, line[9:].strip().decode('utf-8', 'replace')
+                    name = None
+
+
+class OriginIndex(SqliteIndex):
+    """
+    Persistent index of the origins of all package versions in apt's
+    lists. Packages files are only read again when they or their Release
+    file changed.
+    """
+    _tables = ['versions', 'lists', 'meta']
+    _schema = [
+        'CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)',
+        'CREATE TABLE lists (id INTEGER PRIMARY KEY, path TEXT UNIQUE, stamp TEXT, '
+        'origin TEXT, suite TEXT)',
+        'CREATE TABLE versions (pkg TEXT, version TEXT, list INTEGER, '
+        'PRIMARY KEY (pkg, version, list)) WITHOUT ROWID',
+        'CREATE INDEX versions_list ON versions (list)',
+    ]
+    _name = 'origins.sqlite'
+
+    def sync(self):
+        """
+        Bring the index up to date with apt's lists
+
+        @returns: number of reindexed Packages files
+        @rtype: C{int}
+        """
+        files = self.source.packages_files()
+        stamp = ' '.join('%s@%s' % item for item in sorted(files.items()))
+        if self._meta('stamp') == stamp:
+            return 0
+
+        with self._locked():
+            if self._meta('stamp') == stamp:
+                return 0
+            indexed = {path: (list_id, list_stamp) for list_id, path, list_stamp
+                       in self._conn.execute('SELECT id, path, stamp FROM lists')}
+            updated = 0
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                for path, (list_id, list_stamp) in indexed.items():
+                    if files.get(path) != list_stamp:
+                        self._conn.execute('DELETE FROM versions WHERE list=?', (list_id,))
+                        self._conn.execute('DELETE FROM lists WHERE id=?', (list_id,))
+                for path, list_stamp in files.items():
+                    if path in indexed and indexed[path][1] == list_stamp:
+                        continue
+                    origin = self.source.origin(path)
+                    if origin is None:
+                        continue
+                    try:
+                        versions = set(self.source.versions(path))
+                    except (OSError, EOFError, lzma.LZMAError) as e:
+                        logging.warning("Can't read %s: %s", path, e)
+                        continue
+                    list_id = self._conn.execute('INSERT INTO lists (path, stamp, origin, suite) '
+                                                 'VALUES (?, ?, ?, ?)',
+                                                 (path, list_stamp) + origin).lastrowid
+                    self._conn.executemany('INSERT INTO versions VALUES (?, ?, ?)',
+                                           ((pkg, version, list_id) for pkg, version in versions))
+                    updated += 1
+                self._conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                                   ('stamp', stamp))
+        logging.debug("Reindexed %d package lists", updated)
+        return updated
+
+    def origins(self, name, version):
+        """
+        The origins version of package name is available from as of
+        the last L{sync}
+
+        @returns: set of (origin, suite) tuples or C{None} if the
+            package isn't in any list
+        @rtype: C{set}
+        """
+        origins = set(self._conn.execute('SELECT DISTINCT origin, suite FROM versions '
+                                         'JOIN lists ON versions.list=lists.id '
+                                         'WHERE pkg=? AND version=?', (name, version)))
+        if origins:
+            return origins
+        row = self._conn.execute('SELECT 1 FROM versions WHERE pkg=? LIMIT 1', (name,)).fetchone()
+        return set() if row else None
+
+
+def version_origins(names, lists_dir=LISTS_DIR, cache_dir=CACHE_DIR):
+    """
+    Look up the origins of package versions using the persistent index
+    if possible, otherwise the lists are read once for all names.
+
+    @param names: the package names of interest
+    @returns: function returning the origins of a package version like
+        L{OriginIndex.origins}
+    """
+    source = AptLists(lists_dir)
+    index = OriginIndex.open(source, cache_dir)
+    if index is not None:
+        try:
+            index.sync()
+            return index.origins
+        except sqlite3.Error as e:
+            logging.warning("Origin index unusable: %s", e)
+
+    names = set(names)
+    found = {}
+    for path in source.packages_files():
+        origin = source.origin(path)
+        if origin is None:
+            continue
+        try:
+            for name, version in source.versions(path):
+                if name in names:
+                    found.setdefault(name, {}).setdefault(version, set()).add(origin)
+        except (OSError, EOFError, lzma.LZMAError) as e:
+            logging.warning("Can't read %s: %s", path, e)
+
+    def origins(name, version):
+        if name not in found:
+            return None
+        return found[name].get(version, set())
+    return origins
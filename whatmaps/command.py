@@ -17,52 +17,357 @@
 #
 
 
+import concurrent.futures
 import errno
+import fcntl
+import functools
 import glob
 import os
 import logging
+import signal
 import sys
+import tempfile
+import time
 from optparse import OptionParser
 
+from . import daemon
+from . mapsindex import FileIdCache, MapsIndex
 from . process import Process
+from . restart import Restarter
+from . rpmdb import RpmDatabase
 from . distro import Distro
-from . pkg import PkgError
+from . dpkgdb import DpkgDatabase
+from . pkg import Pkg, PkgError
+from . snapshot import (RecordingDistro, RecordingSystemd, ReplayDistro,
+                        ReplaySystemd, Snapshot, SnapshotError)
 from . systemd import Systemd
+from . watch import Watcher
 
 
-def check_maps(procs, shared_objects):
+def check_maps(procs, shared_objects, inodes=False, jobs=1):
+    index = MapsIndex(procs, shared_objects, inodes=inodes, jobs=jobs)
+    restart_procs = index.match(shared_objects)
+    logging.debug("Read %d maps entries, saved %d path comparisons",
+                  index.nr_maps, index.comparisons_saved)
+    return restart_procs
+
+
+def check_maps_mapped_first(procs, pkgs, distro, jobs=1):
+    """
+    Find processes that map shared objects of pkgs by looking up the
+    packages of the distinct objects mapped system wide instead of
+    listing the contents of pkgs. The cost depends on what's running
+    rather than on the size of the packages.
+
+    @returns: processes grouped by executable and the mapped shared
+        objects that belong to pkgs
+    @rtype: C{tuple}
+    """
+    index = MapsIndex(procs, jobs=jobs)
+    mapped = [path for path in index.paths() if Pkg._so_regex.match(path)]
+    owners = distro.pkgs_by_files(mapped)
+
+    # Packages ship files below /lib that get mapped via /usr/lib on
+    # merged /usr systems
+    aliases = {}
+    for path, pkg in owners.items():
+        if pkg is None and path.startswith('/usr/'):
+            alias = path[4:]
+            if os.path.realpath(alias) == os.path.realpath(path):
+                aliases[alias] = path
+    if aliases:
+        for alias, pkg in distro.pkgs_by_files(aliases).items():
+            owners[aliases[alias]] = pkg
+
+    names = set(pkg.name.split(':')[0] for pkg in pkgs)
+    shared_objects = sorted(path for path, pkg in owners.items()
+                            if pkg is not None and pkg.name.split(':')[0] in names)
+    logging.debug("%d of %d mapped shared objects belong to the packages",
+                  len(shared_objects), len(mapped))
+    return index.match(shared_objects), shared_objects
+
+
+def check_maps_unit_first(unit_pids, shared_objects, inodes=False,
+                          start_time_filter=False, procfs=None):
+    """
+    Find processes that map shared objects walking the service units.
+    The processes of a unit are only checked until the first one maps
+    any of the shared objects since the unit needs a restart anyway.
+    Processes outside of service units are all checked.
+
+    @param unit_pids: pids by service unit and the pids outside of
+        service units as returned by L{Systemd.unit_pids}
+    @returns: processes grouped by executable
+    @rtype: C{dict}
+    """
+    units, others = unit_pids
+    index = MapsIndex(targets=shared_objects, inodes=inodes)
+    skipped = 0
+    for unit, pids in units.items():
+        procs = [Process(pid, procfs) for pid in pids]
+        if start_time_filter:
+            procs = filter_started_after(procs, shared_objects)
+        for pos, proc in enumerate(procs):
+            if index.add(proc):
+                logging.debug("%s of %s maps a shared object", proc, unit)
+                skipped += len(procs) - pos - 1
+                break
+
+    procs = _scan_pids(others, procfs)
+    if start_time_filter:
+        procs = filter_started_after(procs, shared_objects)
+    for proc in procs:
+        index.add(proc)
+    logging.debug("Skipped %d processes of units that need a restart", skipped)
+    return index.match(shared_objects)
+
+
+def check_maps_daemon(shared_objects, start_time_filter=False,
+                      socket_path=daemon.SOCKET_PATH, procfs=None):
+    """
+    Ask a running whatmapsd which processes map the shared objects
+
+    @raises daemon.DaemonError: if the daemon can't be reached
+    """
+    restart_procs = {}
+    for exe, pids in daemon.query(shared_objects, socket_path).items():
+        restart_procs[exe] = [Process(pid, procfs) for pid in pids]
+    if start_time_filter:
+        restart_procs = filter_groups_started_after(restart_procs, shared_objects)
+    return restart_procs
+
+
+def check_deleted(procs, procfs=None):
+    """
+    Find processes that execute or map files that got deleted or
+    replaced on disk. The mappings of processes in other mount
+    namespaces are looked up below their root directory.
+    """
+    cache = FileIdCache()
+    host_mnt_ns = get_host_mnt_ns(procfs)
     restart_procs = {}
     for proc in procs:
-        for so in shared_objects:
-            if proc.maps(so):
-                if proc.exe in restart_procs:
-                    restart_procs[proc.exe] += [proc]
-                else:
-                    restart_procs[proc.exe] = [proc]
-                break
+        if proc.deleted:
+            path = proc.exe
+        else:
+            foreign = proc.mnt_ns not in (host_mnt_ns, None)
+            path = proc.find_deleted_mapping(cache, proc.root if foreign else None)
+        if path is None:
+            continue
+        logging.debug("%s maps deleted object %s", proc, path)
+        if proc.exe in restart_procs:
+            restart_procs[proc.exe] += [proc]
+        else:
+            restart_procs[proc.exe] = [proc]
     return restart_procs
 
 
-def get_all_pids():
-    processes = []
-    paths = glob.glob('/proc/[0-9]*')
+def verify_restarts(units, shared_objects, systemd=Systemd, procfs=None):
+    """
+    Check that the processes of restarted units don't map outdated
+    versions of the shared objects anymore. Only the processes in the
+    units' cgroups are looked at. Mappings of files that got deleted or
+    replaced on disk count as outdated. Without shared objects any such
+    mapping counts.
+
+    @returns: the outdated objects by unit or C{None} if the units'
+        processes can't be determined
+    @rtype: C{dict}
+    """
+    unit_pids = systemd.units_pids(units)
+    if unit_pids is None:
+        return None
+
+    cache = FileIdCache()
+    shared_objects = set(shared_objects or [])
+    stale = {}
+    for unit, pids in unit_pids.items():
+        for pid in pids:
+            proc = Process(pid, procfs)
+            if not shared_objects:
+                paths = [proc.find_deleted_mapping(cache)]
+            else:
+                paths = []
+                for dummy, inode, path in proc.mapped_entries():
+                    deleted = path.endswith(' (deleted)')
+                    if deleted:
+                        path = path[:-len(' (deleted)')]
+                    if path not in shared_objects:
+                        continue
+                    file_id = cache.file_id(path)
+                    if deleted or file_id is None or file_id[2] != inode:
+                        paths.append(path)
+            for path in paths:
+                if path is not None:
+                    logging.debug("%s of %s maps outdated %s", proc, unit, path)
+                    stale.setdefault(unit, set()).add(path)
+    return stale
+
+
+def filter_started_after(procs, shared_objects, slack=1):
+    """
+    Drop processes that started after all shared objects changed on
+    disk since they already map the current versions.
+    """
+    changed = None
+    for so in shared_objects:
+        try:
+            st = os.stat(so)
+        except OSError:
+            continue
+        changed = max(changed or 0, st.st_ctime, st.st_mtime)
+    if changed is None:
+        return procs
+
+    kept = []
+    for proc in procs:
+        start_time = proc.start_time
+        if start_time is not None and start_time > changed + slack:
+            logging.debug("%s started after shared objects changed, skipping", proc)
+            continue
+        kept.append(proc)
+    return kept
+
+
+def filter_groups_started_after(restart_procs, shared_objects):
+    """L{filter_started_after} for processes grouped by executable"""
+    kept = filter_started_after([proc for procs in restart_procs.values() for proc in procs],
+                                shared_objects)
+    kept = set(id(proc) for proc in kept)
+    filtered = {}
+    for exe, procs in restart_procs.items():
+        procs = [proc for proc in procs if id(proc) in kept]
+        if procs:
+            filtered[exe] = procs
+    return filtered
+
+
+def group_by_mnt_ns(procs):
+    """Group processes by their mount namespace keeping their order"""
+    namespaces = {}
+    for proc in procs:
+        if proc.mnt_ns in namespaces:
+            namespaces[proc.mnt_ns].append(proc)
+        else:
+            namespaces[proc.mnt_ns] = [proc]
+    return namespaces
+
+
+def _root_id(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def split_containers(namespaces, host_mnt_ns, procfs=None):
+    """
+    Split off the mount namespaces with another root directory than
+    ours like the ones of containers. Services using e.g. PrivateTmp=
+    run in a mount namespace of their own on the host's root so they
+    stay with the host's processes.
+
+    @returns: the host's processes sorted by pid and the other
+        namespaces' processes by namespace
+    @rtype: C{tuple}
+    """
+    host_root = _root_id(os.path.join(procfs or '/proc', 'self', 'root'))
+    host = namespaces.pop(host_mnt_ns, [])
+    containers = {}
+    for ns, procs in namespaces.items():
+        root = _root_id(procs[0].root)
+        if root is None or root == host_root:
+            host += procs
+        else:
+            containers[ns] = procs
+    return sorted(host, key=lambda p: p.pid), containers
+
+
+def check_containers(namespaces, pkg_names):
+    """
+    Find processes in other mount namespaces like containers that map
+    shared objects of the given packages. Paths are resolved via
+    /proc/<pid>/root of the first process and the package database
+    of each namespace is only queried once for all its processes.
+
+    @returns: processes grouped by executable per namespace
+    @rtype: C{dict}
+    """
+    results = {}
+    for ns, procs in namespaces.items():
+        root = procs[0].root
+        distro = Distro.detect_root(root)
+        if distro is None:
+            logging.warning("Unknown distribution in %s (pid %d) - skipping",
+                            ns, procs[0].pid)
+            continue
+
+        pkgs = [distro.pkg(name, root) for name in pkg_names]
+        distro.load_contents(pkgs)
+        shared_objects = []
+        for pkg in pkgs:
+            try:
+                shared_objects += pkg.shared_objects
+            except PkgError:
+                logging.debug("Package %s not installed in %s", pkg.name, ns)
+        if not shared_objects:
+            continue
+
+        restart_procs = check_maps(procs, shared_objects)
+        if restart_procs:
+            results[ns] = restart_procs
+    return results
+
+
+def print_container_report(results):
+    print("Containers with processes that possibly need to be restarted:")
+    for ns, restart_procs in results.items():
+        pids = [proc.pid for procs in restart_procs.values() for proc in procs]
+        print("%s (pid %d):" % (ns, min(pids)))
+        for exe, procs in restart_procs.items():
+            print("  %s %s" % (exe, procs))
 
-    for path in paths:
-        p = Process(int(path.rsplit('/')[-1]))
-        processes.append(p)
 
+def _scan_pids(pids, procfs=None):
+    processes = []
+    for pid in pids:
+        p = Process(pid, procfs)
+        if p.is_kernel_thread:
+            continue
+        processes.append(p)
     return processes
 
 
-def write_cmd_file(services, cmd_file, distro):
+def get_host_mnt_ns(procfs=None):
+    """The mount namespace we're running in"""
+    return os.readlink(os.path.join(procfs or '/proc', 'self', 'ns', 'mnt'))
+
+
+def get_all_pids(jobs=1, procfs=None):
+    """
+    Get all processes sorted by pid. With jobs > 1 the pid list is
+    sharded across a pool of worker threads. The maps aren't read here
+    so they can be matched against the objects of interest in parallel
+    via L{check_maps} after the start time filter was applied.
+    """
+    paths = glob.glob(os.path.join(procfs or '/proc', '[0-9]*'))
+    pids = sorted(int(os.path.basename(path)) for path in paths)
+
+    if jobs <= 1:
+        return _scan_pids(pids, procfs)
+
+    shards = [pids[i::jobs] for i in range(jobs)]
+    scan = functools.partial(_scan_pids, procfs=procfs)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        processes = [p for shard in executor.map(scan, shards) for p in shard]
+    return sorted(processes, key=lambda p: p.pid)
+
+
+def write_cmd_file(services, cmd_file, distro, restarter=None):
     "Write out commands needed to restart the services to a file"
-    out = open(cmd_file, 'w')
-    print('#! /bin/sh', file=out)
-    for service in services:
-        logging.info("Need to restart '%s'", service)
-        print(" ".join(distro.restart_service_cmd(service)), file=out)
-    out.close()
-    os.chmod(cmd_file, 0o755)
+    restarter = restarter or Restarter(distro)
+    restarter.write_script(services, cmd_file)
 
 
 def find_pkgs(procs, distro):
@@ -70,8 +375,9 @@ def find_pkgs(procs, distro):
     Find packages that contain the binaries of the given processes
     """
     pkgs = {}
+    owners = distro.pkgs_by_files(procs)
     for proc in procs:
-        pkg = distro.pkg_by_file(proc)
+        pkg = owners[proc]
         if not pkg:
             logging.warning("No package found for '%s' - restart manually" % proc)
         else:
@@ -96,6 +402,7 @@ def find_services(pkgs, distro):
     """
     all_services = set()
 
+    distro.load_contents(pkgs.values())
     for pkg in list(pkgs.values()):
         services = set(pkg.services + distro.pkg_services(pkg))
         services -= set(distro.pkg_service_blacklist(pkg))
@@ -108,14 +415,14 @@ def find_services(pkgs, distro):
     return all_services
 
 
-def find_systemd_units(procmap, distro):
+def find_systemd_units(procmap, distro, systemd=Systemd):
     """Find systemd units that contain the given processes"""
     units = set()
 
     for dummy, procs in list(procmap.items()):
         for proc in procs:
             try:
-                unit = Systemd.process_to_unit(proc)
+                unit = systemd.process_to_unit(proc)
             except ValueError as e:
                 logging.warning("No systemd unit found for '%s': %s "
                                 "- restart manually" % (proc.exe, e))
@@ -139,6 +446,164 @@ def filter_services(distro, services):
     return filtered
 
 
+def find_restart_services(restart_procs, distro, systemd=Systemd):
+    """
+    Determine the services that need a restart for the given processes
+
+    @raises NotImplementedError: if the distribution can't list services
+    """
+    if systemd.is_running():
+        logging.debug("Detected Systemd")
+        services = find_systemd_units(restart_procs, distro, systemd)
+    else:
+        # Find the packages that contain the binaries the processes are
+        # executing
+        pkgs = find_pkgs(restart_procs, distro)
+
+        # Find the services in these packages honoring distro specific
+        # mappings and blacklists
+        services = find_services(pkgs, distro)
+    return filter_services(distro, services)
+
+
+def handle_services(services, options, distro, systemd=Systemd):
+    """
+    Restart the services or print them as requested by options
+
+    @returns: the services whose restart failed
+    @rtype: C{set}
+    """
+    if options.restart:
+        restarter = Restarter(distro, options.restart_jobs, options.restart_timeout,
+                              options.restart_batch, systemd)
+        if options.print_cmds and services:
+            write_cmd_file(services, options.print_cmds, distro, restarter)
+        elif services:
+            return set(service for job in restarter.restart(services)
+                       for service in job.services)
+    elif services:
+        print("Services that possibly need to be restarted:")
+        for s in services:
+            print(s)
+    return set()
+
+
+def watch(shared_objects, options, distro, systemd=Systemd, procfs=None):
+    """
+    Watch the shared objects for replacement and handle the services of
+    the processes mapping them. Without shared objects all shared
+    objects mapped by any process are watched. The processes mapping a
+    replaced object are looked up in an index of all mapped objects.
+    Processes started since the last batch of replacements, e.g. the
+    restarted services, are added to the index by their pid and start
+    time so only their maps need to be read.
+    """
+    index = MapsIndex()
+    # pid -> start time of the live indexed processes
+    known = {}
+
+    def update_index():
+        procs = get_all_pids(options.jobs, procfs)
+        new = [proc for proc in procs
+               if proc.pid not in known or known[proc.pid] != proc.start_time]
+        index.add_all(new, options.jobs)
+        known.clear()
+        known.update((proc.pid, proc.start_time) for proc in procs)
+
+    update_index()
+    if not shared_objects:
+        shared_objects = [path for path in index.paths() if Pkg._so_regex.match(path)]
+
+    def replaced(paths):
+        paths = sorted(paths)
+        logging.info("Replaced shared objects: %s", ", ".join(paths))
+        update_index()
+        pids = set()
+        for path in paths:
+            pids.update(proc.pid for proc in index.procs_mapping(path)
+                        if proc.pid in known and known[proc.pid] == proc.start_time)
+        # Look at the processes again since they might have been
+        # restarted in the meantime
+        procs = filter_started_after([Process(pid, procfs) for pid in sorted(pids)], paths)
+        restart_procs = check_maps(procs, paths)
+        try:
+            services = find_restart_services(restart_procs, distro, systemd)
+        except NotImplementedError:
+            logging.error("Getting Service listing not implemented "
+                          "for distribution %s", distro.id)
+            return
+        handle_services(services, options, distro, systemd)
+
+    Watcher(shared_objects).watch(replaced)
+
+
+def defer(lock_path, log_path):
+    """
+    Continue in a background process. The background process holds a
+    lock on lock_path until it exits so L{wait_deferred} can wait for
+    it. Its output goes to log_path.
+
+    @returns: the lock in the background process, C{None} in the caller
+    """
+    lock = open(lock_path, 'w')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    if os.fork():
+        # The lock stays held by the background process' copy
+        lock.close()
+        return None
+    os.setsid()
+    lock.write('%d\n' % os.getpid())
+    lock.flush()
+    with open(os.devnull, 'r+') as devnull:
+        os.dup2(devnull.fileno(), sys.stdin.fileno())
+        os.dup2(devnull.fileno(), sys.stdout.fileno())
+    with open(log_path, 'w') as log:
+        os.dup2(log.fileno(), sys.stderr.fileno())
+    return lock
+
+
+def wait_deferred(lock_path, log_path, timeout):
+    """
+    Wait for a background process started via L{defer} to finish and
+    pass on its output. The lock file is removed afterwards. If it
+    doesn't finish within timeout seconds it's terminated.
+
+    @returns: whether it finished in time
+    @rtype: C{bool}
+    """
+    try:
+        lock = open(lock_path)
+    except FileNotFoundError:
+        return True
+
+    deadline = time.monotonic() + timeout
+    with lock:
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() < deadline:
+                    time.sleep(0.1)
+                    continue
+            try:
+                os.kill(int(lock.read()), signal.SIGTERM)
+            except (ValueError, OSError) as e:
+                logging.debug("Can't terminate deferred run: %s", e)
+            return False
+        try:
+            os.unlink(lock_path)
+        except OSError:
+            pass
+        try:
+            with open(log_path) as log:
+                sys.stderr.write(log.read())
+            os.unlink(log_path)
+        except OSError:
+            pass
+    return True
+
+
 def main(argv):
     shared_objects = []
     services = None
@@ -153,8 +618,65 @@ def main(argv):
                       default=False, help="Restart services")
     parser.add_option("--print-cmds", dest="print_cmds",
                       help="Output restart commands to file instead of restarting")
+    parser.add_option("--restart-jobs", type="int", dest="restart_jobs", default=1,
+                      metavar="N", help="Number of services restarted in parallel")
+    parser.add_option("--restart-timeout", type="int", dest="restart_timeout",
+                      metavar="SECONDS",
+                      help="Give up on a service restart after this many seconds")
+    parser.add_option("--restart-batch", action="store_true", dest="restart_batch",
+                      default=False,
+                      help="Restart all systemd units with a single systemctl call")
+    parser.add_option("--verify", action="store_true", dest="verify", default=False,
+                      help="Check that the processes of the restarted systemd units "
+                      "don't map outdated shared objects anymore")
     parser.add_option("--apt", action="store_true", dest="apt", default=False,
                       help="Use in apt pipeline")
+    parser.add_option("--defer", action="store_true", dest="defer", default=False,
+                      help="In the apt pipeline only read the packages and do the "
+                      "rest in the background")
+    parser.add_option("--wait-deferred", type="int", dest="wait_deferred",
+                      metavar="SECONDS",
+                      help="Wait up to SECONDS for a run started with --defer to "
+                      "write its restart commands")
+    parser.add_option("--deb-contents", action="store_true", dest="deb_contents",
+                      default=False,
+                      help="In the apt pipeline read the files of updated packages "
+                      "from the archives about to be installed")
+    parser.add_option("--deleted", action="store_true", dest="deleted",
+                      default=False,
+                      help="Find processes that map deleted or replaced files "
+                      "instead of looking at packages")
+    parser.add_option("--watch", action="store_true", dest="watch", default=False,
+                      help="Watch the shared objects and handle services once "
+                      "they got replaced")
+    parser.add_option("--daemon", action="store_true", dest="use_daemon",
+                      default=False,
+                      help="Ask whatmapsd for the processes instead of scanning them")
+    parser.add_option("--record", dest="record", metavar="FILE",
+                      help="Record everything read from the system into a snapshot")
+    parser.add_option("--replay", dest="replay", metavar="FILE",
+                      help="Run against a recorded snapshot instead of the system")
+    parser.add_option("--containers", action="store_true", dest="containers",
+                      default=False,
+                      help="Also check processes in other mount namespaces "
+                      "against their own package database")
+    parser.add_option("--no-start-time-filter", action="store_false",
+                      dest="start_time_filter", default=True,
+                      help="Don't skip processes started after the shared objects "
+                      "were updated")
+    parser.add_option("--mapped-first", action="store_true", dest="mapped_first",
+                      default=False,
+                      help="Look up the packages of all mapped objects instead of "
+                      "listing the contents of the packages")
+    parser.add_option("--unit-first", action="store_true", dest="unit_first",
+                      default=False,
+                      help="Walk the processes per systemd service unit and stop "
+                      "at the first one of each unit that needs a restart")
+    parser.add_option("--match-inodes", action="store_true", dest="inodes",
+                      default=False,
+                      help="Match mapped objects by device and inode instead of path")
+    parser.add_option("--jobs", type="int", dest="jobs", default=1,
+                      help="Number of threads used to scan processes")
 
     (options, args) = parser.parse_args(argv[1:])
 
@@ -168,14 +690,109 @@ def main(argv):
     logging.basicConfig(level=level,
                         format='%(levelname)s: %(message)s')
 
-    distro = Distro.detect()()
+    if (options.defer or options.wait_deferred is not None) and not options.print_cmds:
+        logging.error("--defer and --wait-deferred need --print-cmds")
+        return 1
+
+    if options.defer and not (options.apt and options.restart):
+        logging.error("--defer needs --apt and --restart")
+        return 1
+
+    if options.defer and options.mapped_first:
+        # Would look up the packages while dpkg unpacks them
+        logging.error("--defer can't be used with --mapped-first")
+        return 1
+
+    if options.wait_deferred is not None:
+        if wait_deferred(options.print_cmds + '.lock', options.print_cmds + '.log',
+                         options.wait_deferred):
+            return 0
+        logging.error("Deferred run didn't finish within %d seconds - restart "
+                      "services manually", options.wait_deferred)
+        try:
+            os.unlink(options.print_cmds)
+        except FileNotFoundError:
+            pass
+        return 1
+
+    if options.record and options.replay:
+        logging.error("--record can't be used with --replay")
+        return 1
+
+    if options.deleted and options.replay:
+        # Needs the files on the live system
+        logging.error("--deleted can't be used with --replay")
+        return 1
+
+    if options.restart and options.replay:
+        # The services of the snapshot aren't the ones running here
+        logging.error("--restart can't be used with --replay")
+        return 1
+
+    procfs = None
+    systemd = Systemd
+    snapshot = None
+    if options.replay:
+        try:
+            snapshot = Snapshot.load(options.replay)
+            distro = ReplayDistro(snapshot)
+        except SnapshotError as e:
+            logging.error("%s", e)
+            return 1
+        systemd = ReplaySystemd(snapshot)
+        # Removed once it goes out of scope
+        replay_dir = tempfile.TemporaryDirectory(prefix='whatmaps_replay_')
+        procfs = replay_dir.name
+        snapshot.write_procfs(procfs)
+        # These look at the live system
+        options.start_time_filter = False
+        options.inodes = False
+        options.containers = False
+        if not args:
+            args = snapshot.pkgs
+    else:
+        distro = Distro.detect()()
     if not distro:
         logging.error("Unsupported Distribution")
         return 1
     else:
         logging.debug("Detected distribution: '%s'", distro.id)
 
-    if args:
+    if options.record:
+        snapshot = Snapshot()
+        distro = RecordingDistro(distro, snapshot)
+        systemd = RecordingSystemd(snapshot)
+
+    if options.deleted and options.containers:
+        logging.error("--containers can't be used with --deleted")
+        return 1
+
+    if options.mapped_first and (options.deleted or options.watch or options.inodes):
+        logging.error("--mapped-first can't be used with --deleted, --watch "
+                      "or --match-inodes")
+        return 1
+
+    if options.unit_first and (options.deleted or options.watch or options.mapped_first or
+                               options.containers or options.record or options.replay):
+        logging.error("--unit-first can't be used with --deleted, --watch, --mapped-first, "
+                      "--containers, --record or --replay")
+        return 1
+
+    if options.verify and (not options.restart or options.print_cmds or
+                           options.record or options.replay):
+        logging.error("--verify needs --restart and can't be used with --print-cmds, "
+                      "--record or --replay")
+        return 1
+
+    if options.watch and (options.deleted or options.containers or options.apt or
+                          options.record or options.replay):
+        logging.error("--watch can't be used with --deleted, --containers, "
+                      "--apt, --record or --replay")
+        return 1
+
+    if options.deleted or (options.watch and not args):
+        pkgs = []
+    elif args:
         pkgs = [distro.pkg(arg) for arg in args]
     elif options.apt and distro.has_apt():
         try:
@@ -187,26 +804,110 @@ def main(argv):
             return 0
         pkgs, notfound = distro.filter_security_updates(pkgs)
         if notfound:
-            logging.warning("Pkgs %s not found in apt cache" % ", ".join(notfound))
+            logging.warning("Pkgs %s not found in apt lists",
+                            ", ".join(pkg.name for pkg in notfound))
         logging.debug("Security Upgrades: %s" % pkgs)
+        if options.deb_contents:
+            distro.load_archive_contents(pkgs)
     else:
         parser.print_help()
         return 1
 
+    if options.record:
+        snapshot.pkgs = [pkg.name for pkg in pkgs]
+        snapshot.add_pkgs(pkgs)
+
     # Find shared objects of updated packages
-    for pkg in pkgs:
+    if not options.mapped_first:
+        distro.load_contents(pkgs)
+        for pkg in pkgs:
+            try:
+                shared_objects += pkg.shared_objects
+            except PkgError as e:
+                logging.error("%s - skipping package %s" % (e, pkg.name))
+                ret = 1
+        logging.debug("Found shared objects:")
+        for so in shared_objects:
+            logging.debug("  %s", so)
+
+    if options.defer:
+        # Let dpkg go on while we're looking at the processes. The
+        # package contents were read above so they still describe
+        # the installed versions. The lock is held until the
+        # background process exits. The background process reopens
+        # the package databases since sqlite connections can't be
+        # used across fork().
+        DpkgDatabase.close_all()
+        RpmDatabase.close_all()
         try:
-            shared_objects += pkg.shared_objects
-        except PkgError as e:
-            logging.error("%s - skipping package %s" % (e, pkg.name))
-            ret = 1
-    logging.debug("Found shared objects:")
-    for so in shared_objects:
-        logging.debug("  %s", so)
+            deferred = defer(options.print_cmds + '.lock', options.print_cmds + '.log')
+        except OSError as e:
+            logging.error("Can't defer: %s", e)
+            return 1
+        if deferred is None:
+            return ret
+
+    if options.watch:
+        try:
+            watch(shared_objects, options, distro, systemd, procfs)
+        except OSError as e:
+            logging.error("Can't watch shared objects: %s", e)
+            return 1
+        except KeyboardInterrupt:
+            pass
+        return ret
+
+    # In the apt pipeline we run before the packages get unpacked
+    # so the start time doesn't tell anything yet
+    start_time_filter = options.start_time_filter and not options.apt
 
     # Find processes that map them
+    container_procs = {}
+    restart_procs = None
+    if (options.use_daemon and os.path.exists(daemon.SOCKET_PATH) and
+            not (options.deleted or options.containers or options.inodes or
+                 options.mapped_first or options.unit_first or options.record or
+                 options.replay)):
+        try:
+            restart_procs = check_maps_daemon(shared_objects, start_time_filter)
+            logging.debug("Got processes from whatmapsd")
+        except daemon.DaemonError as e:
+            logging.info("%s - scanning processes", e)
+
     try:
-        restart_procs = check_maps(get_all_pids(), shared_objects)
+        if restart_procs is None and options.unit_first:
+            unit_pids = systemd.unit_pids() if systemd.is_running() else None
+            if unit_pids is not None:
+                restart_procs = check_maps_unit_first(unit_pids, shared_objects,
+                                                      options.inodes, start_time_filter,
+                                                      procfs)
+            else:
+                logging.info("No systemd cgroup hierarchy - scanning all processes")
+        if restart_procs is None:
+            procs = get_all_pids(options.jobs, procfs)
+            if options.record:
+                snapshot.add_procs(procs)
+            if options.containers:
+                namespaces = group_by_mnt_ns(procs)
+                # Processes that vanished
+                namespaces.pop(None, None)
+                procs, namespaces = split_containers(namespaces, get_host_mnt_ns(procfs),
+                                                     procfs)
+                container_procs = check_containers(namespaces,
+                                                   [pkg.name for pkg in pkgs])
+            if options.deleted:
+                restart_procs = check_deleted(procs, procfs)
+            elif options.mapped_first:
+                restart_procs, shared_objects = check_maps_mapped_first(procs, pkgs, distro,
+                                                                        options.jobs)
+                if start_time_filter:
+                    restart_procs = filter_groups_started_after(restart_procs,
+                                                                shared_objects)
+            else:
+                if start_time_filter:
+                    procs = filter_started_after(procs, shared_objects)
+                restart_procs = check_maps(procs, shared_objects, options.inodes,
+                                           options.jobs)
     except IOError as e:
         if e.errno == errno.EACCES:
             logging.error("Can't open process maps in '/proc/<pid>/maps', are you root?")
@@ -217,42 +918,37 @@ def main(argv):
     for exe, pids in list(restart_procs.items()):
         logging.debug("  Exe: %s Pids: %s", exe, pids),
 
-    if Systemd.is_running():
-        logging.debug("Detected Systemd")
-        services = find_systemd_units(restart_procs, distro)
-    else:
-        # Find the packages that contain the binaries the processes are
-        # executing
-        pkgs = find_pkgs(restart_procs, distro)
-
-        # Find the services in these packages honoring distro specific
-        # mappings and blacklists
-        try:
-            services = find_services(pkgs, distro)
-        except NotImplementedError:
-            if level > logging.INFO:
-                logging.error("Getting Service listing not implemented "
-                              "for distribution %s - rerun with --verbose to see a list"
-                              "of binaries that map a shared objects from %s",
-                              distro.id, args)
-                return 1
-            else:
-                return 0
-
-    services = filter_services(distro, services)
+    if container_procs:
+        print_container_report(container_procs)
 
-    if options.restart:
-        if options.print_cmds and services:
-            write_cmd_file(services, options.print_cmds, distro)
+    try:
+        services = find_restart_services(restart_procs, distro, systemd)
+    except NotImplementedError:
+        if level > logging.INFO:
+            logging.error("Getting Service listing not implemented "
+                          "for distribution %s - rerun with --verbose to see a list"
+                          "of binaries that map a shared objects from %s",
+                          distro.id, args)
+            return 1
         else:
-            for service in services:
-                logging.info("Restarting '%s'" % service)
-                distro.restart_service(service)
-    elif services:
-        print("Services that possibly need to be restarted:")
-        for s in services:
-            print(s)
+            return 0
+
+    failed = handle_services(services, options, distro, systemd)
+    if failed:
+        ret = 1
+
+    if options.verify:
+        units = [service for service in services - failed if service.endswith('.service')]
+        stale = verify_restarts(units, shared_objects, systemd, procfs) if units else {}
+        if stale is None:
+            logging.warning("No systemd cgroup hierarchy - can't verify restarts")
+            stale = {}
+        for unit, paths in sorted(stale.items()):
+            logging.error("'%s' still maps outdated %s", unit, ", ".join(sorted(paths)))
+            ret = 1
 
+    if options.record:
+        snapshot.save(options.record)
     return ret
 
 
@@ -0,0 +1,348 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Resident daemon keeping an index of the objects mapped by all processes
+
+The index is kept current by following process exec and exit events
+via the netlink process connector if available and by periodically
+scanning processes it hasn't seen yet. Clients ask over a Unix socket
+which processes map a set of files using newline delimited JSON.
+"""
+
+import errno
+import glob
+import json
+import logging
+import os
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+from . process import Process
+
+SOCKET_PATH = '/run/whatmaps.sock'
+PROTOCOL_VERSION = 1
+
+
+class DaemonError(Exception):
+    pass
+
+
+class ProcConnector(object):
+    """
+    Process events from the kernel's netlink process connector. Needs
+    CAP_NET_ADMIN.
+    """
+    NETLINK_CONNECTOR = 11
+    CN_IDX_PROC = 1
+    CN_VAL_PROC = 1
+    PROC_CN_MCAST_LISTEN = 1
+
+    PROC_EVENT_FORK = 0x00000001
+    PROC_EVENT_EXEC = 0x00000002
+    PROC_EVENT_EXIT = 0x80000000
+
+    _nlmsghdr = struct.Struct('=IHHII')
+    _cn_msg = struct.Struct('=IIIIHH')
+    _proc_event = struct.Struct('=IIQ')
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                                  self.NETLINK_CONNECTOR)
+        try:
+            self.sock.bind((os.getpid(), self.CN_IDX_PROC))
+            op = struct.pack('=I', self.PROC_CN_MCAST_LISTEN)
+            msg = self._cn_msg.pack(self.CN_IDX_PROC, self.CN_VAL_PROC,
+                                    0, 0, len(op), 0) + op
+            hdr = self._nlmsghdr.pack(self._nlmsghdr.size + len(msg),
+                                      3,  # NLMSG_DONE
+                                      0, 0, os.getpid())
+            self.sock.send(hdr + msg)
+        except OSError:
+            self.sock.close()
+            raise
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def read_events(self):
+        """
+        Read pending events. Events of threads other than the main
+        thread are dropped.
+
+        @returns: list of (event, pid) tuples
+        """
+        data = self.sock.recv(65536)
+        events = []
+        offset = 0
+        while offset + self._nlmsghdr.size <= len(data):
+            length = self._nlmsghdr.unpack_from(data, offset)[0]
+            if length < self._nlmsghdr.size:
+                break
+            ev_offset = offset + self._nlmsghdr.size + self._cn_msg.size
+            if ev_offset + self._proc_event.size <= offset + length:
+                what = self._proc_event.unpack_from(data, ev_offset)[0]
+                pid_offset = ev_offset + self._proc_event.size
+                # Fork events carry the parent's pid and tgid first
+                if what == self.PROC_EVENT_FORK:
+                    pid_offset += 8
+                if pid_offset + 8 <= offset + length:
+                    pid, tgid = struct.unpack_from('=II', data, pid_offset)
+                    if pid == tgid:
+                        events.append((what, pid))
+            offset += (length + 3) & ~3
+        return events
+
+    def close(self):
+        self.sock.close()
+
+
+class MapsDaemon(object):
+    """
+    Keeps a path to pid index of all processes
+
+    @ivar interval: seconds between scans for unseen processes
+    """
+
+    def __init__(self, socket_path=SOCKET_PATH, interval=30, procfs=None):
+        self.socket_path = socket_path
+        self.interval = interval
+        self.procfs = procfs or '/proc'
+        # pid -> (start time field, exe, mapped paths)
+        self._procs = {}
+        self._index = {}
+        self._dirty = set()
+        self._server = None
+        self._connector = None
+        # Clients are served from their own threads
+        self._lock = threading.Lock()
+
+    def _add(self, pid):
+        proc = Process(pid, self.procfs)
+        if proc.is_kernel_thread:
+            return
+        stat = proc.stat
+        if stat is None:
+            return
+        try:
+            mapped = frozenset(sys.intern(path) for path in proc.mapped_objects())
+        except OSError as e:
+            logging.debug("Can't read maps of %s: %s", proc, e)
+            return
+        self._procs[pid] = (stat[19], proc.exe, mapped)
+        for path in mapped:
+            if path in self._index:
+                self._index[path].add(pid)
+            else:
+                self._index[path] = set([pid])
+
+    def _remove(self, pid):
+        try:
+            dummy, dummy, mapped = self._procs.pop(pid)
+        except KeyError:
+            return
+        for path in mapped:
+            pids = self._index[path]
+            pids.discard(pid)
+            if not pids:
+                del self._index[path]
+
+    def _start_time(self, pid):
+        stat = Process(pid, self.procfs).stat
+        return stat[19] if stat else None
+
+    def rescan(self):
+        """
+        Drop processes that went away and index the ones not seen yet.
+        Processes that exec'ed are reindexed. Without process events
+        reused pids are detected by their start time.
+        """
+        paths = glob.glob(os.path.join(self.procfs, '[0-9]*'))
+        pids = set(int(os.path.basename(path)) for path in paths)
+        for pid in set(self._procs.keys()) - pids:
+            self._remove(pid)
+        for pid in pids:
+            known = self._procs.get(pid)
+            if known is not None and pid not in self._dirty:
+                if self._connector or known[0] == self._start_time(pid):
+                    continue
+            self._remove(pid)
+            self._add(pid)
+        self._dirty.clear()
+
+    def _update_dirty(self):
+        for pid in self._dirty:
+            self._remove(pid)
+            self._add(pid)
+        self._dirty.clear()
+
+    def query(self, paths):
+        """
+        Processes that map any of paths
+
+        @returns: pids grouped by executable
+        @rtype: C{dict}
+        """
+        with self._lock:
+            self._update_dirty()
+            pids = set()
+            for path in paths:
+                pids.update(self._index.get(path, ()))
+            result = {}
+            for pid in sorted(pids):
+                exe = self._procs[pid][1]
+                if exe in result:
+                    result[exe].append(pid)
+                else:
+                    result[exe] = [pid]
+        return result
+
+    def _handle_events(self):
+        try:
+            events = self._connector.read_events()
+        except OSError as e:
+            if e.errno != errno.ENOBUFS:
+                raise
+            # Events got dropped, e.g. during a fork storm, so none of
+            # the known processes can be trusted anymore
+            logging.warning("Lost process events - reindexing all processes")
+            self._dirty.update(self._procs)
+            self.rescan()
+            return
+        for what, pid in events:
+            if what == ProcConnector.PROC_EVENT_EXIT:
+                self._dirty.discard(pid)
+                self._remove(pid)
+            elif what in (ProcConnector.PROC_EVENT_EXEC,
+                          ProcConnector.PROC_EVENT_FORK):
+                self._dirty.add(pid)
+
+    def _handle_client(self, conn):
+        try:
+            conn.settimeout(5)
+            with conn.makefile('rwb') as f:
+                request = json.loads(f.readline().decode('utf-8'))
+                if request.get('version') != PROTOCOL_VERSION:
+                    response = {'error': 'Unsupported protocol version'}
+                else:
+                    response = {'procs': self.query(request['paths'])}
+                f.write(json.dumps(response).encode('utf-8') + b'\n')
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning("Failed to handle client request: %s", e)
+        finally:
+            conn.close()
+
+    def listen(self):
+        try:
+            os.unlink(self.socket_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            self._server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self._server.listen(16)
+
+    def serve_forever(self):
+        self.listen()
+        selector = selectors.DefaultSelector()
+        selector.register(self._server, selectors.EVENT_READ)
+        try:
+            self._connector = ProcConnector()
+            selector.register(self._connector, selectors.EVENT_READ)
+            logging.debug("Following process events via netlink")
+        except OSError as e:
+            logging.info("Process connector unavailable (%s), polling only", e)
+            self._connector = None
+
+        self.rescan()
+        next_scan = time.monotonic() + self.interval
+        while True:
+            timeout = max(next_scan - time.monotonic(), 0)
+            for key, dummy in selector.select(timeout):
+                if key.fileobj is self._server:
+                    conn, dummy = self._server.accept()
+                    # A stalled client mustn't hold up event processing
+                    threading.Thread(target=self._handle_client, args=(conn,),
+                                     daemon=True).start()
+                else:
+                    with self._lock:
+                        self._handle_events()
+            if time.monotonic() >= next_scan:
+                with self._lock:
+                    self.rescan()
+                next_scan = time.monotonic() + self.interval
+
+
+def query(paths, socket_path=SOCKET_PATH, timeout=5):
+    """
+    Ask a running daemon which processes map any of paths
+
+    @returns: pids grouped by executable
+    @rtype: C{dict}
+    @raises DaemonError: if the daemon can't be reached or fails
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            with sock.makefile('rwb') as f:
+                request = {'version': PROTOCOL_VERSION, 'paths': list(paths)}
+                f.write(json.dumps(request).encode('utf-8') + b'\n')
+                f.flush()
+                response = json.loads(f.readline().decode('utf-8'))
+    except (OSError, ValueError) as e:
+        raise DaemonError("Can't query daemon at '%s': %s" % (socket_path, e))
+    if 'error' in response:
+        raise DaemonError(response['error'])
+    return {exe: pids for exe, pids in response['procs'].items()}
+
+
+def main(argv):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option("--debug", action="store_true", dest="debug",
+                      default=False, help="enable debug output")
+    parser.add_option("--socket", dest="socket", default=SOCKET_PATH,
+                      help="Path of the socket to listen on")
+    parser.add_option("--interval", type="int", dest="interval", default=30,
+                      help="Seconds between scans for new processes")
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    logging.basicConfig(level=logging.DEBUG if options.debug else logging.INFO,
+                        format='%(levelname)s: %(message)s')
+
+    daemon = MapsDaemon(options.socket, options.interval)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        logging.error("%s", e)
+        return 1
+    return 0
+
+
+def run():
+    return main(sys.argv)
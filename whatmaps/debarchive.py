@@ -0,0 +1,114 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""List the files in a .deb archive without unpacking it"""
+
+import tarfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class DebArchiveError(Exception):
+    pass
+
+
+class _MemberReader(object):
+    """File like object limited to one member of an ar archive"""
+
+    def __init__(self, f, size):
+        self._f = f
+        self._left = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self._left:
+            size = self._left
+        data = self._f.read(size)
+        self._left -= len(data)
+        return data
+
+
+class DebArchive(object):
+    """
+    A binary package archive
+
+    The ar container is walked to the data member whose tar headers
+    are then read while decompressing the stream. File contents are
+    skipped.
+    """
+    _ar_magic = b'!<arch>\n'
+    _ar_header_size = 60
+    _tar_modes = {
+        'data.tar': 'r|',
+        'data.tar.gz': 'r|gz',
+        'data.tar.xz': 'r|xz',
+        'data.tar.bz2': 'r|bz2',
+        'data.tar.zst': None,
+    }
+
+    def __init__(self, path):
+        self.path = path
+
+    def _data_member(self, f):
+        """Find the data member and return its name and size"""
+        if f.read(len(self._ar_magic)) != self._ar_magic:
+            raise DebArchiveError("'%s' is not an ar archive" % self.path)
+        while True:
+            header = f.read(self._ar_header_size)
+            if len(header) < self._ar_header_size:
+                raise DebArchiveError("No data member in '%s'" % self.path)
+            name = header[:16].decode('ascii', 'replace').strip().rstrip('/')
+            try:
+                size = int(header[48:58])
+            except ValueError:
+                raise DebArchiveError("Corrupt ar header in '%s'" % self.path)
+            if name.startswith('data.tar'):
+                return name, size
+            # Members are aligned to even offsets
+            f.seek(size + size % 2, 1)
+
+    def _open_tar(self, name, member):
+        if name not in self._tar_modes:
+            raise DebArchiveError("Unknown data member '%s' in '%s'" % (name, self.path))
+        mode = self._tar_modes[name]
+        if mode is None:
+            if zstandard is None:
+                raise DebArchiveError("zstandard not installed, can't read '%s'" % self.path)
+            member = zstandard.ZstdDecompressor().stream_reader(member)
+            mode = 'r|'
+        return tarfile.open(fileobj=member, mode=mode)
+
+    def files(self):
+        """
+        The paths of all non directory entries
+
+        @raises DebArchiveError: if the archive can't be read
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                name, size = self._data_member(f)
+                with self._open_tar(name, _MemberReader(f, size)) as tar:
+                    for info in tar:
+                        # Don't accumulate the headers of huge packages
+                        tar.members = []
+                        if not info.isdir():
+                            name = info.name
+                            name = name[2:] if name.startswith('./') else name.lstrip('/')
+                            yield '/' + name
+        except (OSError, EOFError, tarfile.TarError) as e:
+            raise DebArchiveError("Can't read '%s': %s" % (self.path, e))
@@ -26,8 +26,10 @@ import subprocess
 import sys
 import string
 
+from . aptlists import version_origins
 from . distro import Distro
 from . debianpkg import DebianPkg
+from . dpkgdb import DpkgDatabase
 from . pkg import PkgError
 from . systemd import Systemd
 
@@ -53,6 +55,7 @@ class DebianDistro(Distro):
 
     # Per package blacklist
     _pkg_service_blacklist = {'libvirt-bin': ['libvirt-guests']}
+    _database = DpkgDatabase
 
     # Per distro blacklist
     service_blacklist = set(['kvm', 'qemu-kvm', 'qemu-system-x86'])
@@ -66,19 +69,31 @@ class DebianDistro(Distro):
     ])
 
     @classmethod
-    def pkg(klass, name):
-        return DebianPkg(name)
+    def pkg(klass, name, root=None):
+        return DebianPkg(name, root)
 
     @classmethod
     def pkg_by_file(klass, path):
-        find_file = subprocess.Popen(['dpkg-query', '-S', path],
+        name = klass._owners([path])[path]
+        return DebianPkg(name) if name else None
+
+    @classmethod
+    def _query_owners(klass, paths):
+        owners = dict.fromkeys(paths)
+        if not owners:
+            return owners
+        find_file = subprocess.Popen(['dpkg-query', '-S'] + list(owners),
                                      stdout=subprocess.PIPE,
                                      stderr=subprocess.PIPE)
+        # Unowned paths make dpkg-query fail but the others are still listed
         output = find_file.communicate()[0]
-        if find_file.returncode:
-            return None
-        pkg = output.split(':')[0]
-        return DebianPkg(pkg)
+        for line in output.decode('utf-8').split('\n'):
+            if line.startswith('diversion by '):
+                continue
+            names, sep, path = line.partition(': ')
+            if sep and path in owners:
+                owners[path] = names.split(', ')[0].split(':')[0]
+        return owners
 
     @classmethod
     def restart_service_cmd(klass, service):
@@ -123,6 +138,7 @@ class DebianDistro(Distro):
             return None
 
         pkgs = {}
+        debs = {}
         for line in sys.stdin.readlines():
             if not line:
                 break
@@ -132,8 +148,17 @@ class DebianDistro(Distro):
                 if oldversion != '-':  # Updates only
                     pkgs[pkgname] = DebianPkg(pkgname)
                     pkgs[pkgname].version = newversion
+            elif not filename.startswith('**'):
+                debs[pkgname] = filename
+        for pkgname, pkg in pkgs.items():
+            pkg.deb = debs.get(pkgname)
         return pkgs
 
+    @classmethod
+    def load_archive_contents(klass, pkgs, jobs=None):
+        """Read the contents of pkgs from the archives apt installs"""
+        DebianPkg.load_archive_contents(pkgs, jobs)
+
     @classmethod
     def _security_update_origins(klass):
         "Determine security update origins from apt configuration"
@@ -161,26 +186,19 @@ class DebianDistro(Distro):
         if apt_pkg is None:
             raise PkgError("apt_pkg not installed, can't determine security updates")
 
-        apt_pkg.init()
-        apt_pkg.Acquire()
-        cache = apt_pkg.Cache()
-
-        security_update_origins = klass._security_update_origins()
+        # Only the configuration is needed, the origins come from apt's
+        # lists without building the cache
+        apt_pkg.init_config()
+        security_update_origins = set(klass._security_update_origins())
+        origins = version_origins([pkg.name for pkg in pkgs.values()],
+                                  apt_pkg.config.find_dir('Dir::State::lists'))
         security_updates = {}
         notfound = []
 
         for pkg in list(pkgs.values()):
-            try:
-                cache_pkg = cache[pkg.name]
-            except KeyError:
+            pkg_origins = origins(pkg.name, pkg.version)
+            if pkg_origins is None:
                 notfound.append(pkg)
-                continue
-            for cache_version in cache_pkg.version_list:
-                if pkg.version == cache_version.ver_str:
-                    for pfile, _ in cache_version.file_list:
-                        for origin in security_update_origins:
-                            if pfile.origin == origin[0] and \
-                               pfile.archive == origin[1]:
-                                security_updates[pkg] = pkg
-                                break
+            elif not pkg_origins.isdisjoint(security_update_origins):
+                security_updates[pkg] = pkg
         return (security_updates, notfound)
@@ -14,29 +14,90 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
+import logging
 import os
 import re
 
-from . pkg import Pkg
+from . debarchive import DebArchive, DebArchiveError
+from . dpkgdb import DpkgDatabase
+from . pkg import Pkg, PkgContents
 
 
 class DebianPkg(Pkg):
+    """
+    A Debian package
+
+    @ivar deb: the archive apt is about to install or C{None}
+    """
     type = 'Debian'
     _init_script_re = re.compile(r'/etc/init.d/[\w\-\.]')
+    _root_option = ['--admindir=${root}/var/lib/dpkg']
+    _database = DpkgDatabase
     _list_contents = ['dpkg-query', '-L', '${pkg_name}']
+    _list_contents_batch = ['dpkg-query',
+                            '--showformat=${binary:Package}\n${db-fsys:Files}',
+                            '--show']
+
+    def __init__(self, name, root=None):
+        Pkg.__init__(self, name, root)
+        self.deb = None
+
+    @classmethod
+    def _split_contents(klass, lines):
+        """
+        Files are listed indented by a space below the package name.
+        Multi-Arch: same packages are qualified by their architecture.
+        """
+        name = None
+        for line in lines:
+            if line.startswith(' '):
+                yield name, line[1:]
+            elif line.strip():
+                name = line.strip()
 
-    def __init__(self, name):
-        Pkg.__init__(self, name)
+    def _read_archive(self, installed):
+        contents = self._classify(DebArchive(self.deb).files())
+        # Objects mapped by running processes can still be at the
+        # installed version's locations
+        contents.extend(installed)
+        return contents
+
+    @classmethod
+    def load_archive_contents(klass, pkgs, jobs=None):
+        """
+        Fill the contents cache of pkgs from their archives. Archives
+        are read in parallel. Packages without an archive or with an
+        unreadable one are left alone.
+
+        @param jobs: number of archives read at once, C{None} picks a
+                     default based on the number of CPUs
+        """
+        todo = [pkg for pkg in pkgs if pkg.deb and pkg._contents is None]
+        if not todo:
+            return
+        # The database isn't shared with the worker threads so the
+        # installed files are sorted out here
+        installed = {}
+        for pkg in todo:
+            db = klass._open_database(pkg.root)
+            installed[pkg] = PkgContents()
+            if db is not None:
+                try:
+                    klass._classify(db.contents(pkg.name) or [], installed[pkg])
+                except OSError as e:
+                    logging.debug("Can't read package database: %s", e)
+                    installed[pkg] = PkgContents()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(pkg._read_archive, installed[pkg]): pkg for pkg in todo}
+            for future in concurrent.futures.as_completed(futures):
+                pkg = futures[future]
+                try:
+                    pkg._contents = future.result()
+                except DebArchiveError as e:
+                    logging.warning("%s - using installed files of %s", e, pkg.name)
 
     @property
     def services(self):
-        if self._services is not None:
-            return self._services
-
-        self._services = []
-        contents = self._get_contents()
         # Only supports sysvinit so far:
-        for line in contents:
-            if self._init_script_re.match(line):
-                self._services.append(os.path.basename(line.strip()))
-        return self._services
+        return [os.path.basename(path) for path in self._get_contents().init_scripts]
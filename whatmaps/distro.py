@@ -41,6 +41,8 @@ class Distro(object):
       the services listed in values.
     @cvar _pkg_service_blacklist: if we find binaries in the package
       listed as key don't restart services listed in values
+    @cvar _database: class whose open() returns a reader for the
+      package database that avoids invoking the package manager
     """
     id = None
     service_blacklist = set()
@@ -49,10 +51,14 @@ class Distro(object):
     _pkg_services = {}
     _pkg_blacklist = {}
     _pkg_service_blacklist = {}
+    _database = None
 
     @classmethod
-    def pkg(klass, name):
-        """Return package object named name"""
+    def pkg(klass, name, root=None):
+        """
+        Return package object named name. If root is given the package
+        is looked up in the package database below root.
+        """
         raise NotImplementedError
 
     @classmethod
@@ -60,6 +66,55 @@ class Distro(object):
         """Return package object that contains path"""
         raise NotImplementedError
 
+    @classmethod
+    def pkgs_by_files(klass, paths):
+        """
+        Look up the packages that contain paths at once. Paths shipped
+        by the same package share one package object.
+
+        @returns: package object or C{None} by path
+        @rtype: C{dict}
+        """
+        pkgs = {}
+        result = {}
+        for path, name in klass._owners(set(paths)).items():
+            if name is not None and name not in pkgs:
+                pkgs[name] = klass.pkg(name)
+            result[path] = pkgs.get(name)
+        return result
+
+    @classmethod
+    def _owners(klass, paths):
+        """Name of the package that contains each path, C{None} if unowned"""
+        db = klass._database.open() if klass._database else None
+        if db is not None:
+            try:
+                return {path: db.owner(path) for path in paths}
+            except OSError as e:
+                logging.debug("Can't read package database: %s", e)
+        return klass._query_owners(paths)
+
+    @classmethod
+    def _query_owners(klass, paths):
+        """Ask the package manager which packages contain paths"""
+        owners = {}
+        for path in paths:
+            pkg = klass.pkg_by_file(path)
+            owners[path] = pkg.name if pkg else None
+        return owners
+
+    @classmethod
+    def load_contents(klass, pkgs):
+        """
+        Look up the contents of all pkgs at once instead of invoking the
+        package manager for each package separately
+        """
+        types = {}
+        for pkg in pkgs:
+            types.setdefault(type(pkg), []).append(pkg)
+        for pkg_type, same_type in types.items():
+            pkg_type.load_contents(same_type)
+
     @classmethod
     def restart_service_cmd(klass, service):
         """Command to restart service"""
@@ -112,6 +167,10 @@ class Distro(object):
     def detect():
         return detect()
 
+    @staticmethod
+    def detect_root(root):
+        return detect_root(root)
+
 
 import whatmaps.debiandistro  # noqa: E402
 import whatmaps.redhatdistro  # noqa: E402
@@ -151,3 +210,17 @@ def detect():
             return whatmaps.debiandistro.FedoraDistro
         else:
             return None
+
+
+def detect_root(root):
+    """
+    Detect the distribution installed below root, e.g. in a container,
+    by the package database present. Returns C{None} if the
+    distribution is unknown.
+    """
+    if os.path.exists(os.path.join(root, 'var/lib/dpkg/status')):
+        return whatmaps.debiandistro.DebianDistro
+    elif os.path.exists(os.path.join(root, 'var/lib/rpm')):
+        return whatmaps.redhatdistro.FedoraDistro
+    else:
+        return None
@@ -0,0 +1,236 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Read the dpkg database directly instead of invoking dpkg-query"""
+
+import glob
+import os
+
+from . pkgindex import PkgIndex
+
+
+class DpkgDatabase(object):
+    """
+    The dpkg database below a root directory
+
+    @ivar admindir: the dpkg database directory
+    @cvar _databases: opened databases by root directory
+    """
+    _databases = {}
+
+    def __init__(self, root=None):
+        self.admindir = os.path.join(root or '/', 'var', 'lib', 'dpkg')
+        self._status = None
+        self._status_mtime = None
+        self._diversions = None
+        self._owners = None
+
+    @classmethod
+    def open(klass, root=None):
+        """
+        The database below root if it can be read. The running system's
+        database is accessed through the persistent L{PkgIndex} if
+        possible.
+
+        @returns: the database or C{None} if dpkg-query needs to be used
+        @rtype: L{DpkgDatabase} or L{PkgIndex}
+        """
+        try:
+            return klass._databases[root]
+        except KeyError:
+            pass
+        db = klass(root)
+        if not (os.access(os.path.join(db.admindir, 'status'), os.R_OK) and
+                os.access(os.path.join(db.admindir, 'info'), os.R_OK | os.X_OK)):
+            db = None
+        elif root is None:
+            db = PkgIndex.open(db, name='dpkg.sqlite') or db
+        klass._databases[root] = db
+        return db
+
+    @classmethod
+    def close_all(klass):
+        """
+        Close the opened databases, e.g. since their sqlite connections
+        can't be used across fork(). They're reopened on demand.
+        """
+        for db in klass._databases.values():
+            if isinstance(db, PkgIndex):
+                db.close()
+        klass._databases.clear()
+
+    def _path(self, *parts):
+        return os.path.join(self.admindir, *parts)
+
+    @property
+    def status(self):
+        """
+        Architectures of all packages that aren't purged by package name.
+        Reread when the status file changes.
+
+        @rtype: C{dict}
+        """
+        mtime = os.stat(self._path('status')).st_mtime
+        if self._status is not None and mtime == self._status_mtime:
+            return self._status
+
+        status = {}
+        name = arch = state = None
+        with open(self._path('status'), encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if line.startswith('Package: '):
+                    name = line[9:].strip()
+                elif line.startswith('Architecture: '):
+                    arch = line[14:].strip()
+                elif line.startswith('Status: '):
+                    state = line.split()[-1]
+                elif line == '\n':
+                    if name and state != 'not-installed':
+                        status.setdefault(name, []).append(arch)
+                    name = arch = state = None
+        if name and state != 'not-installed':
+            status.setdefault(name, []).append(arch)
+        self._status = status
+        self._status_mtime = mtime
+        self._diversions = None
+        self._owners = None
+        return status
+
+    def _mtime(self, name):
+        try:
+            return os.stat(self._path(name)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def stamp(self):
+        """Changes whenever packages or diversions change"""
+        return '%d:%d' % (self._mtime('status'), self._mtime('diversions'))
+
+    def stamps(self):
+        """
+        Per package stamps derived from the modification times of
+        their .list files. Since diversions affect the contents of
+        packages they're part of every stamp.
+
+        @rtype: C{dict}
+        """
+        status = self.status
+        diversions = self._mtime('diversions')
+        stamps = {}
+        for list_file in sorted(glob.glob(self._path('info', '*.list'))):
+            name = os.path.basename(list_file)[:-5]
+            plain = name.split(':')[0]
+            if plain not in status:
+                continue
+            stamp = '%s@%d' % (name, os.stat(list_file).st_mtime_ns)
+            stamps[plain] = ('%s %s' % (stamps[plain], stamp) if plain in stamps
+                             else '%d %s' % (diversions, stamp))
+        return stamps
+
+    @property
+    def diversions(self):
+        """
+        Diversions as (diverted to, diverting package) by diverted path.
+        The package is C{None} for local diversions.
+
+        @rtype: C{dict}
+        """
+        if self._diversions is not None:
+            return self._diversions
+
+        self._diversions = {}
+        try:
+            with open(self._path('diversions'), encoding='utf-8') as f:
+                lines = f.read().split('\n')
+        except FileNotFoundError:
+            return self._diversions
+        for i in range(0, len(lines) - 2, 3):
+            diverted, to, pkg = lines[i:i + 3]
+            self._diversions[diverted] = (to, None if pkg == ':' else pkg)
+        return self._diversions
+
+    def _list_files(self, name):
+        """The .list files of package name"""
+        if ':' in name:
+            name, arch = name.split(':', 1)
+            arches = [arch] if arch in self.status.get(name, []) else []
+        else:
+            arches = self.status.get(name, [])
+        files = []
+        for arch in arches:
+            # Only Multi-Arch: same packages have their list qualified
+            for candidate in ['%s:%s.list' % (name, arch), '%s.list' % name]:
+                path = self._path('info', candidate)
+                if os.path.exists(path):
+                    files.append(path)
+                    break
+        return files
+
+    def _read_list(self, path):
+        with open(path, encoding='utf-8', errors='surrogateescape') as f:
+            for line in f:
+                if line != '/.\n':
+                    yield line.rstrip('\n')
+
+    def contents(self, name):
+        """
+        Files of package name with diverted files at their diverted
+        location. A name without architecture qualifier covers all
+        installed architectures. The files are read while iterating.
+
+        @returns: iterable of files or C{None} if the package isn't installed
+        @raises OSError: if the list files can't be read
+        """
+        list_files = self._list_files(name)
+        if not list_files:
+            return None
+        return self._contents(name.split(':')[0], list_files)
+
+    def _contents(self, name, list_files):
+        diversions = self.diversions
+        for list_file in list_files:
+            for path in self._read_list(list_file):
+                diversion = diversions.get(path)
+                if diversion and diversion[1] != name:
+                    path = diversion[0]
+                yield path
+
+    def owner(self, path):
+        """
+        Name of the package that ships path. The file index is built
+        on first use.
+
+        @returns: the package name or C{None}
+        @rtype: C{str}
+        """
+        self.status  # drops the index when the database changed
+        if self._owners is None:
+            self._build_owners()
+        return self._owners.get(path)
+
+    def _build_owners(self):
+        status = self.status
+        owners = {}
+        for list_file in glob.glob(self._path('info', '*.list')):
+            name = os.path.basename(list_file)[:-5].split(':')[0]
+            if name not in status:
+                continue
+            for path in self._read_list(list_file):
+                diversion = self.diversions.get(path)
+                if diversion and diversion[1] != name:
+                    path = diversion[0]
+                owners[path] = name
+        self._owners = owners
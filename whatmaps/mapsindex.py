@@ -0,0 +1,186 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import concurrent.futures
+import os
+
+
+class FileIdCache(object):
+    """
+    Cache of the device and inode numbers and the canonical paths of
+    files so each file is only looked at once
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._realpaths = {}
+
+    def file_id(self, path):
+        """
+        The (major, minor, inode) tuple of the file at path as used in
+        /proc/<pid>/maps or C{None} if it doesn't exist
+        """
+        try:
+            return self._ids[path]
+        except KeyError:
+            pass
+        try:
+            st = os.stat(path)
+            file_id = (os.major(st.st_dev), os.minor(st.st_dev), st.st_ino)
+        except OSError:
+            file_id = None
+        self._ids[path] = file_id
+        return file_id
+
+    def realpath(self, path):
+        """The canonical path of path, e.g. /usr/lib for /lib on merged /usr"""
+        try:
+            return self._realpaths[path]
+        except KeyError:
+            realpath = self._realpaths[path] = os.path.realpath(path)
+            return realpath
+
+
+class MapsIndex(object):
+    """
+    Inverted index of the objects mapped by a set of processes
+
+    Each process' maps are read once and every mapped path points to
+    the processes mapping it so a list of shared objects can be matched
+    against all processes in one pass. If the objects of interest are
+    known upfront via targets reading a process' maps stops at the
+    first target found and only that one is indexed.
+
+    With inodes targets are matched by their device and inode numbers
+    instead of their path. This catches objects mapped via different
+    paths like /lib vs. /usr/lib on merged /usr systems or symlinks.
+
+    Up to jobs processes' maps are read at once.
+
+    @ivar nr_maps: number of maps entries read while building the index
+    @ivar comparisons_saved: path comparisons saved by the last match
+       compared to checking every shared object against every process
+    """
+
+    def __init__(self, procs=None, targets=None, inodes=False, cache=None, jobs=1):
+        self._targets = None
+        self._inodes = inodes
+        if inodes:
+            self._init_inodes(targets, cache or FileIdCache())
+        elif targets is not None:
+            self._targets = set(os.fsencode(path) for path in targets)
+        self._procs = []
+        self._index = {}
+        self.nr_maps = 0
+        self.comparisons_saved = 0
+        self.add_all(procs or [], jobs)
+
+    def _init_inodes(self, targets, cache):
+        self._cache = cache
+        self._ids = {}
+        self._realpaths = {}
+        for path in targets:
+            file_id = cache.file_id(path)
+            if file_id is not None:
+                self._ids.setdefault(file_id[2], (file_id[:2], path))
+            self._realpaths.setdefault(cache.realpath(path), path)
+
+    def _resolve(self, path):
+        return self._realpaths.get(self._cache.realpath(path))
+
+    def _find(self, proc):
+        """The objects mapped by proc that get indexed"""
+        if self._inodes:
+            path = proc.find_mapped_id(self._ids, self._resolve)
+        elif self._targets is None:
+            return proc.mapped_objects()
+        else:
+            path = proc.find_mapped(self._targets)
+        return [] if path is None else [path]
+
+    def add(self, proc):
+        """
+        Add the mapped objects of proc to the index
+
+        @returns: whether any object mapped by proc got indexed
+        @rtype: C{bool}
+        """
+        return self._add(proc, self._find(proc))
+
+    def add_all(self, procs, jobs=1):
+        """
+        Add the mapped objects of procs to the index reading up to
+        jobs processes' maps at once
+        """
+        if jobs <= 1:
+            for proc in procs:
+                self.add(proc)
+            return
+        procs = list(procs)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            for proc, mapped in zip(procs, executor.map(self._find, procs)):
+                self._add(proc, mapped)
+
+    def _add(self, proc, mapped):
+        self._procs.append(proc)
+        for path in mapped:
+            if path in self._index:
+                self._index[path].append(proc)
+            else:
+                self._index[path] = [proc]
+        self.nr_maps += proc.nr_maps
+        return bool(mapped)
+
+    def paths(self):
+        """The indexed paths"""
+        return self._index.keys()
+
+    def procs_mapping(self, path):
+        """List of processes mapping path"""
+        return self._index.get(path, [])
+
+    def match(self, shared_objects):
+        """
+        Find the processes that map any of shared_objects
+
+        @returns: processes grouped by their executable
+        @rtype: C{dict}
+        """
+        # Position of the first shared object that matched per process
+        # to calculate what a per process scan would have cost
+        first_match = {}
+        lookups = 0
+        for pos, so in enumerate(shared_objects):
+            lookups += 1
+            for proc in self._index.get(so, []):
+                if id(proc) not in first_match:
+                    first_match[id(proc)] = pos
+
+        restart_procs = {}
+        naive = 0
+        for proc in self._procs:
+            pos = first_match.get(id(proc))
+            if pos is None:
+                naive += proc.nr_maps * len(shared_objects)
+                continue
+            naive += proc.nr_maps * (pos + 1)
+            if proc.exe in restart_procs:
+                restart_procs[proc.exe] += [proc]
+            else:
+                restart_procs[proc.exe] = [proc]
+        self.comparisons_saved = max(naive - lookups, 0)
+        return restart_procs
@@ -15,6 +15,8 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import itertools
+import logging
 import re
 import string
 import subprocess
@@ -24,59 +26,210 @@ class PkgError(Exception):
     pass
 
 
+class PkgContents(object):
+    """
+    The files of a package whatmaps cares about, everything else is
+    dropped while reading the package's file list
+
+    @ivar shared_objects: shared objects
+    @ivar init_scripts: sysv init scripts
+    @ivar units: systemd unit files
+    """
+    __slots__ = ('shared_objects', 'init_scripts', 'units')
+
+    def __init__(self):
+        self.shared_objects = []
+        self.init_scripts = []
+        self.units = []
+
+    def __iter__(self):
+        return itertools.chain(self.shared_objects, self.init_scripts, self.units)
+
+    def extend(self, other):
+        self.shared_objects.extend(other.shared_objects)
+        self.init_scripts.extend(other.init_scripts)
+        self.units.extend(other.units)
+
+
 class Pkg(object):
     """
     A package in a distribution
     @var services:  list of services provided by package
     @var shared_objects: list of shared objects shipped in this package
     @cvar type: package type (e.g. RPM or Debian)
-    @cvar _so_regex: regex that matches shared objects in the list returned by
-                     _get_contents
+    @cvar _so_regex: regex that matches shared objects in the package's
+                     file list
+    @cvar _init_script_re: regex that matches sysv init scripts
+    @cvar _unit_re: regex that matches systemd service units
     @cvar _list_contents: command to list contents of a package, will be passed
                      to subprocess. "$pkg_name" will be replaced by the package
                      name.
+    @cvar _list_contents_batch: command to list the contents of several
+                     packages at once, the package names get appended.
+                     C{None} if the package type doesn't support this.
+    @cvar _root_option: options inserted after the command name to operate on
+                     the package database below another root directory.
+                     "$root" will be replaced by the root directory.
+    @cvar batch_size: maximum number of packages passed to a single
+                     invocation of _list_contents_batch
+    @cvar _database: class whose open(root) returns a reader for the
+                     package database that avoids invoking the package
+                     manager or C{None} if there's none
+    @ivar root: root directory of the system the package is installed in,
+                C{None} for the running system
     """
 
     type = None
     services = None
     _so_regex = re.compile(r'(?P<so>/.*\.so(\.[^/]*)?$)')
+    _init_script_re = None
+    _unit_re = re.compile(r'/(usr/)?lib/systemd/system/[^/]+\.service$')
     _list_contents = None
+    _list_contents_batch = None
+    _root_option = []
+    _database = None
+    batch_size = 100
+    _classifiers = {}
 
-    def __init__(self, name):
+    def __init__(self, name, root=None):
         self.name = name
-        self._services = None
-        self._shared_objects = None
+        self.root = root
         self._contents = None
 
     def __repr__(self):
         return "<%s Pkg object name:'%s'>" % (self.type, self.name)
 
+    @classmethod
+    def _open_database(klass, root):
+        return klass._database.open(root) if klass._database else None
+
+    @classmethod
+    def _classify(klass, paths, contents=None):
+        """
+        Sort the interesting files out of paths in a single pass
+
+        @param paths: iterable of paths, a trailing newline is ignored
+        @param contents: L{PkgContents} to add to, a new one if C{None}
+        @rtype: L{PkgContents}
+        """
+        try:
+            match = klass._classifiers[klass]
+        except KeyError:
+            patterns = [klass._so_regex.pattern,
+                        '(?P<unit>%s)' % klass._unit_re.pattern]
+            if klass._init_script_re:
+                patterns.append('(?P<init>%s)' % klass._init_script_re.pattern)
+            match = klass._classifiers[klass] = re.compile('|'.join(patterns)).match
+
+        if contents is None:
+            contents = PkgContents()
+        for path in paths:
+            m = match(path.rstrip('\n'))
+            if m is None:
+                continue
+            if m.group('so'):
+                contents.shared_objects.append(m.group('so'))
+            elif m.group('unit'):
+                contents.units.append(m.group('unit'))
+            else:
+                contents.init_scripts.append(m.string)
+        return contents
+
     def _get_contents(self):
-        """List of files in the package"""
-        if self._contents:
+        """
+        The interesting files in the package, the file list is read
+        only once and not kept around
+
+        @rtype: L{PkgContents}
+        """
+        if self._contents is not None:
             return self._contents
-        else:
-            cmd = [string.Template(arg).substitute(arg, pkg_name=self.name)
-                   for arg in self._list_contents]
-            list_contents = subprocess.Popen(cmd,
-                                             stdout=subprocess.PIPE,
-                                             stderr=subprocess.PIPE)
-        output = list_contents.communicate()[0]
-        if list_contents.returncode:
+        db = self._open_database(self.root)
+        if db is not None:
+            try:
+                contents = db.contents(self.name)
+                if contents is None:
+                    raise PkgError("Failed to list package contents for '%s'" % self.name)
+                self._contents = self._classify(contents)
+                return self._contents
+            except OSError as e:
+                logging.debug("Can't read package database: %s", e)
+
+        cmd = list(self._list_contents)
+        if self.root:
+            cmd[1:1] = self._root_option
+        cmd = [string.Template(arg).substitute(arg, pkg_name=self.name,
+                                               root=self.root)
+               for arg in cmd]
+        list_contents = subprocess.Popen(cmd,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL)
+        with list_contents.stdout:
+            contents = self._classify(line.decode('utf-8', 'surrogateescape')
+                                      for line in list_contents.stdout)
+        if list_contents.wait():
             raise PkgError("Failed to list package contents for '%s'" % self.name)
-        self._contents = output.decode('utf-8').split('\n')
+        self._contents = contents
         return self._contents
 
-    @property
-    def shared_objects(self):
-        if self._shared_objects is not None:
-            return self._shared_objects
+    @classmethod
+    def _split_contents(klass, lines):
+        """
+        Split the output of _list_contents_batch into the files of the
+        individual packages
 
-        self._shared_objects = []
-        contents = self._get_contents()
+        @param lines: the decoded output lines
+        @returns: (package name, path) tuples in output order
+        """
+        raise NotImplementedError
 
-        for line in contents:
-            m = self._so_regex.match(line)
-            if m:
-                self._shared_objects.append(m.group('so'))
-        return self._shared_objects
+    @classmethod
+    def load_contents(klass, pkgs):
+        """
+        Fill the contents cache of pkgs using as few invocations of
+        _list_contents_batch as possible. Packages that don't show up
+        in the output are left alone so L{_get_contents} runs
+        _list_contents for each of them and reports the failure as
+        before. Packages in a database that can be
+        read directly are skipped since they don't need the package
+        manager anyway.
+        """
+        if klass._list_contents_batch is None:
+            return
+
+        roots = {}
+        for pkg in pkgs:
+            if pkg._contents is None and klass._open_database(pkg.root) is None:
+                roots.setdefault(pkg.root, []).append(pkg)
+
+        for root, todo in roots.items():
+            for i in range(0, len(todo), klass.batch_size):
+                chunk = todo[i:i + klass.batch_size]
+                cmd = list(klass._list_contents_batch)
+                if root:
+                    cmd[1:1] = [string.Template(arg).substitute(root=root)
+                                for arg in klass._root_option]
+                cmd += [pkg.name for pkg in chunk]
+                list_contents = subprocess.Popen(cmd,
+                                                 stdout=subprocess.PIPE,
+                                                 stderr=subprocess.DEVNULL)
+                found = {}
+                with list_contents.stdout:
+                    lines = (line.decode('utf-8', 'surrogateescape')
+                             for line in list_contents.stdout)
+                    for name, files in itertools.groupby(klass._split_contents(lines),
+                                                         key=lambda entry: entry[0]):
+                        klass._classify((path for dummy, path in files),
+                                        found.setdefault(name, PkgContents()))
+                # Unknown packages make the command fail but the other
+                # packages are listed nevertheless
+                list_contents.wait()
+                # Multi-arch packages are listed with their architecture
+                for name in [name for name in found if ':' in name]:
+                    found.setdefault(name.split(':')[0], PkgContents()).extend(found[name])
+                for pkg in chunk:
+                    pkg._contents = found.get(pkg.name)
+
+    @property
+    def shared_objects(self):
+        return self._get_contents().shared_objects
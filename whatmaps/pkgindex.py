@@ -0,0 +1,207 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Persistent index of package contents
+
+The index is a sqlite database mapping packages to their files and
+files to their packages. It's filled from a package database like
+L{whatmaps.dpkgdb.DpkgDatabase} that provides:
+
+ - stamp(): changes whenever any package changes
+ - stamps(): a per package stamp that changes with the package
+ - contents(name): the files of a package
+
+Only packages whose stamp changed get reindexed.
+"""
+
+import contextlib
+import fcntl
+import logging
+import os
+import sqlite3
+
+CACHE_DIR = '/var/cache/whatmaps'
+
+
+class SqliteIndex(object):
+    """
+    A sqlite database below the cache directory that is shared between
+    concurrent runs and rebuilt on schema changes
+
+    @ivar source: the data the index is filled from
+    @cvar version: version of the database schema
+    @cvar _tables: tables in the schema
+    @cvar _schema: statements creating the schema
+    """
+    version = 1
+    _tables = []
+    _schema = []
+    _name = None
+
+    def __init__(self, source, path):
+        self.source = source
+        self.path = path
+        self._lock_path = path + '.lock'
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        with self._locked():
+            self._init_schema()
+
+    @classmethod
+    def open(klass, source, cache_dir=CACHE_DIR, name=None):
+        """
+        The index for source below cache_dir
+
+        @returns: the index or C{None} if it can't be used
+        """
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            return klass(source, os.path.join(cache_dir, name or klass._name))
+        except (OSError, sqlite3.Error) as e:
+            logging.debug("%s unavailable: %s", klass.__name__, e)
+            return None
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serialize index updates between concurrent runs"""
+        with open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _init_schema(self):
+        row = self._conn.execute('PRAGMA user_version').fetchone()
+        if row[0] == self.version:
+            return
+        with self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            for table in self._tables:
+                self._conn.execute('DROP TABLE IF EXISTS %s' % table)
+            for statement in self._schema:
+                self._conn.execute(statement)
+            self._conn.execute('PRAGMA user_version=%d' % self.version)
+
+    def close(self):
+        self._conn.close()
+
+    def _meta(self, key):
+        row = self._conn.execute('SELECT value FROM meta WHERE key=?', (key,)).fetchone()
+        return row[0] if row else None
+
+
+class PkgIndex(SqliteIndex):
+    """
+    Package contents index backed by sqlite
+
+    @ivar source: the package database the index is filled from
+    """
+    _tables = ['files', 'pkgs', 'meta']
+    _schema = [
+        'CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)',
+        'CREATE TABLE pkgs (id INTEGER PRIMARY KEY, name TEXT UNIQUE, stamp TEXT)',
+        'CREATE TABLE files (path TEXT, pkg INTEGER, PRIMARY KEY (path, pkg)) WITHOUT ROWID',
+        'CREATE INDEX files_pkg ON files (pkg)',
+    ]
+    _name = 'pkgindex.sqlite'
+
+    def sync(self):
+        """
+        Bring the index up to date with the package database
+
+        @returns: number of reindexed packages
+        @rtype: C{int}
+        """
+        stamp = self.source.stamp()
+        if self._meta('stamp') == stamp:
+            return 0
+
+        with self._locked():
+            # Another run might have updated the index meanwhile
+            if self._meta('stamp') == stamp:
+                return 0
+            stamps = self.source.stamps()
+            indexed = {name: (pkg_id, pkg_stamp) for pkg_id, name, pkg_stamp
+                       in self._conn.execute('SELECT id, name, stamp FROM pkgs')}
+            updated = 0
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                for name, (pkg_id, pkg_stamp) in indexed.items():
+                    if stamps.get(name) != pkg_stamp:
+                        self._conn.execute('DELETE FROM files WHERE pkg=?', (pkg_id,))
+                        self._conn.execute('DELETE FROM pkgs WHERE id=?', (pkg_id,))
+                for name, pkg_stamp in stamps.items():
+                    if name in indexed and indexed[name][1] == pkg_stamp:
+                        continue
+                    contents = self.source.contents(name)
+                    if contents is None:
+                        continue
+                    pkg_id = self._conn.execute('INSERT INTO pkgs (name, stamp) VALUES (?, ?)',
+                                                (name, pkg_stamp)).lastrowid
+                    self._conn.executemany('INSERT OR IGNORE INTO files VALUES (?, ?)',
+                                           ((path, pkg_id) for path in contents))
+                    updated += 1
+                self._conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                                   ('stamp', stamp))
+        logging.debug("Reindexed %d packages", updated)
+        return updated
+
+    def contents(self, name):
+        """
+        Files of package name. They're read from the index while
+        iterating so huge packages aren't held in memory.
+
+        @returns: iterator over the files or C{None} if the package
+            isn't installed
+        """
+        if ':' in name:
+            return self.source.contents(name)
+        try:
+            self.sync()
+            row = self._conn.execute('SELECT id FROM pkgs WHERE name=?', (name,)).fetchone()
+            if row is None:
+                return None
+            return self._files(self._conn.execute('SELECT path FROM files WHERE pkg=?',
+                                                  (row[0],)))
+        except sqlite3.Error as e:
+            logging.warning("Package index unusable: %s", e)
+            return self.source.contents(name)
+
+    @staticmethod
+    def _files(cursor):
+        try:
+            for path, in cursor:
+                yield path
+        except sqlite3.Error as e:
+            raise OSError("Package index unusable: %s" % e)
+
+    def owner(self, path):
+        """
+        Name of the package that ships path
+
+        @returns: the package name or C{None}
+        @rtype: C{str}
+        """
+        try:
+            self.sync()
+            row = self._conn.execute('SELECT name FROM files JOIN pkgs ON files.pkg=pkgs.id '
+                                     'WHERE path=? LIMIT 1', (path,)).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logging.warning("Package index unusable: %s", e)
+            return self.source.owner(path)
@@ -19,30 +19,198 @@ import errno
 import logging
 import os
 import re
+import threading
+
+_unset = object()
+
+# Size of the buffer maps are read into
+MAPS_BUFSIZE = 256 * 1024
+_maps_buffer = threading.local()
+# Everything from the first '/' to the end of the line is the path of a
+# file backed mapping
+_maps_path_re = re.compile(rb'/[^\n]*')
+# Device, inode and path of a file backed mapping
+_maps_id_re = re.compile(rb'([0-9a-f]+):([0-9a-f]+) ([0-9]+) +(/[^\n]*)')
+
+
+def _strip_deleted(paths):
+    for path in paths:
+        yield path[:-10] if path.endswith(b' (deleted)') else path
+
+
+_boot_times = {}
+
+
+def _boot_time(procfs):
+    """Boot time in seconds since the epoch as listed in /proc/stat"""
+    try:
+        return _boot_times[procfs]
+    except KeyError:
+        pass
+    btime = None
+    try:
+        with open(os.path.join(procfs, 'stat'), 'rb') as f:
+            for line in f:
+                if line.startswith(b'btime '):
+                    btime = int(line.split()[1])
+                    break
+    except (OSError, ValueError):
+        pass
+    _boot_times[procfs] = btime
+    return btime
 
 
 class Process(object):
-    """A process - Linux only so far, needs /proc mounted"""
+    """
+    A process - Linux only so far, needs /proc mounted
+
+    The executable, command line and maps are read lazily on first
+    access and at most once.
+    """
+    __slots__ = ('procfs', 'pid', 'mapped', 'nr_maps',
+                 '_exe', '_deleted', '_cmdline', '_stat', '_mnt_ns', '_cgroup')
+
     deleted_re = re.compile(r"(?P<exe>.*) \(deleted\)$")
+    # Deleted mappings that don't stem from a file replaced on disk
+    deleted_ignore_re = re.compile(r"^/(memfd:|SYSV|dev/|run/|tmp/|var/tmp/|proc/|drm mm|"
+                                   r"\[aio\]|anon_hugepage)")
+    # Flag in /proc/<pid>/stat marking kernel threads
+    PF_KTHREAD = 0x00200000
 
     def __init__(self, pid, procfs=None):
         self.procfs = procfs or '/proc'
         self.pid = pid
-        self.mapped = []
-        self.deleted = False
+        self.mapped = None
+        self.nr_maps = 0
+        self._exe = _unset
+        self._deleted = False
+        self._cmdline = _unset
+        self._stat = _unset
+        self._mnt_ns = _unset
+        self._cgroup = _unset
+
+    def _read_exe(self):
+        try:
+            exe = os.readlink(self._procpath(str(self.pid), 'exe'))
+        except OSError:
+            self._exe = None
+            return
+        m = self.deleted_re.match(exe)
+        if m:
+            exe = m.group('exe')
+            self._deleted = True
+            logging.debug("Using deleted exe %s", exe)
+        self._exe = exe
+
+    @property
+    def exe(self):
+        if self._exe is _unset:
+            self._read_exe()
+        return self._exe
+
+    @property
+    def deleted(self):
+        """Whether the executable got deleted"""
+        if self._exe is _unset:
+            self._read_exe()
+        return self._deleted
+
+    @property
+    def cmdline(self):
+        if self._cmdline is _unset:
+            self._cmdline = None
+            if self.exe is not None:
+                try:
+                    with open(self._procpath('%d/cmdline' % self.pid)) as f:
+                        self._cmdline = f.read()
+                except OSError:
+                    pass
+        return self._cmdline
+
+    @property
+    def start_time(self):
+        """
+        The time the process started in seconds since the epoch or
+        C{None} if unknown
+        """
+        if self._stat is _unset:
+            self._read_stat()
+        boot_time = _boot_time(self.procfs)
+        try:
+            return boot_time + int(self._stat[19]) / os.sysconf('SC_CLK_TCK')
+        except (TypeError, IndexError, ValueError):
+            return None
+
+    @property
+    def mnt_ns(self):
+        """The mount namespace of the process like 'mnt:[4026531841]'"""
+        if self._mnt_ns is _unset:
+            try:
+                self._mnt_ns = os.readlink(self._procpath(str(self.pid), 'ns', 'mnt'))
+            except OSError:
+                self._mnt_ns = None
+        return self._mnt_ns
+
+    @property
+    def cgroup(self):
+        """
+        The path of the process in systemd's cgroup hierarchy like
+        '/system.slice/cron.service' or C{None} if unknown. On hybrid
+        setups the legacy name=systemd hierarchy is used.
+        """
+        if self._cgroup is _unset:
+            self._cgroup = None
+            try:
+                with open(self._procpath(str(self.pid), 'cgroup')) as f:
+                    lines = f.read().splitlines()
+            except OSError:
+                return None
+            for line in lines:
+                dummy, controllers, path = line.split(':', 2)
+                if controllers == 'name=systemd':
+                    self._cgroup = path
+                    break
+                elif line.startswith('0::'):
+                    self._cgroup = path
+        return self._cgroup
+
+    @property
+    def root(self):
+        """The root directory of the process as seen from our namespace"""
+        return self._procpath(str(self.pid), 'root')
+
+    @property
+    def stat(self):
+        """The fields of /proc/<pid>/stat following the command name"""
+        if self._stat is _unset:
+            self._read_stat()
+        return self._stat
+
+    def _read_stat(self):
+        """
+        Read the fields of /proc/<pid>/stat following the command name
+        """
+        self._stat = None
         try:
-            self.exe = os.readlink(self._procpath(str(self.pid), 'exe'))
-            m = self.deleted_re.match(self.exe)
-            if m:
-                self.exe = m.group('exe')
-                self.deleted = True
-                logging.debug("Using deleted exe %s", self.exe)
-            if not os.path.exists(self.exe):
-                logging.debug("%s doesn't exist", self.exe)
-            self.cmdline = open(self._procpath('%d/cmdline' % self.pid)).read()
+            with open(self._procpath('%d/stat' % self.pid), 'rb') as f:
+                stat = f.read()
         except OSError:
-            self.exe = None
-            self.cmdline = None
+            return
+        # The command name may contain spaces and parens itself
+        self._stat = stat.rpartition(b')')[2].split()
+
+    @property
+    def is_kernel_thread(self):
+        """
+        Whether the process is a kernel thread. Only needs a single read
+        of /proc/<pid>/stat.
+        """
+        if self._stat is _unset:
+            self._read_stat()
+        try:
+            return bool(int(self._stat[6]) & self.PF_KTHREAD)
+        except (TypeError, IndexError, ValueError):
+            return False
 
     def _procpath(self, *args):
         """
@@ -50,28 +218,189 @@ class Process(object):
         """
         return os.path.join(self.procfs, *args)
 
-    def _read_maps(self):
-        """Read the SOs from /proc/<pid>/maps"""
+    def _maps_chunks(self):
+        """
+        Read /proc/<pid>/maps in large chunks into a per thread buffer
+
+        Yields the buffer and the length of the complete lines in it. The
+        buffer is reused so it must be parsed before the next chunk is
+        requested.
+        """
+        self.nr_maps = 0
         try:
-            f = open(self._procpath('%d/maps' % self.pid))
+            f = open(self._procpath('%d/maps' % self.pid), 'rb', buffering=0)
         except IOError as e:
             # ignore killed process
             if e.errno != errno.ENOENT:
                 raise
             return
-        for line in f:
-            try:
-                so = line.split()[5].strip()
-                self.mapped.append(so)
-            except IndexError:
-                pass
 
-    def maps(self, path):
-        """Check if the process maps the object at path"""
-        if not self.mapped:
+        buf = getattr(_maps_buffer, 'buf', None)
+        if buf is None:
+            buf = _maps_buffer.buf = bytearray(MAPS_BUFSIZE)
+        view = memoryview(buf)
+        start = 0
+        try:
+            with f:
+                while True:
+                    try:
+                        n = f.readinto(view[start:])
+                    except ProcessLookupError:
+                        n = 0
+                    end = start + n
+                    # Only hand out complete lines unless at EOF
+                    last = buf.rfind(b'\n', 0, end) + 1 if n else end
+                    self.nr_maps += buf.count(b'\n', 0, last)
+                    if n == 0 and end:
+                        self.nr_maps += 1
+                    yield buf, last
+                    if not n:
+                        break
+                    # Keep the incomplete last line for the next chunk
+                    start = end - last
+                    buf[:start] = buf[last:end]
+                    if start == len(buf):
+                        view.release()
+                        buf.extend(bytes(len(buf)))
+                        view = memoryview(buf)
+        finally:
+            view.release()
+
+    def _scan_maps(self, targets=None):
+        """
+        Scan /proc/<pid>/maps for the paths of file backed mappings
+
+        The paths are extracted per chunk. Anonymous and pseudo mappings
+        like [heap] or [stack] have no path starting with '/' and are
+        skipped without creating any objects.
+
+        @param targets: if given stop reading at the first chunk that
+            maps any of these paths
+        @returns: the mapped paths as C{bytes}, if targets is given
+            only the ones in targets
+        @rtype: C{set}
+        """
+        mapped = set()
+        for buf, end in self._maps_chunks():
+            paths = _maps_path_re.findall(buf, 0, end)
+            if targets is None:
+                mapped.update(paths)
+            else:
+                found = targets.intersection(_strip_deleted(paths))
+                if found:
+                    return found
+        if targets is None:
+            mapped = set(_strip_deleted(mapped))
+        return mapped
+
+    def find_mapped_id(self, ids, resolve):
+        """
+        Find an object mapped by the process by its device and inode
+        number as listed in /proc/<pid>/maps. Stops reading the process'
+        maps once a match is found.
+
+        Mappings of deleted files can't be matched by inode since the
+        replacement has a different one. The device in the maps doesn't
+        necessarily match the file's st_dev either, e.g. on btrfs or
+        overlayfs. The paths of such mappings are handed to resolve
+        instead.
+
+        @param ids: maps the inode numbers of the objects to look for to
+            their (major, minor) device numbers and the value to return
+            on a match
+        @type ids: C{dict}
+        @param resolve: called with the path of a deleted mapping or
+            of one whose inode but not device matches as C{str}, returns
+            the value to return on a match or C{None}
+        @returns: the value of the matching object or C{None}
+        """
+        for buf, end in self._maps_chunks():
+            for major, minor, inode, path in _maps_id_re.findall(buf, 0, end):
+                if path.endswith(b' (deleted)'):
+                    found = resolve(os.fsdecode(path[:-10]))
+                else:
+                    entry = ids.get(int(inode))
+                    if entry is None:
+                        continue
+                    dev, found = entry
+                    if dev != (int(major, 16), int(minor, 16)):
+                        found = resolve(os.fsdecode(path))
+                if found is not None:
+                    return found
+        return None
+
+    def find_deleted_mapping(self, cache, root=None):
+        """
+        Find a file backed mapping whose file got deleted or replaced on
+        disk. Replaced files are detected by comparing the inode number
+        from the maps with the one of the file currently on disk. The
+        device is not compared since it doesn't necessarily match
+        e.g. on btrfs or overlayfs.
+
+        @param cache: cache of device and inode numbers
+        @type cache: L{whatmaps.mapsindex.FileIdCache}
+        @param root: directory the mapped paths are relative to, e.g.
+            L{root} for processes in another mount namespace
+        @returns: the path of the stale object or C{None}
+        """
+        for buf, end in self._maps_chunks():
+            for dummy, dummy, inode, path in _maps_id_re.findall(buf, 0, end):
+                path = os.fsdecode(path)
+                m = self.deleted_re.match(path)
+                if m:
+                    path = m.group('exe')
+                if self.deleted_ignore_re.match(path):
+                    continue
+                if m:
+                    return path
+                file_id = cache.file_id(root + path if root else path)
+                if file_id is None or file_id[2] != int(inode):
+                    return path
+        return None
+
+    def mapped_entries(self):
+        """
+        The unique file backed mappings of the process as (device,
+        inode, path) tuples with the device like 'fe:02'. Paths of
+        deleted files keep their ' (deleted)' suffix.
+        """
+        entries = set()
+        for buf, end in self._maps_chunks():
+            entries.update(_maps_id_re.findall(buf, 0, end))
+        return set(('%s:%s' % (major.decode(), minor.decode()), int(inode), os.fsdecode(path))
+                   for major, minor, inode, path in entries)
+
+    def _read_maps(self):
+        """Read the unique SOs from /proc/<pid>/maps"""
+        self.mapped = set(os.fsdecode(path) for path in self._scan_maps())
+
+    def find_mapped(self, targets):
+        """
+        Find an object out of targets mapped by the process. Stops
+        reading the process' maps once a match is found.
+
+        @param targets: paths of the objects to look for as C{bytes}
+        @type targets: C{set}
+        @returns: the path of the mapped object or C{None}
+        """
+        if self.mapped is not None:
+            for path in sorted(self.mapped):
+                if os.fsencode(path) in targets:
+                    return path
+            return None
+
+        found = self._scan_maps(targets)
+        return os.fsdecode(min(found)) if found else None
+
+    def mapped_objects(self):
+        """The set of objects mapped by the process"""
+        if self.mapped is None:
             self._read_maps()
+        return self.mapped
 
-        return True if path in self.mapped else False
+    def maps(self, path):
+        """Check if the process maps the object at path"""
+        return True if path in self.mapped_objects() else False
 
     def __repr__(self):
         return "<Process object pid:%d>" % self.pid
@@ -15,36 +15,44 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import re
 import subprocess
 
 from . distro import Distro
+from . rpmdb import RpmDatabase
 from . rpmpkg import RpmPkg
 
 
 class RedHatDistro(Distro):
     """RPM based distribution"""
-    _pkg_re = re.compile(r'(?P<pkg>[\w\-\+]+)-(?P<ver>[\w\.]+)'
-                         r'-(?P<rel>[\w\.]+)\.(?P<arch>.+)')
+    _database = RpmDatabase
 
     @classmethod
-    def pkg(klass, name):
-        return RpmPkg(name)
+    def pkg(klass, name, root=None):
+        return RpmPkg(name, root)
 
     @classmethod
     def pkg_by_file(klass, path):
-        find_file = subprocess.Popen(['rpm', '-qf', path],
+        name = klass._owners([path])[path]
+        return RpmPkg(name) if name else None
+
+    @classmethod
+    def _query_owners(klass, paths):
+        owners = dict.fromkeys(paths)
+        if not owners:
+            return owners
+        # List all files of the owning packages since that's the only
+        # way to tell which package owns which of the paths
+        find_file = subprocess.Popen(['rpm', '-qf', '--queryformat',
+                                      '[%{FILENAMES}\t%{=NAME}\n]'] + list(owners),
                                      stdout=subprocess.PIPE,
                                      stderr=subprocess.PIPE)
+        # Unowned paths make rpm fail but the others are still listed
         output = find_file.communicate()[0]
-        if find_file.returncode:
-            return None
-        m = klass._pkg_re.match(output.strip())
-        if m:
-            pkg = m.group('pkg')
-        else:
-            pkg = output.strip()
-        return RpmPkg(pkg)
+        for line in output.decode('utf-8').split('\n'):
+            path, sep, name = line.partition('\t')
+            if sep and path in owners and owners[path] is None:
+                owners[path] = name
+        return owners
 
     @classmethod
     def restart_service_cmd(klass, name):
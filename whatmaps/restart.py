@@ -0,0 +1,143 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Restart services in parallel"""
+
+import concurrent.futures
+import logging
+import os
+import shlex
+import subprocess
+import time
+
+from . systemd import Systemd
+
+
+class RestartJob(object):
+    """
+    A command restarting one or more services
+
+    @ivar services: the services restarted by cmd
+    @ivar cmd: the command to run
+    @ivar returncode: exit status of cmd, C{None} if it didn't finish
+    @ivar duration: seconds cmd took
+    @ivar timed_out: whether cmd got killed due to the timeout
+    """
+
+    def __init__(self, services, cmd):
+        self.services = services
+        self.cmd = cmd
+        self.returncode = None
+        self.duration = None
+        self.timed_out = False
+
+    @property
+    def failed(self):
+        return self.returncode != 0
+
+    def __repr__(self):
+        return "<RestartJob services:%s>" % self.services
+
+
+class Restarter(object):
+    """
+    Restart services running up to jobs restart commands at once
+
+    @ivar jobs: maximum number of restart commands run in parallel
+    @ivar timeout: seconds after which a restart command gets killed,
+                   C{None} to wait forever
+    @ivar batch: restart all systemd service units with a single
+                 C{systemctl try-restart}, systemd then runs the
+                 restarts in parallel itself
+    """
+
+    def __init__(self, distro, jobs=1, timeout=None, batch=False, systemd=Systemd):
+        self.distro = distro
+        self.jobs = max(jobs, 1)
+        self.timeout = timeout
+        self.batch = batch
+        self.systemd = systemd
+
+    def restart_jobs(self, services):
+        """The commands needed to restart services"""
+        jobs = []
+        units = []
+        batch = self.batch and self.systemd.is_running()
+        for service in sorted(services):
+            if batch and service.endswith('.service'):
+                units.append(service)
+            else:
+                jobs.append(RestartJob([service], self.distro.restart_service_cmd(service)))
+        if units:
+            jobs.insert(0, RestartJob(units, ['systemctl', 'try-restart'] + units))
+        return jobs
+
+    def _run(self, job):
+        logging.info("Restarting '%s'", "', '".join(job.services))
+        start = time.monotonic()
+        try:
+            job.returncode = subprocess.call(job.cmd, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            job.timed_out = True
+        except OSError as e:
+            logging.error("Can't run %s: %s", job.cmd[0], e)
+        job.duration = time.monotonic() - start
+        return job
+
+    def restart(self, services):
+        """
+        Restart services and log the outcome per service
+
+        @returns: the restart jobs that failed
+        @rtype: C{list}
+        """
+        failed = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for job in executor.map(self._run, self.restart_jobs(services)):
+                for service in job.services:
+                    if job.timed_out:
+                        logging.error("Restarting '%s' timed out after %ds",
+                                      service, self.timeout)
+                    elif job.failed:
+                        logging.error("Restarting '%s' failed after %.1fs",
+                                      service, job.duration)
+                    else:
+                        logging.info("Restarted '%s' in %.1fs", service, job.duration)
+                if job.timed_out or job.failed:
+                    failed.append(job)
+        return failed
+
+    def write_script(self, services, path):
+        """
+        Write a shell script that runs the same restart commands as
+        L{restart} with the same parallelism and timeouts
+        """
+        with open(path, 'w') as out:
+            print('#! /bin/sh', file=out)
+            jobs = self.restart_jobs(services)
+            for i, job in enumerate(jobs):
+                for service in job.services:
+                    logging.info("Need to restart '%s'", service)
+                cmd = " ".join(shlex.quote(arg) for arg in job.cmd)
+                if self.timeout:
+                    cmd = "timeout %d %s" % (self.timeout, cmd)
+                if self.jobs == 1:
+                    print(cmd, file=out)
+                    continue
+                print("%s &" % cmd, file=out)
+                if (i + 1) % self.jobs == 0 or i + 1 == len(jobs):
+                    print("wait", file=out)
+        os.chmod(path, 0o755)
@@ -0,0 +1,166 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Read the sqlite rpm database directly instead of invoking rpm"""
+
+import os
+import sqlite3
+import struct
+
+
+class RpmHeader(object):
+    """
+    The tags of an rpm header blob we're interested in
+
+    @cvar tags: tag numbers by name
+    """
+    tags = {
+        'name': 1000,
+        'dirindexes': 1116,
+        'basenames': 1117,
+        'dirnames': 1118,
+    }
+    STRING = 6
+    STRING_ARRAY = 8
+    I18NSTRING = 9
+    INT32 = 4
+
+    _intro = struct.Struct('>II')
+    _entry = struct.Struct('>iIiI')
+
+    def __init__(self, blob):
+        wanted = {tag: name for name, tag in self.tags.items()}
+        count, size = self._intro.unpack_from(blob)
+        data_start = self._intro.size + count * self._entry.size
+        data = blob[data_start:data_start + size]
+        self.values = {}
+        for i in range(count):
+            tag, type, offset, n = self._entry.unpack_from(blob, self._intro.size + i * self._entry.size)
+            if tag in wanted:
+                self.values[wanted[tag]] = self._value(data, type, offset, n)
+
+    def _value(self, data, type, offset, n):
+        if type == self.INT32:
+            return list(struct.unpack_from('>%dI' % n, data, offset))
+        elif type in (self.STRING, self.STRING_ARRAY, self.I18NSTRING):
+            strings = []
+            for dummy in range(n):
+                end = data.index(b'\0', offset)
+                strings.append(data[offset:end].decode('utf-8', 'surrogateescape'))
+                offset = end + 1
+            return strings[0] if type == self.STRING else strings
+        return None
+
+    @property
+    def name(self):
+        return self.values.get('name')
+
+    @property
+    def files(self):
+        dirnames = self.values.get('dirnames', [])
+        return [dirnames[i] + basename for i, basename in
+                zip(self.values.get('dirindexes', []), self.values.get('basenames', []))]
+
+
+class RpmDatabase(object):
+    """
+    The sqlite rpm database below a root directory
+
+    @ivar path: the database file
+    @cvar _databases: opened databases by root directory
+    """
+    _databases = {}
+    _locations = [('usr', 'lib', 'sysimage', 'rpm', 'rpmdb.sqlite'),
+                  ('var', 'lib', 'rpm', 'rpmdb.sqlite')]
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect('file:%s?mode=ro' % path, uri=True)
+
+    @classmethod
+    def open(klass, root=None):
+        """
+        The database below root if it's a readable sqlite database
+
+        @returns: the database or C{None} if rpm needs to be used
+        @rtype: L{RpmDatabase}
+        """
+        try:
+            return klass._databases[root]
+        except KeyError:
+            pass
+        db = None
+        for location in klass._locations:
+            path = os.path.join(root or '/', *location)
+            if os.access(path, os.R_OK):
+                try:
+                    db = klass(path)
+                    db._conn.execute('SELECT 1 FROM Packages LIMIT 1')
+                    break
+                except sqlite3.Error:
+                    db = None
+        klass._databases[root] = db
+        return db
+
+    def close(self):
+        self._conn.close()
+
+    @classmethod
+    def close_all(klass):
+        """
+        Close the opened databases, e.g. since their sqlite connections
+        can't be used across fork(). They're reopened on demand.
+        """
+        for db in klass._databases.values():
+            if db is not None:
+                db.close()
+        klass._databases.clear()
+
+    def _headers(self, table, key):
+        try:
+            rows = self._conn.execute('SELECT Packages.blob, %s.idx FROM %s '
+                                      'JOIN Packages ON Packages.hnum=%s.hnum '
+                                      'WHERE %s.key=?' % ((table,) * 4), (key,)).fetchall()
+        except sqlite3.Error as e:
+            raise OSError("Can't read rpm database '%s': %s" % (self.path, e))
+        return [(RpmHeader(blob), idx) for blob, idx in rows]
+
+    def contents(self, name):
+        """
+        Files of package name
+
+        @returns: list of files or C{None} if the package isn't installed
+        @rtype: C{list}
+        """
+        headers = self._headers('Name', name)
+        if not headers:
+            return None
+        return [path for header, dummy in headers for path in header.files]
+
+    def owner(self, path):
+        """
+        Name of the package that ships path
+
+        @returns: the package name or C{None}
+        @rtype: C{str}
+        """
+        dirname, basename = os.path.split(path)
+        for header, idx in self._headers('Basenames', basename):
+            dirnames = header.values.get('dirnames', [])
+            dirindexes = header.values.get('dirindexes', [])
+            if idx < len(dirindexes) and dirnames[dirindexes[idx]] == dirname.rstrip('/') + '/':
+                return header.name
+        return None
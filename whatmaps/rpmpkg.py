@@ -18,25 +18,35 @@ import os
 import re
 
 from . pkg import Pkg
+from . rpmdb import RpmDatabase
 
 
 class RpmPkg(Pkg):
     type = 'RPM'
     _init_script_re = re.compile(r'/etc/rc.d/init.d/[\w\-\.]')
+    _root_option = ['--root', '${root}']
+    _database = RpmDatabase
     _list_contents = ['rpm', '-ql', '$pkg_name']
+    # %{=NAME} repeats the scalar NAME for each entry of the
+    # FILENAMES array, a plain %{NAME} makes rpm fail
+    _list_contents_batch = ['rpm', '-q', '--queryformat',
+                            '[%{=NAME}\t%{FILENAMES}\n]']
 
-    def __init__(self, name):
-        Pkg.__init__(self, name)
+    def __init__(self, name, root=None):
+        Pkg.__init__(self, name, root)
+
+    @classmethod
+    def _split_contents(klass, lines):
+        """
+        Each file is prefixed by the package name. Packages that aren't
+        installed are reported without a tab.
+        """
+        for line in lines:
+            name, sep, path = line.partition('\t')
+            if sep:
+                yield name, path
 
     @property
     def services(self):
-        if self._services is not None:
-            return self._services
-
-        self._services = []
-        contents = self._get_contents()
         # Only supports sysvinit so far:
-        for line in contents:
-            if self._init_script_re.match(line):
-                self._services.append(os.path.basename(line.strip()))
-        return self._services
+        return [os.path.basename(path) for path in self._get_contents().init_scripts]
@@ -0,0 +1,280 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Record and replay everything a whatmaps run reads from the system"""
+
+import gzip
+import json
+import os
+
+from . debiandistro import DebianDistro
+from . pkg import PkgError
+from . process import _boot_time
+from . redhatdistro import FedoraDistro, RedHatDistro
+from . systemd import Systemd
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class Snapshot(object):
+    """
+    A snapshot of the processes, their mappings and the package and
+    unit information a run looked at
+
+    The snapshot is stored as gzip compressed JSON. Mapped paths are
+    deduplicated into a string table referenced by index.
+
+    @cvar version: version of the snapshot format
+    @ivar procs: per pid dict with exe, stat, mnt_ns and maps where
+        maps is a list of [device, inode, path index]. Deleted
+        executables keep their ' (deleted)' suffix.
+    @ivar contents: shared objects and service files by package name
+    @ivar files: package name by file, C{None} if not owned by any
+    @ivar units: systemd unit by pid, a dict with the error message if
+        lookup failed
+    """
+    version = 1
+    distros = {klass.__name__: klass for klass in (DebianDistro,
+                                                     RedHatDistro,
+                                                     FedoraDistro)}
+
+    def __init__(self):
+        self.distro = None
+        self.systemd = False
+        self.btime = None
+        self.pkgs = []
+        self.paths = []
+        self.procs = {}
+        self.contents = {}
+        self.files = {}
+        self.units = {}
+        self._path_index = {}
+        self._recorded_pkgs = []
+
+    def _path(self, path):
+        try:
+            return self._path_index[path]
+        except KeyError:
+            self.paths.append(path)
+            index = self._path_index[path] = len(self.paths) - 1
+            return index
+
+    def add_procs(self, procs):
+        """Record the processes including all their file backed mappings"""
+        for proc in procs:
+            if self.btime is None:
+                self.btime = _boot_time(proc.procfs)
+            exe = proc.exe
+            if exe is not None and proc.deleted:
+                exe += ' (deleted)'
+            stat = proc.stat
+            self.procs[proc.pid] = {
+                'exe': exe,
+                'stat': [field.decode() for field in stat] if stat else None,
+                'mnt_ns': proc.mnt_ns,
+                'maps': sorted([dev, inode, self._path(path)]
+                               for dev, inode, path in proc.mapped_entries()),
+            }
+
+    def add_pkgs(self, pkgs):
+        """Record packages whose contents should end up in the snapshot"""
+        self._recorded_pkgs.extend(pkgs)
+
+    def _collect_contents(self):
+        for pkg in self._recorded_pkgs:
+            if pkg._contents is not None:
+                self.contents[pkg.name] = list(pkg._contents)
+
+    def save(self, path):
+        self._collect_contents()
+        data = {
+            'version': self.version,
+            'distro': self.distro,
+            'systemd': self.systemd,
+            'btime': self.btime,
+            'pkgs': self.pkgs,
+            'paths': self.paths,
+            'procs': self.procs,
+            'contents': self.contents,
+            'files': self.files,
+            'units': self.units,
+        }
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+
+    @classmethod
+    def load(klass, path):
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise SnapshotError("Can't read snapshot '%s': %s" % (path, e))
+        if data.get('version') != klass.version:
+            raise SnapshotError("Unsupported snapshot version %s" % data.get('version'))
+
+        snapshot = klass()
+        for key in ['distro', 'systemd', 'btime', 'pkgs', 'paths',
+                    'contents', 'files', 'units']:
+            setattr(snapshot, key, data[key])
+        snapshot.procs = {int(pid): proc for pid, proc in data['procs'].items()}
+        snapshot.units = {int(pid): unit for pid, unit in data['units'].items()}
+        return snapshot
+
+    def write_procfs(self, procfs):
+        """
+        Create a procfs like tree from the snapshot so processes can be
+        replayed via L{whatmaps.process.Process}'s procfs argument
+        """
+        if self.btime is not None:
+            with open(os.path.join(procfs, 'stat'), 'w') as f:
+                f.write('btime %d\n' % self.btime)
+        for pid, proc in self.procs.items():
+            piddir = os.path.join(procfs, str(pid))
+            os.makedirs(os.path.join(piddir, 'ns'))
+            if proc['exe'] is not None:
+                os.symlink(proc['exe'], os.path.join(piddir, 'exe'))
+            if proc['mnt_ns'] is not None:
+                os.symlink(proc['mnt_ns'], os.path.join(piddir, 'ns', 'mnt'))
+            if proc['stat'] is not None:
+                with open(os.path.join(piddir, 'stat'), 'w') as f:
+                    f.write('%d (replay) %s\n' % (pid, ' '.join(proc['stat'])))
+            with open(os.path.join(piddir, 'maps'), 'w') as f:
+                for dev, inode, index in proc['maps']:
+                    f.write('0-0 r--p 00000000 %s %d %s\n' % (dev, inode, self.paths[index]))
+
+
+class RecordingDistro(object):
+    """Distro wrapper recording package lookups into a snapshot"""
+
+    def __init__(self, distro, snapshot):
+        self._distro = distro
+        self._snapshot = snapshot
+        snapshot.distro = type(distro).__name__
+
+    def __getattr__(self, name):
+        return getattr(self._distro, name)
+
+    def pkg(self, name, root=None):
+        pkg = self._distro.pkg(name, root)
+        self._snapshot.add_pkgs([pkg])
+        return pkg
+
+    def pkg_by_file(self, path):
+        pkg = self._distro.pkg_by_file(path)
+        self._snapshot.files[path] = pkg.name if pkg else None
+        if pkg:
+            self._snapshot.add_pkgs([pkg])
+        return pkg
+
+    def pkgs_by_files(self, paths):
+        pkgs = self._distro.pkgs_by_files(paths)
+        for path, pkg in pkgs.items():
+            self._snapshot.files[path] = pkg.name if pkg else None
+        self._snapshot.add_pkgs(set(pkg for pkg in pkgs.values() if pkg))
+        return pkgs
+
+
+class RecordingSystemd(object):
+    """Systemd wrapper recording unit lookups into a snapshot"""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        snapshot.systemd = Systemd.is_running()
+
+    def is_running(self):
+        return self._snapshot.systemd
+
+    def process_to_unit(self, process):
+        try:
+            unit = Systemd.process_to_unit(process)
+        except ValueError as e:
+            self._snapshot.units[process.pid] = {'error': str(e)}
+            raise
+        self._snapshot.units[process.pid] = unit
+        return unit
+
+
+class ReplayDistro(object):
+    """Distro answering package lookups from a snapshot only"""
+
+    def __init__(self, snapshot):
+        try:
+            self._distro = snapshot.distros[snapshot.distro]()
+        except KeyError:
+            raise SnapshotError("Unknown distribution '%s' in snapshot" % snapshot.distro)
+        self._snapshot = snapshot
+        self._pkg_classes = {}
+
+    def __getattr__(self, name):
+        return getattr(self._distro, name)
+
+    def _pkg_class(self, klass):
+        """Package class that takes its contents from the snapshot"""
+        try:
+            return self._pkg_classes[klass]
+        except KeyError:
+            pass
+        contents = self._snapshot.contents
+
+        class ReplayPkg(klass):
+            _list_contents_batch = None
+
+            def _get_contents(self):
+                if self._contents is None:
+                    try:
+                        self._contents = self._classify(contents[self.name])
+                    except KeyError:
+                        raise PkgError("Failed to list package contents for '%s'" % self.name)
+                return self._contents
+
+        self._pkg_classes[klass] = ReplayPkg
+        return ReplayPkg
+
+    def pkg(self, name, root=None):
+        klass = type(self._distro.pkg(name, root))
+        return self._pkg_class(klass)(name, root)
+
+    def pkg_by_file(self, path):
+        name = self._snapshot.files.get(path)
+        return self.pkg(name) if name else None
+
+    def pkgs_by_files(self, paths):
+        pkgs = {}
+        result = {}
+        for path in paths:
+            name = self._snapshot.files.get(path)
+            if name and name not in pkgs:
+                pkgs[name] = self.pkg(name)
+            result[path] = pkgs.get(name)
+        return result
+
+
+class ReplaySystemd(object):
+    """Systemd answering unit lookups from a snapshot only"""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def is_running(self):
+        return self._snapshot.systemd
+
+    def process_to_unit(self, process):
+        unit = self._snapshot.units.get(process.pid)
+        if isinstance(unit, dict):
+            raise ValueError(unit['error'])
+        return unit
@@ -19,8 +19,17 @@ import os
 import subprocess
 
 
+def _read_pids(cgroup):
+    try:
+        with open(os.path.join(cgroup, 'cgroup.procs')) as f:
+            return [int(pid) for pid in f.read().split()]
+    except (OSError, ValueError):
+        return []
+
+
 class Systemd(object):
     """Systemd init system"""
+    cgroupfs = '/sys/fs/cgroup'
 
     def __init__(self):
         if not self.is_running():
@@ -30,8 +39,109 @@ class Systemd(object):
     def is_running():
         return os.path.exists("/run/systemd/system")
 
+    @staticmethod
+    def cgroup_to_unit(path):
+        """
+        The unit owning a cgroup path. Like systemd itself the first
+        component that isn't a slice names the unit.
+
+        @returns: the service name or C{None} if the path isn't below
+                  a unit
+        @raises ValueError: if the cgroup belongs to a scope or to a user's
+                  service manager
+        """
+        parts = [part for part in path.split('/') if part]
+        while parts and parts[0].endswith('.slice'):
+            parts.pop(0)
+        if not parts:
+            return None
+        unit = parts[0]
+        if unit.startswith('session-') and unit.endswith('.scope'):
+            raise ValueError("Process is in user session %s" % unit)
+        elif unit.startswith('user@') and unit.endswith('.service'):
+            raise ValueError("Process belongs to user manager %s" % unit)
+        elif unit.endswith('.service'):
+            return unit
+        raise ValueError("Can't parse service name from %s" % unit)
+
+    @staticmethod
+    def _hierarchy(cgroupfs=None):
+        """The cgroup hierarchy systemd tracks its units in"""
+        cgroupfs = cgroupfs or Systemd.cgroupfs
+        for hierarchy in [cgroupfs,
+                          os.path.join(cgroupfs, 'unified'),
+                          os.path.join(cgroupfs, 'systemd')]:
+            if os.path.exists(os.path.join(hierarchy, 'cgroup.procs')):
+                return hierarchy
+        return None
+
+    @staticmethod
+    def units_pids(units, cgroupfs=None):
+        """
+        The processes of the given units. Only the slices are walked
+        to find the units' cgroups.
+
+        @returns: pids by unit or C{None} if there's no hierarchy. Units
+                  without processes are left out.
+        @rtype: C{dict}
+        """
+        hierarchy = Systemd._hierarchy(cgroupfs)
+        if hierarchy is None:
+            return None
+
+        wanted = set(units)
+        found = {}
+        for dirpath, dirnames, dummy in os.walk(hierarchy):
+            for name in [name for name in dirnames if name in wanted]:
+                for unitpath, dummy, dummy in os.walk(os.path.join(dirpath, name)):
+                    found.setdefault(name, []).extend(_read_pids(unitpath))
+            dirnames[:] = [name for name in dirnames if name.endswith('.slice')]
+        return {unit: pids for unit, pids in found.items() if pids}
+
+    @staticmethod
+    def unit_pids(cgroupfs=None):
+        """
+        The processes of all service units read from systemd's cgroup
+        hierarchy. The unified hierarchy is preferred over the legacy
+        name=systemd one on hybrid setups.
+
+        @returns: pids by service unit and the pids outside of any
+                  service unit or C{None} if there's no hierarchy
+        @rtype: C{tuple}
+        """
+        hierarchy = Systemd._hierarchy(cgroupfs)
+        if hierarchy is None:
+            return None
+
+        units = {}
+        others = []
+        for dirpath, dummy, dummy in os.walk(hierarchy):
+            pids = _read_pids(dirpath)
+            if not pids:
+                continue
+            try:
+                unit = Systemd.cgroup_to_unit(dirpath[len(hierarchy):] or '/')
+            except ValueError:
+                unit = None
+            if unit:
+                units.setdefault(unit, []).extend(pids)
+            else:
+                others.extend(pids)
+        return units, others
+
     @staticmethod
     def process_to_unit(process):
+        """
+        The service unit of process. Looked up via the process' cgroup,
+        systemctl is only asked if that's unavailable.
+        """
+        cgroup = process.cgroup
+        if cgroup is not None:
+            return Systemd.cgroup_to_unit(cgroup)
+        return Systemd._systemctl_unit(process)
+
+    @staticmethod
+    def _systemctl_unit(process):
         cmd = ['systemctl', 'status', "%d" % process.pid]
         systemctl_status = subprocess.Popen(cmd, stdout=subprocess.PIPE)
         output = systemctl_status.communicate()[0]
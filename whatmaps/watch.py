@@ -0,0 +1,137 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Watch shared objects for replacement via inotify"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+
+
+class Inotify(object):
+    """Minimal inotify(7) wrapper"""
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ONLYDIR = 0x01000000
+
+    _event = struct.Struct('=iIII')
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self._watches = {}
+
+    def fileno(self):
+        return self.fd
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e), path)
+        self._watches[wd] = path
+
+    def read_events(self):
+        """
+        Read pending events
+
+        @returns: the paths of the files the events refer to or C{None}
+            if events got lost
+        @rtype: C{list}
+        """
+        data = os.read(self.fd, 65536)
+        paths = []
+        overflow = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, dummy, length = self._event.unpack_from(data, offset)
+            start = offset + self._event.size
+            name = data[start:start + length].rstrip(b'\0')
+            offset = start + length
+            if mask & self.IN_Q_OVERFLOW:
+                overflow = True
+            elif wd in self._watches and name:
+                paths.append(os.path.join(self._watches[wd], os.fsdecode(name)))
+        return None if overflow else paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher(object):
+    """
+    Watch the directories of a set of files and report replaced files
+    in batches
+
+    @ivar delay: seconds without events before a batch is reported
+    @ivar max_delay: maximum seconds a batch is delayed by ongoing events
+    """
+    mask = Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO | Inotify.IN_CREATE | Inotify.IN_ONLYDIR
+
+    def __init__(self, paths, delay=2.0, max_delay=30.0, inotify=None):
+        self.paths = set(paths)
+        self.delay = delay
+        self.max_delay = max_delay
+        self.inotify = inotify or Inotify()
+        for directory in sorted(set(os.path.dirname(path) for path in self.paths)):
+            try:
+                self.inotify.add_watch(directory, self.mask)
+            except OSError as e:
+                logging.warning("Can't watch %s: %s", directory, e)
+
+    def _wait(self, timeout):
+        readable = select.select([self.inotify], [], [], timeout)[0]
+        return bool(readable)
+
+    def next_batch(self):
+        """
+        Wait for replaced files. Once a watched file changes further
+        events are collected until there were none for delay seconds.
+
+        @returns: the changed paths out of the watched ones
+        @rtype: C{set}
+        """
+        changed = set()
+        while not changed:
+            self._wait(None)
+            start = time.monotonic()
+            while True:
+                events = self.inotify.read_events()
+                if events is None:
+                    logging.warning("Lost inotify events, assuming all files changed")
+                    changed = set(self.paths)
+                else:
+                    changed.update(path for path in events if path in self.paths)
+                remaining = self.max_delay - (time.monotonic() - start)
+                if remaining <= 0 or not self._wait(min(self.delay, remaining)):
+                    break
+        return changed
+
+    def watch(self, callback):
+        """Call callback with each batch of replaced files"""
+        logging.info("Watching %d files", len(self.paths))
+        while True:
+            callback(self.next_batch())